@@ -0,0 +1,122 @@
+"""
+応募ごとのローリング要約
+新しいメッセージが届くたびに、これまでの要約へ1件ずつ反映する（1メッセージ = 小さなLLM呼び出し1回）。
+要約は応募の history_summary に保存し、summary_version（更新回数）と
+summary_watermark（最後に反映したメッセージのID）で、どこまで反映したかを管理する。
+日時ではなく届いた順の位置で比べるため、同じ日時や過去の日時で届いたメッセージも取りこぼさない。
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from app.core.llm_metrics import LatencyWindow
+from app.core.llm_scheduler import BACKGROUND
+
+
+class ConversationSummarizer:
+    """未反映のメッセージを古い順に要約へ畳み込む
+
+    応募オブジェクトは history_summary / summary_version / summary_watermark 属性を持つこと。
+    messagesには応募のメッセージを届いた順（追加した順）に渡す。
+    同じ応募の更新は直列に行い、要約の生成に失敗したメッセージで止める（次回そこから再開する）。
+    """
+
+    def __init__(self, llm, history_builder=None, max_chars: int = 600, max_message_chars: int = 3000):
+        self.llm = llm
+        # 指定した場合、定型文の行を除いてからLLMに渡す
+        self.history_builder = history_builder
+        self.max_chars = max_chars
+        self.max_message_chars = max_message_chars
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._tasks: Dict[str, "asyncio.Task"] = {}
+        self._queued: Dict[str, List[Any]] = {}
+        self._latency = LatencyWindow()
+        self._stats = {"updates": 0, "messages": 0, "failures": 0, "scheduled": 0}
+
+    @staticmethod
+    def pending(application: Any, messages: Sequence[Any]) -> List[Any]:
+        """要約に未反映のメッセージ（届いた順で、最後に反映したメッセージより後のもの）"""
+        watermark = application.summary_watermark
+        ids = [m.id for m in messages]
+        if watermark is None or watermark not in ids:
+            return list(messages)
+        return list(messages[ids.index(watermark) + 1:])
+
+    def _render(self, message: Any) -> str:
+        content = message.content
+        if self.history_builder is not None:
+            content, _ = self.history_builder.strip_boilerplate(content)
+        direction = "送信" if message.is_outbound else "受信"
+        return f"{message.timestamp} {direction} {message.sender} → {message.receiver}\n件名: {message.subject}\n{content[:self.max_message_chars]}"
+
+    async def refresh(
+        self,
+        application: Any,
+        messages: Sequence[Any],
+        priority: str = BACKGROUND,
+        owner: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """未反映のメッセージをすべて要約に反映し、反映した件数と現在の版を返す"""
+        lock = self._locks.setdefault(application.id, asyncio.Lock())
+        async with lock:
+            folded = 0
+            error = None
+            for message in self.pending(application, messages):
+                started_at = time.perf_counter()
+                result = await self.llm.aupdate_conversation_summary(
+                    application.history_summary, self._render(message), max_chars=self.max_chars,
+                    priority=priority, owner=owner
+                )
+                self._stats["messages"] += 1
+                if "error" in result:
+                    self._stats["failures"] += 1
+                    error = result["error"]
+                    print(f"要約更新エラー ({application.id}, {message.id}): {error}")
+                    break
+                self._latency.add(time.perf_counter() - started_at)
+                application.history_summary = result["summary"]
+                application.summary_version += 1
+                application.summary_watermark = message.id
+                folded += 1
+            if folded:
+                self._stats["updates"] += 1
+            report = {
+                "application_id": application.id,
+                "folded": folded,
+                "version": application.summary_version,
+                "watermark": application.summary_watermark,
+                "pending": len(self.pending(application, messages)),
+            }
+            if error is not None:
+                report["error"] = error
+            return report
+
+    def schedule_refresh(self, application: Any, messages: Sequence[Any], owner: Optional[str] = None) -> bool:
+        """未反映のメッセージがあればバックグラウンドで反映を始める
+
+        実行中の場合は、終わってから渡されたメッセージで続けて反映する（実行中に届いたメッセージも取りこぼさない）。
+        """
+        if not self.pending(application, messages):
+            return False
+        self._stats["scheduled"] += 1
+        self._queued[application.id] = list(messages)
+        task = self._tasks.get(application.id)
+        if task is None or task.done():
+            self._tasks[application.id] = asyncio.get_running_loop().create_task(self._drain(application, owner))
+        return True
+
+    async def _drain(self, application: Any, owner: Optional[str]) -> None:
+        while application.id in self._queued:
+            messages = self._queued.pop(application.id)
+            report = await self.refresh(application, messages, owner=owner)
+            if "error" in report:
+                break
+
+    def stats(self) -> Dict[str, Any]:
+        """反映したメッセージ数・失敗数と、1件あたりの所要時間（秒）"""
+        return dict(
+            self._stats,
+            running=sum(1 for task in self._tasks.values() if not task.done()),
+            latency=self._latency.summary(),
+        )
@@ -0,0 +1,197 @@
+"""
+メール下書きの事前生成
+期限の近いネクストアクション・タスクについて、LLMの処理枠が空いている間に下書きを生成しておく。
+応募のステータス・スコア・履歴が変わった下書きは破棄し、画面を開いたときは事前生成済みの下書きを即座に返す。
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.core.draft_store import is_reusable
+
+PRIORITY_RANK = {"high": 0, "medium": 1, "low": 2}
+
+
+def application_state(application: Any, messages: Sequence[Any]) -> str:
+    """下書きの前提となる状態（ステータス・スコア・履歴）のフィンガープリント"""
+    material = json.dumps(
+        [
+            application.status,
+            application.enthusiasm_score,
+            application.concern_score,
+            [m.id for m in messages],
+        ],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+@dataclass(order=True)
+class PrefetchJob:
+    """事前生成の対象（期限の早い順・優先度の高い順に処理する）"""
+    due: str  # YYYY-MM-DD
+    rank: int
+    application_id: str = field(compare=False)
+    priority: str = field(default="medium", compare=False)
+
+    @classmethod
+    def create(cls, application_id: str, due: str, priority: str) -> "PrefetchJob":
+        return cls(due=due[:10], rank=PRIORITY_RANK.get(priority, 1), application_id=application_id, priority=priority)
+
+
+@dataclass
+class PrefetchedDraft:
+    """事前生成した下書き"""
+    application_id: str
+    template_name: Optional[str]
+    state: str
+    result: Dict[str, Any]
+    generated_at: float
+    served: int = 0
+
+
+class DraftPrefetcher:
+    """処理枠が空いているときに、期限の近い応募の下書きを生成して保持する
+
+    jobs() は対象の一覧、state(application_id) は現在の状態のフィンガープリント、
+    generate(job) は (テンプレート名, 生成結果) を返す。is_idle() がFalseの間は生成しない。
+    """
+
+    def __init__(
+        self,
+        jobs: Callable[[], List[PrefetchJob]],
+        state: Callable[[str], str],
+        generate: Callable[[PrefetchJob], Awaitable[Tuple[Optional[str], Dict[str, Any]]]],
+        is_idle: Callable[[], bool] = lambda: True,
+        interval: float = 60.0,
+        horizon_days: int = 2,
+        max_per_cycle: int = 4,
+    ):
+        self.jobs = jobs
+        self.state = state
+        self.generate = generate
+        self.is_idle = is_idle
+        self.interval = interval
+        # 期限がこの日数以内のものだけを生成する
+        self.horizon_days = horizon_days
+        self.max_per_cycle = max_per_cycle
+        self._drafts: Dict[str, PrefetchedDraft] = {}
+        self._task: Optional["asyncio.Task"] = None
+        self._stats = {
+            "cycles": 0, "skipped_busy": 0, "generated": 0, "failed": 0, "rejected": 0,
+            "hits": 0, "misses": 0, "stale": 0, "wasted": 0,
+        }
+
+    def _discard(self, application_id: str) -> None:
+        """下書きを破棄する（一度も使われなかったものは無駄な生成として数える）"""
+        draft = self._drafts.pop(application_id, None)
+        if draft is not None and draft.served == 0:
+            self._stats["wasted"] += 1
+
+    def invalidate(self, application_id: str) -> None:
+        """状態が変わった応募の下書きを破棄する"""
+        self._discard(application_id)
+
+    def due_jobs(self) -> List[PrefetchJob]:
+        """期限内の対象を期限・優先度の順に並べる"""
+        horizon = (date.today() + timedelta(days=self.horizon_days)).isoformat()
+        return sorted(job for job in self.jobs() if job.due <= horizon)
+
+    async def run_once(self) -> int:
+        """1巡分の事前生成を行い、生成した件数を返す"""
+        self._stats["cycles"] += 1
+        generated = 0
+        for job in self.due_jobs():
+            state = self.state(job.application_id)
+            draft = self._drafts.get(job.application_id)
+            if draft is not None:
+                if draft.state == state:
+                    continue
+                self._discard(job.application_id)
+            if generated >= self.max_per_cycle:
+                break
+            if not self.is_idle():
+                self._stats["skipped_busy"] += 1
+                break
+            try:
+                template_name, result = await self.generate(job)
+            except Exception as e:
+                self._stats["failed"] += 1
+                print(f"下書きの事前生成エラー ({job.application_id}): {e}")
+                continue
+            generated += 1
+            self._stats["generated"] += 1
+            if not is_reusable(result.get("metadata", {})):
+                # 解析に失敗した・打ち切られた下書きは保持しない
+                self._stats["rejected"] += 1
+                continue
+            if self.state(job.application_id) != state:
+                # 生成中に状態が変わった場合は使えない
+                self._stats["wasted"] += 1
+                continue
+            self._drafts[job.application_id] = PrefetchedDraft(
+                job.application_id, template_name, state, result, time.time()
+            )
+        return generated
+
+    def take(
+        self,
+        application_id: str,
+        template_name: Optional[str],
+        prompt_fingerprint: Optional[str] = None,
+    ) -> Optional[PrefetchedDraft]:
+        """現在の状態・テンプレートに合う下書きがあれば返す（ヒット率を集計する）
+
+        prompt_fingerprintを渡した場合は、生成時のプロンプトが異なる下書き（テンプレートの編集前など）も破棄する。
+        """
+        draft = self._drafts.get(application_id)
+        if draft is not None and (
+            draft.state != self.state(application_id)
+            or prompt_fingerprint is not None
+            and draft.template_name == template_name
+            and draft.result.get("metadata", {}).get("prompt_fingerprint") != prompt_fingerprint
+        ):
+            self._stats["stale"] += 1
+            self._discard(application_id)
+            draft = None
+        if draft is None or draft.template_name != template_name:
+            self._stats["misses"] += 1
+            return None
+        self._stats["hits"] += 1
+        draft.served += 1
+        return draft
+
+    def start(self) -> None:
+        """定期的な事前生成を開始"""
+        if self._task is not None and not self._task.done():
+            return
+
+        async def loop():
+            while True:
+                try:
+                    await self.run_once()
+                except Exception as e:
+                    print(f"下書きの事前生成エラー: {e}")
+                await asyncio.sleep(self.interval)
+
+        self._task = asyncio.get_running_loop().create_task(loop())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        """事前生成のヒット率と、使われずに破棄された生成の件数"""
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return dict(
+            self._stats,
+            drafts=len(self._drafts),
+            hit_rate=round(self._stats["hits"] / lookups, 3) if lookups else None,
+            waste_rate=round(self._stats["wasted"] / self._stats["generated"], 3) if self._stats["generated"] else None,
+        )
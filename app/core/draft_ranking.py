@@ -0,0 +1,134 @@
+"""
+メール下書き候補の採点
+複数の候補をLLMを使わずに採点し、最も良いものを選ぶ。
+採点項目は、残った差し込み記号（●●・○○）、候補者名・企業名・職種の有無、
+本文の長さ（参考テンプレートの長さに対する比率）、参考テンプレートとの構成の近さ。
+"""
+
+import re
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Optional, Sequence
+
+PLACEHOLDER_PATTERN = re.compile(r"[●○]{2,}|＜[^＞\n]{1,20}＞|<[^>\n]{1,20}>")
+FREEFORM_LENGTH = (200, 800)  # 参考テンプレートがない場合の本文の文字数の目安
+TEMPLATE_LENGTH_RATIO = (0.6, 1.6)  # 参考テンプレートの文字数に対する比率の目安
+
+# 採点の重み（合計1.0）
+WEIGHTS = {"entities": 0.35, "length": 0.2, "structure": 0.25, "format": 0.2}
+PLACEHOLDER_PENALTY = 0.15  # 残った差し込み記号1件あたりの減点
+PARSE_FAILURE_PENALTY = 0.5  # 件名・本文を取り出せなかった（定型の代替文になった）場合の減点
+
+
+def _line_shape(line: str) -> str:
+    """行の種類（見出し・箇条書き・区切り線・挨拶などの構成要素）"""
+    line = line.strip()
+    if not line:
+        return "blank"
+    if line.startswith(("【", "■", "□", "◆", "◇", "▼", "●", "○")):
+        return "heading"
+    if line.startswith(("・", "-", "*", "※", "＊")) or re.match(r"^(\d+|[①-⑳])[.．)）、]?", line):
+        return "item"
+    if re.fullmatch(r"[-=─━_＿]{4,}.*", line):
+        return "rule"
+    if line.endswith(("様", "さん", "各位", "御中")):
+        return "addressee"
+    if line.startswith(("お疲れ様", "お世話", "いつも")):
+        return "greeting"
+    if line.startswith(("よろしく", "引き続き", "何卒")):
+        return "closing"
+    return "text"
+
+
+def _shapes(text: str) -> List[str]:
+    shapes = [_line_shape(line) for line in text.splitlines()]
+    # 連続する空行・本文行は1つにまとめる（段落の数と並びで比べる）
+    return [shape for i, shape in enumerate(shapes) if i == 0 or shape != shapes[i - 1] or shape not in ("blank", "text")]
+
+
+@dataclass
+class DraftScore:
+    """1候補の採点結果（scoreは0-1）"""
+    score: float
+    checks: Dict[str, float] = field(default_factory=dict)
+    placeholders: List[str] = field(default_factory=list)
+    missing: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "score": self.score,
+            "checks": self.checks,
+            "placeholders": self.placeholders,
+            "missing": self.missing,
+        }
+
+
+class DraftRanker:
+    """候補をローカルの検査だけで採点して並べ替える"""
+
+    def __init__(self, weights: Optional[Dict[str, float]] = None):
+        self.weights = dict(weights or WEIGHTS)
+        self._stats = {"rankings": 0, "candidates": 0, "rejected_placeholders": 0}
+
+    def score(self, draft: Dict[str, Any], context: Any) -> DraftScore:
+        """候補（subject / body / metadata）を採点する。contextはEmailGenerationContext"""
+        subject = draft.get("subject") or ""
+        body = draft.get("body") or ""
+        text = subject + "\n" + body
+        metadata = draft.get("metadata", {})
+
+        entities = {"候補者名": context.candidate_name, "企業名": context.company, "職種": context.job_title}
+        missing = [label for label, value in entities.items() if value and value not in text]
+        present = [label for label, value in entities.items() if value]
+        entity_score = 1 - len(missing) / len(present) if present else 1.0
+
+        length_score = self._length_score(len(body), context.reference_template)
+        structure_score = (
+            SequenceMatcher(None, _shapes(context.reference_template), _shapes(body), autojunk=False).ratio()
+            if context.reference_template else 1.0
+        )
+        format_score = 0.0 if metadata.get("error") else 1.0 if subject.strip() and body.strip() else 0.5
+
+        checks = {
+            "entities": round(entity_score, 3),
+            "length": round(length_score, 3),
+            "structure": round(structure_score, 3),
+            "format": format_score,
+        }
+        score = sum(self.weights.get(key, 0.0) * value for key, value in checks.items())
+
+        placeholders = PLACEHOLDER_PATTERN.findall(text)
+        score -= PLACEHOLDER_PENALTY * len(placeholders)
+        if metadata.get("parse_failed"):
+            score -= PARSE_FAILURE_PENALTY
+        return DraftScore(round(max(score, 0.0), 4), checks, placeholders, missing)
+
+    def _length_score(self, length: int, reference_template: Optional[str]) -> float:
+        """目安の範囲内なら1、外れるほど0に近づく"""
+        if reference_template:
+            low, high = (len(reference_template) * ratio for ratio in TEMPLATE_LENGTH_RATIO)
+        else:
+            low, high = FREEFORM_LENGTH
+        if length <= 0:
+            return 0.0
+        if length < low:
+            return length / low
+        if length > high:
+            return max(0.0, 1 - (length - high) / high)
+        return 1.0
+
+    def rank(self, drafts: Sequence[Dict[str, Any]], context: Any) -> List[Dict[str, Any]]:
+        """候補を採点の高い順に並べ、各候補の metadata["ranking"] に採点結果を付ける"""
+        scored = []
+        for index, draft in enumerate(drafts):
+            result = self.score(draft, context)
+            draft.setdefault("metadata", {})["ranking"] = dict(result.to_dict(), candidate=index)
+            scored.append((result.score, -index, draft))
+            self._stats["rejected_placeholders"] += bool(result.placeholders)
+        self._stats["rankings"] += 1
+        self._stats["candidates"] += len(drafts)
+        return [draft for _, _, draft in sorted(scored, key=lambda item: item[:2], reverse=True)]
+
+    def stats(self) -> Dict[str, Any]:
+        """採点した回数・候補数と、差し込み記号が残っていた候補の件数"""
+        return dict(self._stats, weights=self.weights)
@@ -0,0 +1,141 @@
+"""
+生成済みメール下書きの保存
+生成した件名・本文を、プロンプトのフィンガープリント・参考テンプレート・モデル・レイテンシ・トークン数とともに
+応募ごとの版として保存する。テーブルは app.models.draft.GeneratedDraft（email_drafts）から作る。
+"""
+
+import threading
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from app.models.draft import GeneratedDraft
+
+
+def is_reusable(metadata: Dict[str, Any]) -> bool:
+    """保存して再利用してよい生成結果か（生成エラー・解析失敗・num_predictでの打ち切りは除く）
+
+    LLMのキャッシュに入れない応答と同じ条件で、開き直すたびに同じ不完全な下書きを返さないようにする。
+    """
+    if metadata.get("error") or metadata.get("parse_failed"):
+        return False
+    return (metadata.get("metrics") or {}).get("done_reason") != "length"
+
+
+class DraftStore:
+    """応募ごとに版を重ねて下書きを保存し、現在の状態で有効な最新版を返す"""
+
+    def __init__(self, db_path: str = "ca_support.db"):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._stats = {"saved": 0, "hits": 0, "misses": 0}
+        self._engine = None
+        self._closed = False
+
+    def _get_engine(self):
+        """SQLiteのエンジン（最初に使うときに作り、GeneratedDraft のテーブルがなければ作成する）"""
+        if self._closed:
+            raise RuntimeError("DraftStore is closed")
+        if self._engine is None:
+            self._engine = create_engine(f"sqlite:///{self.db_path}", connect_args={"check_same_thread": False})
+            SQLModel.metadata.create_all(self._engine, tables=[GeneratedDraft.__table__])
+        return self._engine
+
+    @staticmethod
+    def _row(draft: GeneratedDraft) -> Dict[str, Any]:
+        row = draft.model_dump()
+        row["created_at"] = draft.created_at.isoformat(sep=" ")
+        row["updated_at"] = draft.updated_at.isoformat(sep=" ")
+        return row
+
+    def save(
+        self,
+        application_id: str,
+        template_name: Optional[str],
+        subject: str,
+        body: str,
+        state: str,
+        metadata: Dict[str, Any],
+        source: str = "generate",
+        prompt_fingerprint: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """下書きを新しい版として保存する（metadataは生成時のメタデータ）
+
+        prompt_fingerprintは latest で照合するキー（省略時はメタデータのフィンガープリント）。
+        """
+        with self._lock, Session(self._get_engine()) as session:
+            version = session.exec(
+                select(func.coalesce(func.max(GeneratedDraft.version), 0))
+                .where(GeneratedDraft.application_id == application_id)
+            ).one() + 1
+            draft = GeneratedDraft(
+                application_id=application_id,
+                version=version,
+                template_name=template_name,
+                subject=subject,
+                body=body,
+                prompt_fingerprint=prompt_fingerprint or metadata.get("prompt_fingerprint"),
+                state_fingerprint=state,
+                model=metadata.get("model"),
+                profile=metadata.get("profile"),
+                source=source,
+                latency=metadata.get("latency"),
+                prompt_tokens=metadata.get("prompt_tokens"),
+                completion_tokens=metadata.get("completion_tokens"),
+            )
+            session.add(draft)
+            session.commit()
+            session.refresh(draft)
+            self._stats["saved"] += 1
+            return self._row(draft)
+
+    def latest(
+        self,
+        application_id: str,
+        template_name: Optional[str],
+        state: str,
+        prompt_fingerprint: Optional[str] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """同じテンプレート・同じ応募状態で生成した最新版（状態が変わっていれば None）
+
+        prompt_fingerprintを渡した場合は、同じプロンプト（参考テンプレートの本文・履歴・プロファイル）で
+        生成したものに限る（テンプレートの編集後や、別のプロファイルで生成した下書きは返さない）。
+        """
+        query = select(GeneratedDraft).where(
+            GeneratedDraft.application_id == application_id,
+            GeneratedDraft.template_name == template_name,  # None の場合は IS NULL になる
+            GeneratedDraft.state_fingerprint == state,
+        )
+        if prompt_fingerprint is not None:
+            query = query.where(GeneratedDraft.prompt_fingerprint == prompt_fingerprint)
+        with self._lock, Session(self._get_engine()) as session:
+            draft = session.exec(query.order_by(GeneratedDraft.version.desc()).limit(1)).first()
+            self._stats["hits" if draft is not None else "misses"] += 1
+            return self._row(draft) if draft is not None else None
+
+    def versions(self, application_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """応募の下書きを新しい版から順に返す"""
+        query = (
+            select(GeneratedDraft)
+            .where(GeneratedDraft.application_id == application_id)
+            .order_by(GeneratedDraft.version.desc())
+            .limit(limit)
+        )
+        with self._lock, Session(self._get_engine()) as session:
+            return [self._row(draft) for draft in session.exec(query).all()]
+
+    def stats(self) -> Dict[str, Any]:
+        """保存件数と、生成せずに保存済みの下書きを返せた割合"""
+        with self._lock, Session(self._get_engine()) as session:
+            stats = dict(self._stats)
+            stats["drafts"] = session.exec(select(func.count()).select_from(GeneratedDraft)).one()
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else None
+        return stats
+
+    def close(self) -> None:
+        self._closed = True
+        if self._engine is not None:
+            self._engine.dispose()
+            self._engine = None
@@ -0,0 +1,256 @@
+"""
+やり取り履歴のプロンプト組み立て
+履歴の各メッセージをステータス・テンプレートとの関連度（文字bigramのBM25）で採点し、
+定型文（挨拶・署名など複数のメールで繰り返される行）を除いたうえで、
+トークン予算に収まるまで関連度の高い順に詰める
+"""
+
+import math
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from app.core.llm_sizing import estimate_tokens
+
+HISTORY_HEADER = "\n\n## 過去のやり取り履歴\n"
+SUMMARY_HEADER = "\n\n## これまでのやり取りの要約\n"
+LEGACY_MESSAGE_COUNT = 3  # 従来の組み立て（最新3件をそのまま貼る）の件数
+
+
+def _ngrams(text: str, n: int = 2) -> List[str]:
+    """空白を除いた文字n-gram（日本語は分かち書きせずbigramで比較する）"""
+    chars = "".join(text.split())
+    if len(chars) < n:
+        return [chars] if chars else []
+    return [chars[i:i + n] for i in range(len(chars) - n + 1)]
+
+
+def _lines(text: str) -> List[str]:
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def render_message(message: Any, content: Optional[str] = None) -> str:
+    """1件分の履歴（従来のbuild_email_contextと同じ書式）"""
+    direction = "送信" if message.is_outbound else "受信"
+    return f"""
+### {message.timestamp} - {direction}
+**{message.sender} → {message.receiver}**
+件名: {message.subject}
+内容: {message.content if content is None else content}
+"""
+
+
+def legacy_history_context(messages: Sequence[Any]) -> str:
+    """従来の組み立て（時系列の最新3件をそのまま貼る）"""
+    if not messages:
+        return ""
+    return HISTORY_HEADER + "".join(render_message(m) for m in messages[-LEGACY_MESSAGE_COUNT:])
+
+
+@dataclass
+class HistorySelection:
+    """組み立てた履歴と、従来方式と比べたトークン数"""
+    text: str
+    selected: List[str] = field(default_factory=list)  # 採用したメッセージID（時系列順）
+    truncated: List[str] = field(default_factory=list)  # 予算に合わせて途中で切ったメッセージID
+    stripped_lines: int = 0  # 採用したメッセージから除いた定型文の行数
+    tokens: int = 0
+    legacy_tokens: int = 0
+    summary_version: Optional[int] = None  # ローリング要約を使った場合はその版
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.legacy_tokens - self.tokens
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "selected": self.selected,
+            "truncated": self.truncated,
+            "stripped_lines": self.stripped_lines,
+            "tokens": self.tokens,
+            "legacy_tokens": self.legacy_tokens,
+            "saved_tokens": self.saved_tokens,
+            "summary_version": self.summary_version,
+        }
+
+
+class HistoryContextBuilder:
+    """トークン予算内で関連度の高い履歴を選ぶ
+
+    fit()に全履歴を渡しておくと、BM25の文書頻度と定型文（min_df件以上のメッセージに現れる行）を求める。
+    """
+
+    def __init__(
+        self,
+        budget_tokens: int = 1000,
+        ngram: int = 2,
+        k1: float = 1.5,
+        b: float = 0.75,
+        recency_weight: float = 0.3,
+        boilerplate_min_df: int = 3,
+        min_chunk_tokens: int = 60,
+    ):
+        self.budget_tokens = budget_tokens
+        self.ngram = ngram
+        self.k1 = k1
+        self.b = b
+        # 関連度（0-1に正規化）と新しさ（0-1）の重み付け
+        self.recency_weight = recency_weight
+        self.boilerplate_min_df = boilerplate_min_df
+        # 残り予算がこれ未満なら、メッセージを途中で切ってまで詰めない
+        self.min_chunk_tokens = min_chunk_tokens
+        self._document_frequency: Counter = Counter()
+        self._documents = 0
+        self._average_length = 0.0
+        self._boilerplate: Set[str] = set()
+        self._lock = threading.Lock()
+        self._stats = {"builds": 0, "tokens": 0, "legacy_tokens": 0, "saved_tokens": 0, "stripped_lines": 0}
+
+    def fit(self, corpus: Iterable[Any]) -> "HistoryContextBuilder":
+        """全履歴から文書頻度と定型文の行を求める"""
+        document_frequency = Counter()
+        line_frequency = Counter()
+        lengths = []
+        for message in corpus:
+            grams = _ngrams(message.content, self.ngram)
+            lengths.append(len(grams))
+            document_frequency.update(set(grams))
+            line_frequency.update(set(_lines(message.content)))
+        self._document_frequency = document_frequency
+        self._documents = len(lengths)
+        self._average_length = sum(lengths) / len(lengths) if lengths else 0.0
+        self._boilerplate = {line for line, df in line_frequency.items() if df >= self.boilerplate_min_df}
+        return self
+
+    def strip_boilerplate(self, content: str, extra: Iterable[str] = ()) -> Tuple[str, int]:
+        """定型文の行（と参考テンプレートに含まれる行）を除く。戻り値は (本文, 除いた行数)"""
+        boilerplate = self._boilerplate | set(extra)
+        kept, stripped = [], 0
+        for line in content.splitlines():
+            if line.strip() and line.strip() in boilerplate:
+                stripped += 1
+                continue
+            if not line.strip() and kept and not kept[-1].strip():
+                continue
+            kept.append(line)
+        return "\n".join(kept).strip(), stripped
+
+    def _bm25(self, query: Counter, content: str) -> float:
+        grams = Counter(_ngrams(content, self.ngram))
+        length = sum(grams.values())
+        documents = max(self._documents, 1)
+        average_length = self._average_length or length or 1
+        score = 0.0
+        for gram in query:
+            tf = grams.get(gram)
+            if not tf:
+                continue
+            df = self._document_frequency.get(gram, 0)
+            idf = math.log(1 + (documents - df + 0.5) / (df + 0.5))
+            score += idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / average_length))
+        return score
+
+    def build(
+        self,
+        messages: Sequence[Any],
+        query: str,
+        template: Optional[str] = None,
+        budget_tokens: Optional[int] = None,
+        summary: Optional[str] = None,
+        pending_ids: Optional[Iterable[str]] = None,
+    ) -> HistorySelection:
+        """履歴を選んで組み立てる（messagesは時系列順、queryはステータス・要約など）
+
+        templateには参考テンプレートを渡す。採点の質問文に加え、同じ行を履歴から除くのに使う。
+        summary（ローリング要約）を渡した場合は先頭に置き、残りの予算で pending_ids（要約に未反映のメッセージID）のメッセージだけを詰める。
+        """
+        budget = self.budget_tokens if budget_tokens is None else budget_tokens
+        legacy_tokens = estimate_tokens(legacy_history_context(messages))
+        prefix = SUMMARY_HEADER + summary.strip() if summary else ""
+        if pending_ids is not None:
+            pending_ids = set(pending_ids)
+            messages = [m for m in messages if m.id in pending_ids]
+        if not messages:
+            selection = HistorySelection(text=prefix, tokens=estimate_tokens(prefix), legacy_tokens=legacy_tokens)
+            self._record(selection)
+            return selection
+
+        query_grams = Counter(_ngrams(query + "\n" + (template or ""), self.ngram))
+        template_lines = _lines(template or "")
+        candidates = []
+        for position, message in enumerate(messages):
+            content, stripped = self.strip_boilerplate(message.content, template_lines)
+            relevance = self._bm25(query_grams, message.subject + "\n" + content)
+            recency = position / (len(messages) - 1) if len(messages) > 1 else 1.0
+            candidates.append((message, content, stripped, relevance, recency))
+
+        top = max(c[3] for c in candidates) or 1.0
+        ranked = sorted(
+            candidates,
+            key=lambda c: (1 - self.recency_weight) * c[3] / top + self.recency_weight * c[4],
+            reverse=True,
+        )
+
+        # 関連度の高い順に、予算に収まるだけ詰める（収まらなければ行単位で切り詰める）
+        remaining = budget - estimate_tokens(prefix + HISTORY_HEADER)
+        chosen: Dict[int, str] = {}
+        truncated = []
+        stripped_lines = 0
+        for message, content, stripped, _, _ in ranked:
+            if remaining < self.min_chunk_tokens:
+                break
+            rendered = render_message(message, content)
+            cost = estimate_tokens(rendered)
+            if cost > remaining:
+                rendered = self._truncate(message, content, remaining)
+                if rendered is None:
+                    continue
+                truncated.append(message.id)
+                cost = estimate_tokens(rendered)
+            chosen[id(message)] = rendered
+            stripped_lines += stripped
+            remaining -= cost
+
+        ordered = [m for m in messages if id(m) in chosen]
+        text = prefix + (HISTORY_HEADER + "".join(chosen[id(m)] for m in ordered) if ordered else "")
+        selection = HistorySelection(
+            text=text,
+            selected=[m.id for m in ordered],
+            truncated=truncated,
+            stripped_lines=stripped_lines,
+            tokens=estimate_tokens(text),
+            legacy_tokens=legacy_tokens,
+        )
+        self._record(selection)
+        return selection
+
+    def _truncate(self, message: Any, content: str, remaining: int) -> Optional[str]:
+        """先頭から行単位で予算に収まるところまで残す"""
+        kept = []
+        for line in content.splitlines():
+            candidate = render_message(message, "\n".join(kept + [line]) + "\n（以下略）")
+            if estimate_tokens(candidate) > remaining:
+                break
+            kept.append(line)
+        if not any(line.strip() for line in kept):
+            return None
+        return render_message(message, "\n".join(kept) + "\n（以下略）")
+
+    def _record(self, selection: HistorySelection) -> None:
+        with self._lock:
+            stats = self._stats
+            stats["builds"] += 1
+            stats["tokens"] += selection.tokens
+            stats["legacy_tokens"] += selection.legacy_tokens
+            stats["saved_tokens"] += selection.saved_tokens
+            stats["stripped_lines"] += selection.stripped_lines
+
+    def stats(self) -> Dict[str, Any]:
+        """組み立て回数と、従来方式と比べて削減したプロンプトトークン数"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["budget_tokens"] = self.budget_tokens
+        stats["boilerplate_lines"] = len(self._boilerplate)
+        stats["saved_ratio"] = round(stats["saved_tokens"] / stats["legacy_tokens"], 3) if stats["legacy_tokens"] else None
+        return stats
@@ -1,10 +1,32 @@
 """
 LLM統合モジュール - Qwen3 (Ollama) 連携
 """
-import requests
+import asyncio
+import contextlib
+import logging
+import os
+import random
+import time
+import weakref
+import httpx
 import json
-from typing import Dict, Any, Optional
-from dataclasses import dataclass
+import re
+from typing import Dict, Any, Optional, AsyncIterator, Callable, List, Tuple
+from dataclasses import dataclass, replace
+
+from app.core.llm_backends import BackendPool, parse_host_models
+from app.core.llm_cache import LLMResponseCache, prompt_fingerprint
+from app.core.llm_metrics import LatencyWindow, extract_ollama_metrics
+from app.core.llm_profiles import DEFAULT_PROFILES, DEFAULT_TASK_PROFILES, EMAIL_MAX_TOKENS, GenerationProfile
+from app.core.llm_scheduler import BACKGROUND, INTERACTIVE, LLMScheduler
+from app.core.llm_sizing import GenerationSizer, SizingPlan, estimate_tokens
+from app.core.singleflight import SingleFlight
+from app.core.stream_parser import EmailStreamParser
+from app.core.structured_output import (
+    STRUCTURED_RETRY_NOTE, EmailAnalysis, EmailDraft, NextActionSuggestion
+)
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass
@@ -21,87 +43,885 @@ class EmailGenerationContext:
     current_template: str
     reference_template: Optional[str] = None  # 参考テンプレート
     template_name: Optional[str] = None  # テンプレート名
-    
-
-class QwenLLM:
-    """Qwen3 (Ollama) LLM統合クラス"""
-    
-    def __init__(self, base_url: str = "http://localhost:11434", model_name: str = "qwen3:30b"):
-        self.base_url = base_url
-        self.model_name = model_name
-        self.api_url = f"{base_url}/api/generate"
-    
-    def _call_ollama(self, prompt: str, temperature: float = 0.7, max_tokens: int = 500) -> str:
-        """Ollama APIを呼び出す"""
-        try:
-            payload = {
-                "model": self.model_name,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": temperature,
-                    "num_predict": max_tokens,
-                    "top_p": 0.9,
-                    "top_k": 40
-                }
-            }
-            
-            response = requests.post(self.api_url, json=payload, timeout=30)
-            response.raise_for_status()
-            
-            result = response.json()
-            return result.get("response", "").strip()
-            
-        except Exception as e:
-            print(f"Ollama API エラー: {e}")
-            return f"エラー: LLM通信に失敗しました ({str(e)})"
-    
-    def generate_email_content(self, context: EmailGenerationContext) -> Dict[str, str]:
-        """メール文面を生成する"""
-        
-        # テンプレート参考の場合とそうでない場合でプロンプトを変える
-        if context.reference_template:
-            # テンプレートを参考にした文章生成
-            prompt = f"""あなたは10年以上の経験を持つプロフェッショナルなキャリアアドバイザーです。
-以下の参考テンプレートを基に、具体的な状況に合わせて{context.target_person}宛のメール文面を作成してください。
 
-## 参考テンプレート「{context.template_name}」
-{context.reference_template}
 
-## 案件の詳細情報
-- 候補者: {context.candidate_name}様
-- 企業: {context.company}
-- 職種: {context.job_title}
-- 現在の状況: {context.status}
-- 熱意レベル: {context.enthusiasm_score * 100:.0f}%（高いほど前向き）
-- 懸念レベル: {context.concern_score * 100:.0f}%（高いほど心配事が多い）
+# メール生成プロンプトの固定部分
+# 案件ごとの情報より前に置き、Ollamaのプロンプトキャッシュを効かせる
+EMAIL_PREAMBLE = """あなたは10年以上の経験を持つプロフェッショナルなキャリアアドバイザーです。
+後述の案件情報を基に、指定された宛先へのメール文面を作成してください。
 
-## 状況の詳細と過去の経緯
-{context.latest_summary}
+## 送信対象者に応じた考慮事項
+- CS（企業担当者）: 候補者の魅力と懸念点をバランス良く伝える
+- 候補者: 不安を解消し、前向きな気持ちを維持できる内容
+- RA（リクルーティングアドバイザー）: 現状と必要な支援を明確に伝える"""
 
-## 作成指示
-参考テンプレートの構造と文体を参考にしつつ、以下の要素を含む実用的なメール文面を作成してください：
+EMAIL_TEMPLATE_INSTRUCTIONS = """## 作成指示
+後述の参考テンプレートの構造と文体を参考にしつつ、以下の要素を含む実用的なメール文面を作成してください：
 
 1. **テンプレート活用**: 参考テンプレートの構造・文体・表現を活かす
 2. **情報置換**: ●●や○○などのプレースホルダーを具体的な情報に置換
 3. **状況反映**: 候補者の熱意や懸念の状況を考慮した適切なトーン調整
 4. **個人化**: 候補者の名前、企業名、職種などを正確に反映
-5. **カスタマイズ**: 過去の経緯や現在の状況に応じた内容の追加・修正
+5. **カスタマイズ**: 過去の経緯や現在の状況に応じた内容の追加・修正"""
 
-## 送信対象者に応じた考慮事項
-- CS（企業担当者）: 候補者の魅力と懸念点をバランス良く伝える
-- 候補者: 不安を解消し、前向きな気持ちを維持できる内容
-- RA（リクルーティングアドバイザー）: 現状と必要な支援を明確に伝える
+EMAIL_FREEFORM_INSTRUCTIONS = """## 作成指示
+以下の要素を含む、実用的で人間味のあるメール文面を作成してください：
+
+1. **適切な文字数**: 200-500文字程度
+2. **具体的な内容**: 過去のやり取りを踏まえた具体的な提案
+3. **次のステップ**: 明確で実行可能なアクション
+4. **適切なトーン**: 丁寧だが堅すぎない、親しみやすい文体
+5. **個人的な配慮**: 候補者の懸念や希望を反映"""
 
-以下の形式で必ず回答してください：
+# 回答形式の指示（テキスト形式 / JSON形式）
+EMAIL_TEXT_FORMAT = """以下の形式で必ず回答してください：
 件名: [件名]
 本文: [本文]"""
+
+EMAIL_JSON_FORMAT = """以下のJSON形式で必ず回答してください：
+{"subject": "件名", "body": "本文"}"""
+
+ANALYSIS_TEXT_FORMAT = """以下の形式で回答してください：
+熱意スコア: [0-1の値]
+懸念スコア: [0-1の値]
+分析理由: [理由]"""
+
+ANALYSIS_JSON_FORMAT = """以下のJSON形式で回答してください（スコアは0-1の数値）：
+{"enthusiasm_score": 熱意スコア, "concern_score": 懸念スコア, "analysis_reason": "理由"}"""
+
+NEXT_ACTION_TEXT_FORMAT = """以下の形式で回答してください：
+アクション: [具体的なアクション]
+理由: [理由]
+優先度: [高/中/低]"""
+
+# 候補を複数生成する場合の温度（候補ごとに順に使う）
+CANDIDATE_TEMPERATURES = (0.6, 0.8, 0.4, 0.9, 0.5)
+
+# 思考モードの出力に含まれる<think>ブロック
+THINK_BLOCK = re.compile(r"<think>.*?</think>", re.DOTALL)
+
+NEXT_ACTION_JSON_FORMAT = """以下のJSON形式で回答してください（優先度は「高」「中」「低」のいずれか）：
+{"action": "具体的なアクション", "reason": "理由", "priority": "優先度"}"""
+    
+
+class QwenLLM:
+    """Qwen3 (Ollama) LLM統合クラス"""
+    
+    def __init__(
+        self,
+        base_url: str = "http://localhost:11434",
+        model_name: str = "qwen3:30b",
+        timeout: float = 30.0,
+        max_connections: int = 10,
+        cache: Optional[LLMResponseCache] = None,
+        structured_output: bool = False,
+        keep_alive: Optional[str] = "30m",
+        base_urls: Optional[List[str]] = None,
+        hedge_requests: bool = False,
+        hedge_percentile: float = 95.0,
+        scheduler: Optional[LLMScheduler] = None,
+        profiles: Optional[Dict[str, GenerationProfile]] = None,
+        task_profiles: Optional[Dict[str, str]] = None,
+        sizer: Optional[GenerationSizer] = None,
+        host_models: Optional[Dict[str, List[str]]] = None,
+    ):
+        # 複数のOllamaホストを指定した場合は空いているホストへ振り分ける（host_modelsでホストごとのモデルを限定できる）
+        self.backends = BackendPool(base_urls or [base_url], host_models=host_models)
+        self.base_url = self.backends.backends[0].base_url
+        self.model_name = model_name
+        self.api_url = self.backends.backends[0].api_url
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.cache = cache
+        # 指定した場合、Ollamaへのリクエストは優先度クラス・CAごとに順番待ちする
+        self.scheduler = scheduler
+        # TrueのときはOllamaのformat（JSONスキーマ）で出力を制約する
+        self.structured_output = structured_output
+        # モデルをメモリに保持する時間（Ollamaのkeep_alive）
+        self.keep_alive = keep_alive
+        # 生成プロファイル（fast / quality）とタスクごとの既定値
+        self.profiles = dict(profiles or DEFAULT_PROFILES)
+        self.task_profiles = dict(DEFAULT_TASK_PROFILES, **(task_profiles or {}))
+        self._profile_stats: Dict[str, Dict[str, Any]] = {}
+        # 指定した場合、num_predict / num_ctx をテンプレート・宛先ごとの見積もりで決める
+        self.sizer = sizer
+        # Trueのとき、直近レイテンシのパーセンタイルを過ぎても応答がなければ別ホストへ同じリクエストを送る
+        self.hedge_requests = hedge_requests
+        self.hedge_percentile = hedge_percentile
+        self._attempt_latency = LatencyWindow()
+        self._request_latency = LatencyWindow()
+        self._hedge_stats = {"requests": 0, "hedged": 0, "hedge_wins": 0}
+        # 途中で打ち切ったOllamaリクエスト（クライアント切断・ヘッジの敗者・中断）
+        self._stream_latency = LatencyWindow()
+        self._cancel_stats = {"requests": 0, "streams": 0, "elapsed_s": 0.0, "estimated_saved_s": 0.0}
+        self._timings = {
+            "prompt_eval_ms": LatencyWindow(),
+            "eval_ms": LatencyWindow(),
+            "prompt_eval_count": LatencyWindow()
+        }
+        self._parse_stats = {
+            task: {
+                "text": {"calls": 0, "failures": 0},
+                "structured": {"calls": 0, "retries": 0, "failures": 0}
+            }
+            for task in ("email", "analysis", "next_action")
+        }
+        # 同一プロンプトの同時リクエストを1回の生成にまとめる
+        self._singleflight = SingleFlight()
+        # イベントループごとに保持するkeep-alive接続プール
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+    
+    def _get_async_client(self) -> httpx.AsyncClient:
+        """現在のイベントループ用の接続プール付きクライアントを取得"""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=5.0),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections * len(self.backends.backends),
+                    max_keepalive_connections=self.max_connections * len(self.backends.backends),
+                ),
+            )
+            self._async_clients[loop] = client
+        return client
+    
+    def start_health_checks(self) -> None:
+        """Ollamaホストの定期ヘルスチェックを開始（実行中のイベントループ上で呼ぶ）"""
+        self.backends.start_health_checks(self._get_async_client, self.model_name)
+    
+    def stop_health_checks(self) -> None:
+        self.backends.stop_health_checks()
+    
+    async def aclose(self) -> None:
+        """現在のイベントループの接続プールを閉じる"""
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+    
+    def _run_sync(self, coro):
+        """同期APIから非同期実装を呼び出す（デバッグスクリプト等向け）"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
         else:
-            # 通常の文章生成
-            prompt = f"""あなたは10年以上の経験を持つプロフェッショナルなキャリアアドバイザーです。
-以下の詳細情報を基に、{context.target_person}宛の効果的なメール文面を作成してください。
+            coro.close()
+            raise RuntimeError("イベントループ内では非同期版（a〜）のメソッドを使用してください")
+        
+        async def runner():
+            try:
+                return await coro
+            finally:
+                await self.aclose()
+        
+        return asyncio.run(runner())
+    
+    def _build_payload(
+        self,
+        prompt: str,
+        temperature: float,
+        max_tokens: int,
+        stream: bool = False,
+        response_format: Optional[Dict[str, Any]] = None,
+        profile: Optional[GenerationProfile] = None,
+        num_ctx: Optional[int] = None,
+        seed: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Ollama APIのリクエストボディを組み立てる"""
+        payload = {
+            "model": (profile.model if profile else None) or self.model_name,
+            "prompt": prompt,
+            "stream": stream,
+            "options": {
+                "temperature": temperature,
+                "num_predict": max_tokens,
+                "top_p": profile.top_p if profile else 0.9,
+                "top_k": profile.top_k if profile else 40
+            }
+        }
+        if num_ctx is not None:
+            payload["options"]["num_ctx"] = num_ctx
+        if seed is not None:
+            payload["options"]["seed"] = seed
+        if response_format is not None:
+            payload["format"] = response_format
+        if profile is not None and profile.think is not None:
+            payload["think"] = profile.think
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        return payload
+    
+    def _record_metrics(self, metrics: Dict[str, Any]) -> None:
+        """Ollamaの計測値を集計に加える"""
+        for key, window in self._timings.items():
+            if key in metrics:
+                window.add(metrics[key])
+    
+    async def awarmup(self) -> bool:
+        """各ホストで既定プロファイルのモデル（そのホストで動かすもの）をロードし、メール生成プロンプトの固定部分を評価させておく"""
+        prefix = self._email_prompt_prefix(True, self.structured_output)
+        payloads = {}
+        for task in self.task_profiles:
+            profile = self.resolve_profile(task)
+            model = profile.model or self.model_name
+            # 見積もりを使う場合、num_ctxが異なると最初のリクエストで再ロードになるため同じ段階でロードする
+            num_ctx = self.sizer.warmup_context(model) if self.sizer is not None else None
+            payload = self._build_payload(prefix, 0.0, 1, profile=profile, num_ctx=num_ctx)
+            payloads.setdefault(payload["model"], payload)
+        client = self._get_async_client()
+        
+        async def warmup_one(backend, payload) -> bool:
+            try:
+                response = await client.post(backend.api_url, json=payload)
+                response.raise_for_status()
+                metrics = extract_ollama_metrics(response.json())
+            except Exception as e:
+                print(f"Ollama ウォームアップ失敗 ({backend.base_url}): {e}")
+                return False
+            print(f"Ollama ウォームアップ完了 ({backend.base_url}, {payload['model']}): {metrics}")
+            return True
+        
+        results = await asyncio.gather(*(
+            warmup_one(backend, payload)
+            for backend in self.backends.backends for payload in payloads.values() if backend.serves(payload["model"])
+        ))
+        return any(results)
+    
+    def _fingerprint(self, payload: Dict[str, Any]) -> str:
+        """リクエストのフィンガープリント（キャッシュ・相乗りのキー）
 
-## 案件の詳細情報
+        num_ctxは出力に影響しないため含めない。見積もりを使う場合、num_predictは学習で変わるため含めない
+        （打ち切られた応答はキャッシュしない）。
+        """
+        options = {key: value for key, value in payload["options"].items() if key != "num_ctx"}
+        if self.sizer is not None:
+            options.pop("num_predict", None)
+        return prompt_fingerprint(
+            payload["model"], payload["prompt"], options, payload.get("format"), payload.get("think")
+        )
+    
+    def _plan_sizing(
+        self,
+        task: str,
+        prompt: str,
+        profile: GenerationProfile,
+        max_tokens: int,
+        context: Optional[EmailGenerationContext] = None,
+    ) -> Optional[SizingPlan]:
+        """num_predict / num_ctx の見積もり（max_tokensを上限とする。sizer未指定ならNone）"""
+        if self.sizer is None:
+            return None
+        return self.sizer.plan(
+            task,
+            prompt,
+            template_name=context.template_name if context else None,
+            reference_template=context.reference_template if context else None,
+            target_person=context.target_person if context else None,
+            think=bool(profile.think),
+            cap=max_tokens,
+            model=profile.model or self.model_name,
+        )
+    
+    def _observe_sizing(self, generation: Dict[str, Any], sizing: Optional[SizingPlan]) -> None:
+        """実際に生成した場合のみ、出力トークン数を見積もりに反映する"""
+        if sizing is None:
+            return
+        generation["sizing"] = sizing.to_dict()
+        if not generation["cached"] and "error" not in generation:
+            self.sizer.observe(sizing, generation.get("metrics", {}))
+    
+    def resolve_profile(self, task: str, name: Optional[str] = None) -> GenerationProfile:
+        """プロファイル名（省略時はタスクの既定）からプロファイルを取得"""
+        name = name or self.task_profiles.get(task)
+        if name not in self.profiles:
+            raise ValueError(f"未知の生成プロファイルです: {name}（{', '.join(self.profiles)}から選択）")
+        return self.profiles[name]
+    
+    def _record_profile(self, generation: Dict[str, Any]) -> None:
+        """プロファイルごとのレイテンシ・トークン数を集計"""
+        stats = self._profile_stats.setdefault(generation["profile"], {
+            "calls": 0,
+            "cached": 0,
+            "latency": LatencyWindow(),
+            "prompt_eval_count": LatencyWindow(),
+            "eval_count": LatencyWindow()
+        })
+        stats["calls"] += 1
+        if generation["cached"]:
+            stats["cached"] += 1
+            return
+        stats["latency"].add(generation["latency"])
+        for key in ("prompt_eval_count", "eval_count"):
+            if key in generation.get("metrics", {}):
+                stats[key].add(generation["metrics"][key])
+    
+    def _generation_metadata(self, generation: Dict[str, Any]) -> Dict[str, Any]:
+        """応答に付けるプロファイル・モデル・レイテンシ・トークン数"""
+        metrics = generation.get("metrics", {})
+        return {
+            "profile": generation["profile"],
+            "model": generation["model"],
+            "latency": generation["latency"],
+            "prompt_tokens": metrics.get("prompt_eval_count"),
+            "completion_tokens": metrics.get("eval_count"),
+            "cached": generation["cached"],
+            "prompt_fingerprint": generation.get("fingerprint"),
+            "error": generation.get("error"),
+            "sizing": generation.get("sizing"),
+            "metrics": metrics
+        }
+    
+    async def _agenerate(
+        self,
+        prompt: str,
+        temperature: float = 0.7,
+        max_tokens: int = 500,
+        regenerate: bool = False,
+        response_format: Optional[Dict[str, Any]] = None,
+        validator: Optional[Callable[[str], bool]] = None,
+        priority: str = INTERACTIVE,
+        owner: Optional[str] = None,
+        profile: Optional[GenerationProfile] = None,
+        sizing: Optional[SizingPlan] = None,
+        seed: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Ollama APIを非同期で呼び出し、応答テキストと付随情報を返す
+        
+        regenerate=Trueの場合はキャッシュを参照せずに再生成する（結果はキャッシュを更新）。
+        同じフィンガープリントの生成が進行中であればその結果を共有する。
+        validatorを渡した場合は、検証を通った応答のみキャッシュする。
+        priority・owner（担当CA）はスケジューラでの順番待ちに使う。
+        sizingを渡した場合は max_tokens の代わりに見積もった num_predict / num_ctx を使う。
+        seedを渡した場合は乱数のシードを固定する（フィンガープリントにも含まれる）。
+        """
+        if sizing is not None:
+            max_tokens = sizing.num_predict
+        payload = self._build_payload(
+            prompt, temperature, max_tokens, response_format=response_format, profile=profile,
+            num_ctx=sizing.num_ctx if sizing else None, seed=seed
+        )
+        fingerprint = self._fingerprint(payload)
+        info = {"profile": profile.name if profile else "default", "model": payload["model"], "fingerprint": fingerprint}
+        started_at = time.perf_counter()
+        generation = None
+        if self.cache is not None and not regenerate:
+            cached = self.cache.get(fingerprint)
+            if cached is not None:
+                generation = dict(cached, cached=True, **info)
+        
+        if generation is None:
+            result = await self._singleflight.do(
+                fingerprint,
+                lambda: self._scheduled(
+                    lambda: self._arequest(payload, fingerprint, validator), priority, owner, key=fingerprint
+                ),
+                on_join=lambda: self._promote(fingerprint, priority),
+            )
+            generation = dict(result, cached=False, **info)
+        generation["latency"] = round(time.perf_counter() - started_at, 3)
+        self._observe_sizing(generation, sizing)
+        self._record_profile(generation)
+        return generation
+    
+    async def _scheduled(
+        self, factory: Callable[[], Any], priority: str, owner: Optional[str], key: Optional[str] = None
+    ) -> Any:
+        """スケジューラがあれば処理枠を待ってから実行する"""
+        if self.scheduler is None:
+            return await factory()
+        return await self.scheduler.run(factory, priority=priority, owner=owner, key=key)
+    
+    def _promote(self, fingerprint: str, priority: str) -> None:
+        """対話の呼び出しが進行中の生成に相乗りした場合、その生成をバックグラウンドから対話の優先度に上げる
+        
+        事前生成・一括生成と同じプロンプトを画面から開いた場合に、中断されうるジョブを待たせないため。
+        """
+        if self.scheduler is not None and priority == INTERACTIVE:
+            self.scheduler.promote(fingerprint)
+    
+    async def _agenerate_structured(
+        self,
+        prompt: str,
+        result_type,
+        task: str,
+        temperature: float,
+        max_tokens: int,
+        regenerate: bool = False,
+        priority: str = INTERACTIVE,
+        owner: Optional[str] = None,
+        profile: Optional[GenerationProfile] = None,
+        sizing: Optional[SizingPlan] = None,
+        seed: Optional[int] = None,
+    ) -> Tuple[Optional[Any], Dict[str, Any], int]:
+        """JSONスキーマで出力を制約して生成し、型付きの結果を返す
+        
+        検証に失敗した場合のみ1回だけ再指示する。戻り値は (結果またはNone, 生成情報, 試行回数)。
+        """
+        stats = self._parse_stats[task]["structured"]
+        stats["calls"] += 1
+        
+        def validator(text: str) -> bool:
+            return result_type.parse(text) is not None
+        
+        generation = await self._agenerate(
+            prompt, temperature, max_tokens, regenerate=regenerate,
+            response_format=result_type.json_schema(), validator=validator, priority=priority, owner=owner,
+            profile=profile, sizing=sizing, seed=seed
+        )
+        parsed = result_type.parse(generation["response"])
+        attempts = 1
+        
+        if parsed is None and "error" not in generation:
+            stats["retries"] += 1
+            attempts = 2
+            first_latency, first_fingerprint = generation["latency"], generation["fingerprint"]
+            generation = await self._agenerate(
+                prompt + STRUCTURED_RETRY_NOTE, temperature, max_tokens, regenerate=True,
+                response_format=result_type.json_schema(), validator=validator, priority=priority, owner=owner,
+                profile=profile, sizing=sizing, seed=seed
+            )
+            generation["latency"] = round(first_latency + generation["latency"], 3)
+            # 再指示しても、結果は元のリクエストのフィンガープリントで照合できるようにする
+            generation["fingerprint"] = first_fingerprint
+            parsed = result_type.parse(generation["response"])
+        
+        if parsed is None:
+            stats["failures"] += 1
+        return parsed, generation, attempts
+    
+    async def _arequest(
+        self,
+        payload: Dict[str, Any],
+        fingerprint: str,
+        validator: Optional[Callable[[str], bool]] = None,
+    ) -> Dict[str, Any]:
+        """Ollama APIへ実際にリクエストを送る（成功時はキャッシュに保存）
+        
+        通信エラー・5xxの場合は別のホストで1回だけやり直す
+        """
+        tried = []
+        started_at = time.perf_counter()
+        for _ in range(min(2, len(self.backends.serving(payload["model"])))):
+            try:
+                if self.hedge_requests:
+                    data = await self._apost_hedged(payload, tried)
+                else:
+                    data = await self._apost(payload, tried)
+                break
+            except Exception as e:
+                error = e
+        else:
+            return {
+                "response": f"エラー: LLM通信に失敗しました ({str(error)})",
+                "error": str(error)
+            }
+        self._request_latency.add(time.perf_counter() - started_at)
+        
+        result = {"response": data.get("response", "").strip(), "metrics": extract_ollama_metrics(data)}
+        self._record_metrics(result["metrics"])
+        # num_predictで打ち切られた応答は見積もりが変わると不完全になるためキャッシュしない
+        truncated = result["metrics"].get("done_reason") == "length"
+        if self.cache is not None and not truncated and (validator is None or validator(result["response"])):
+            self.cache.set(fingerprint, result)
+        return result
+    
+    async def _apost(self, payload: Dict[str, Any], tried: List) -> Dict[str, Any]:
+        """未使用のホストを1台選んでリクエストを送る"""
+        async with self.backends.acquire(exclude=tried, model=payload["model"]) as backend:
+            tried.append(backend)
+            started_at = time.perf_counter()
+            try:
+                response = await self._get_async_client().post(backend.api_url, json=payload)
+                response.raise_for_status()
+            except asyncio.CancelledError:
+                self._record_cancelled("requests", time.perf_counter() - started_at, self._attempt_latency)
+                raise
+            except Exception as e:
+                print(f"Ollama API エラー ({backend.base_url}): {e}")
+                raise
+            self._attempt_latency.add(time.perf_counter() - started_at)
+            return response.json()
+    
+    def _hedge_delay(self) -> float:
+        """2本目を送るまでの待ち時間（計測が少ないうちはタイムアウトの1/3）"""
+        if len(self._attempt_latency) < 20:
+            return self.timeout / 3
+        return self._attempt_latency.percentile(self.hedge_percentile)
+    
+    async def _apost_hedged(self, payload: Dict[str, Any], tried: List) -> Dict[str, Any]:
+        """ヘッジ付きでリクエストを送る
+        
+        待ち時間内に応答がなければ別ホストへ同じリクエストを送り、
+        先に成功した方を採用して残りはキャンセルする（Ollama側の生成も切断で止まる）
+        """
+        self._hedge_stats["requests"] += 1
+        tasks = [asyncio.ensure_future(self._apost(payload, tried))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self._hedge_delay())
+            if not done and any(b.healthy and b not in tried for b in self.backends.serving(payload["model"])):
+                self._hedge_stats["hedged"] += 1
+                tasks.append(asyncio.ensure_future(self._apost(payload, tried)))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            self._hedge_stats["hedge_wins"] += 1
+                        return task.result()
+            return tasks[0].result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
+    async def _acall_ollama(
+        self,
+        prompt: str,
+        temperature: float = 0.7,
+        max_tokens: int = 500,
+        regenerate: bool = False,
+        priority: str = INTERACTIVE,
+        owner: Optional[str] = None,
+        profile: Optional[GenerationProfile] = None,
+    ) -> str:
+        """Ollama APIを非同期で呼び出す"""
+        result = await self._agenerate(
+            prompt, temperature, max_tokens, regenerate=regenerate, priority=priority, owner=owner, profile=profile
+        )
+        return result["response"]
+    
+    async def _astream_ollama(
+        self,
+        prompt: str,
+        temperature: float = 0.7,
+        max_tokens: int = 500,
+        owner: Optional[str] = None,
+        profile: Optional[GenerationProfile] = None,
+        num_ctx: Optional[int] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Ollama APIをストリーミングモードで呼び出し、NDJSONの各チャンクを返す"""
+        payload = self._build_payload(prompt, temperature, max_tokens, stream=True, profile=profile, num_ctx=num_ctx)
+        slot = self.scheduler.slot(INTERACTIVE, owner) if self.scheduler is not None else contextlib.nullcontext()
+        
+        async with slot, self.backends.acquire(model=payload["model"]) as backend:
+            started_at = time.perf_counter()
+            try:
+                async with self._get_async_client().stream("POST", backend.api_url, json=payload) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if not line.strip():
+                            continue
+                        chunk = json.loads(line)
+                        yield chunk
+                        if chunk.get("done"):
+                            break
+            except (asyncio.CancelledError, GeneratorExit):
+                # 接続を閉じるとOllama側の生成も止まる
+                self._record_cancelled("streams", time.perf_counter() - started_at, self._stream_latency)
+                raise
+            self._stream_latency.add(time.perf_counter() - started_at)
+    
+    def _record_cancelled(self, kind: str, elapsed: float, latency: LatencyWindow) -> None:
+        """打ち切ったリクエストを集計（削減できたGPU時間は直近の中央値からの推定）"""
+        stats = self._cancel_stats
+        stats[kind] += 1
+        stats["elapsed_s"] = round(stats["elapsed_s"] + elapsed, 3)
+        expected = latency.percentile(50)
+        if expected is not None:
+            stats["estimated_saved_s"] = round(stats["estimated_saved_s"] + max(0.0, expected - elapsed), 3)
+    
+    def _call_ollama(self, prompt: str, temperature: float = 0.7, max_tokens: int = 500) -> str:
+        """Ollama APIを呼び出す（同期ラッパー）"""
+        return self._run_sync(self._acall_ollama(prompt, temperature, max_tokens))
+    
+    def generate_email_content(self, context: EmailGenerationContext, regenerate: bool = False) -> Dict[str, str]:
+        """メール文面を生成する（同期ラッパー）"""
+        return self._run_sync(self.agenerate_email_content(context, regenerate=regenerate))
+    
+    async def agenerate_email_content(
+        self,
+        context: EmailGenerationContext,
+        regenerate: bool = False,
+        priority: str = INTERACTIVE,
+        owner: Optional[str] = None,
+        profile: Optional[str] = None,
+        temperature: float = 0.6,
+        seed: Optional[int] = None,
+    ) -> Dict[str, str]:
+        """メール文面を非同期で生成する（一括生成などはpriority=BACKGROUNDで呼ぶ）
+        
+        profileは "fast" / "quality" などのプロファイル名（省略時はタスクの既定）
+        """
+        selected = self.resolve_profile("email", profile)
+        if self.structured_output:
+            return await self._agenerate_email_structured(
+                context, regenerate, priority, owner, selected, temperature=temperature, seed=seed
+            )
+        
+        prompt = self._build_email_prompt(context)
+        
+        # LLM呼び出し（より高品質な文章を生成するために設定を最適化）
+        generation = await self._agenerate(
+            prompt, temperature=temperature, max_tokens=selected.limit_tokens("email", EMAIL_MAX_TOKENS), regenerate=regenerate,
+            priority=priority, owner=owner, profile=selected,
+            sizing=self._plan_sizing("email", prompt, selected, selected.limit_tokens("email", EMAIL_MAX_TOKENS), context),
+            seed=seed
+        )
+        
+        result = self._parse_email_response(context, prompt, generation["response"])
+        result["metadata"].update(self._generation_metadata(generation))
+        result["metadata"].update(temperature=temperature, seed=seed)
+        return result
+    
+    def email_fingerprint(
+        self, context: EmailGenerationContext, profile: Optional[str] = None, structured: Optional[bool] = None
+    ) -> str:
+        """agenerate_email_content が既定の温度で使うフィンガープリント
+        
+        生成せずに求められるため、保存済みの下書きがテンプレート・履歴・プロファイルの変わる前のものかを判定できる。
+        astream_email_content は構造化出力を使わずテキスト形式で生成するため、その場合は structured=False を渡す。
+        """
+        if structured is None:
+            structured = self.structured_output
+        selected = self.resolve_profile("email", profile)
+        payload = self._build_payload(
+            self._build_email_prompt(context, structured), 0.6, selected.limit_tokens("email", EMAIL_MAX_TOKENS),
+            response_format=EmailDraft.json_schema() if structured else None, profile=selected
+        )
+        return self._fingerprint(payload)
+    
+    async def agenerate_email_variants(
+        self,
+        context: EmailGenerationContext,
+        recipients: List[str],
+        templates: Optional[Dict[str, Tuple[Optional[str], Optional[str]]]] = None,
+        regenerate: bool = False,
+        priority: str = INTERACTIVE,
+        owner: Optional[str] = None,
+        profile: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """同じ案件について宛先（CS / candidate / RA）別のメール文面を同時に生成する
+        
+        templatesには宛先ごとの参考テンプレート (テンプレート名, 本文) を指定できる（省略時はcontextのもの）。
+        プロンプトは案件情報・経緯までが全宛先で共通になるため、Ollamaはその評価結果を使い回せる。
+        """
+        contexts = {}
+        for recipient in recipients:
+            template_name, reference_template = (templates or {}).get(
+                recipient, (context.template_name, context.reference_template)
+            )
+            contexts[recipient] = replace(
+                context, target_person=recipient, template_name=template_name, reference_template=reference_template
+            )
+        prompts = [self._build_email_prompt(c, self.structured_output) for c in contexts.values()]
+        shared_prefix = os.path.commonprefix(prompts) if len(prompts) > 1 else ""
+        started_at = time.perf_counter()
+        
+        async def generate_one(recipient: str) -> Dict[str, Any]:
+            result = await self.agenerate_email_content(
+                contexts[recipient], regenerate=regenerate, priority=priority, owner=owner, profile=profile
+            )
+            result["metadata"]["finished_at"] = round(time.perf_counter() - started_at, 3)
+            return result
+        
+        results = await asyncio.gather(*(generate_one(recipient) for recipient in recipients))
+        wall_time = time.perf_counter() - started_at
+        total_latency = sum(result["metadata"].get("latency") or 0.0 for result in results)
+        return {
+            "variants": dict(zip(recipients, results)),
+            "timings": {
+                "wall_time": round(wall_time, 3),
+                "total_latency": round(total_latency, 3),
+                "speedup": round(total_latency / wall_time, 2) if wall_time > 0 else None
+            },
+            "shared_prefix_tokens": estimate_tokens(shared_prefix),
+            "prompt_tokens": [estimate_tokens(prompt) for prompt in prompts]
+        }
+    
+    async def agenerate_email_candidates(
+        self,
+        context: EmailGenerationContext,
+        n: int = 3,
+        regenerate: bool = False,
+        priority: str = INTERACTIVE,
+        owner: Optional[str] = None,
+        profile: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """同じプロンプトで温度・シードを変えたメール文面の候補をn件同時に生成する
+        
+        regenerate=Falseの場合はシードを固定する（同じ案件を開き直したときはキャッシュから返る）。
+        """
+        base_seed = random.randrange(1 << 30) if regenerate else 0
+        samplings = [
+            (CANDIDATE_TEMPERATURES[i % len(CANDIDATE_TEMPERATURES)], base_seed + i) for i in range(n)
+        ]
+        started_at = time.perf_counter()
+        
+        async def generate_one(temperature: float, seed: int) -> Dict[str, Any]:
+            result = await self.agenerate_email_content(
+                context, regenerate=regenerate, priority=priority, owner=owner, profile=profile,
+                temperature=temperature, seed=seed
+            )
+            result["metadata"]["finished_at"] = round(time.perf_counter() - started_at, 3)
+            return result
+        
+        results = await asyncio.gather(*(generate_one(temperature, seed) for temperature, seed in samplings))
+        wall_time = time.perf_counter() - started_at
+        total_latency = sum(result["metadata"].get("latency") or 0.0 for result in results)
+        return {
+            "candidates": list(results),
+            "timings": {
+                "wall_time": round(wall_time, 3),
+                "total_latency": round(total_latency, 3),
+                "speedup": round(total_latency / wall_time, 2) if wall_time > 0 else None
+            }
+        }
+    
+    async def _agenerate_email_structured(
+        self,
+        context: EmailGenerationContext,
+        regenerate: bool = False,
+        priority: str = INTERACTIVE,
+        owner: Optional[str] = None,
+        profile: Optional[GenerationProfile] = None,
+        temperature: float = 0.6,
+        seed: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """メール文面を構造化出力モードで生成する"""
+        profile = profile or self.resolve_profile("email")
+        prompt = self._build_email_prompt(context, structured=True)
+        draft, generation, attempts = await self._agenerate_structured(
+            prompt, EmailDraft, "email", temperature=temperature, max_tokens=profile.limit_tokens("email", EMAIL_MAX_TOKENS),
+            regenerate=regenerate, priority=priority, owner=owner, profile=profile,
+            sizing=self._plan_sizing("email", prompt, profile, profile.limit_tokens("email", EMAIL_MAX_TOKENS), context),
+            seed=seed
+        )
+        
+        metadata = {
+            "temperature": temperature,
+            "seed": seed,
+            "context_length": len(prompt),
+            "has_reference_template": bool(context.reference_template),
+            "template_name": context.template_name or "なし",
+            "structured": True,
+            "parse_attempts": attempts,
+            "parse_failed": draft is None
+        }
+        metadata.update(self._generation_metadata(generation))
+        return {
+            "subject": draft.subject if draft else self._fallback_subject(context),
+            "body": draft.body if draft else self._fallback_body(context),
+            "metadata": metadata,
+            "raw_response": generation["response"]
+        }
+    
+    async def astream_email_content(
+        self,
+        context: EmailGenerationContext,
+        regenerate: bool = False,
+        owner: Optional[str] = None,
+        profile: Optional[str] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """メール文面をストリーミング生成する
+        
+        {"event": "subject" | "body", "data": 差分テキスト} を逐次返し（件名の行が再び現れた場合は
+        {"event": "subject_reset", "data": ""} の後に新しい件名を返す）、
+        最後に {"event": "done", "data": generate_email_contentと同じ形式の結果} を返す。
+        キャッシュにヒットした場合は保存済みの応答を一括で流す。
+        """
+        selected = self.resolve_profile("email", profile)
+        max_tokens = selected.limit_tokens("email", EMAIL_MAX_TOKENS)
+        prompt = self._build_email_prompt(context)
+        sizing = self._plan_sizing("email", prompt, selected, max_tokens, context)
+        if sizing is not None:
+            max_tokens = sizing.num_predict
+        parser = EmailStreamParser()
+        raw_chunks = []
+        started_at = time.perf_counter()
+        first_text_at = None
+        payload = self._build_payload(prompt, 0.6, max_tokens, profile=selected)
+        fingerprint = self._fingerprint(payload)
+        cached = self.cache.get(fingerprint) if self.cache is not None and not regenerate else None
+        
+        metrics = {}
+        error = None
+        if cached is not None:
+            metrics = cached.get("metrics", {})
+            raw_chunks.append(cached["response"])
+            for event, text in parser.feed(cached["response"]):
+                if first_text_at is None:
+                    first_text_at = time.perf_counter()
+                yield {"event": event, "data": text}
+        else:
+            try:
+                async for chunk in self._astream_ollama(
+                    prompt, temperature=0.6, max_tokens=max_tokens, owner=owner, profile=selected,
+                    num_ctx=sizing.num_ctx if sizing else None
+                ):
+                    token = chunk.get("response", "")
+                    raw_chunks.append(token)
+                    for event, text in parser.feed(token):
+                        if first_text_at is None:
+                            first_text_at = time.perf_counter()
+                        yield {"event": event, "data": text}
+                    if chunk.get("done"):
+                        metrics = extract_ollama_metrics(chunk)
+                        self._record_metrics(metrics)
+            except Exception as e:
+                print(f"Ollama API エラー: {e}")
+                error = str(e)
+                raw_chunks = [f"エラー: LLM通信に失敗しました ({error})"]
+            else:
+                if self.cache is not None and metrics.get("done_reason") != "length":
+                    self.cache.set(fingerprint, {"response": "".join(raw_chunks).strip(), "metrics": metrics})
+        
+        for event, text in parser.close():
+            if first_text_at is None:
+                first_text_at = time.perf_counter()
+            yield {"event": event, "data": text}
+        
+        result = self._parse_email_response(context, prompt, "".join(raw_chunks).strip())
+        finished_at = time.perf_counter()
+        generation = {
+            "profile": selected.name,
+            "model": payload["model"],
+            "latency": round(finished_at - started_at, 3),
+            "cached": cached is not None,
+            "fingerprint": fingerprint,
+            "metrics": metrics
+        }
+        if error is not None:
+            generation["error"] = error
+        self._observe_sizing(generation, sizing)
+        self._record_profile(generation)
+        result["metadata"].update(self._generation_metadata(generation))
+        result["metadata"]["time_to_first_text"] = round((first_text_at or finished_at) - started_at, 3)
+        result["metadata"]["total_time"] = generation["latency"]
+        yield {"event": "done", "data": result}
+    
+    def _build_email_prompt(self, context: EmailGenerationContext, structured: bool = False) -> str:
+        """メール生成用のプロンプトを組み立てる
+        
+        Ollamaがプロンプトの評価結果を使い回せるよう、固定の前置き・指示を先頭に、
+        案件ごとに変わる情報を末尾に置く。
+        """
+        return self._email_prompt_prefix(bool(context.reference_template), structured) + self._email_prompt_details(context)
+    
+    def _email_prompt_prefix(self, with_template: bool, structured: bool = False) -> str:
+        """メール生成プロンプトの固定部分（案件に依存しない）"""
+        # テンプレート参考の場合とそうでない場合で作成指示を変える
+        instructions = EMAIL_TEMPLATE_INSTRUCTIONS if with_template else EMAIL_FREEFORM_INSTRUCTIONS
+        answer_format = EMAIL_JSON_FORMAT if structured else EMAIL_TEXT_FORMAT
+        return f"{EMAIL_PREAMBLE}\n\n{instructions}\n\n{answer_format}\n\n"
+    
+    def _email_prompt_details(self, context: EmailGenerationContext) -> str:
+        """メール生成プロンプトの案件ごとの部分
+        
+        宛先別に生成するときに案件情報・経緯までを共通にできるよう、参考テンプレートと宛先は末尾に置く。
+        """
+        details = f"""## 案件の詳細情報
 - 候補者: {context.candidate_name}様
 - 企業: {context.company}
 - 職種: {context.job_title}
@@ -112,28 +932,21 @@ class QwenLLM:
 ## 状況の詳細と過去の経緯
 {context.latest_summary}
 
-## 作成指示
-以下の要素を含む、実用的で人間味のあるメール文面を作成してください：
-
-1. **適切な文字数**: 200-500文字程度
-2. **具体的な内容**: 過去のやり取りを踏まえた具体的な提案
-3. **次のステップ**: 明確で実行可能なアクション
-4. **適切なトーン**: 丁寧だが堅すぎない、親しみやすい文体
-5. **個人的な配慮**: 候補者の懸念や希望を反映
-
-## 送信対象者に応じた考慮事項
-- CS（企業担当者）: 候補者の魅力と懸念点をバランス良く伝える
-- 候補者: 不安を解消し、前向きな気持ちを維持できる内容
-- RA（リクルーティングアドバイザー）: 現状と必要な支援を明確に伝える
+"""
+        if context.reference_template:
+            details += f"""## 参考テンプレート「{context.template_name}」
+{context.reference_template}
 
-以下の形式で必ず回答してください：
-件名: [件名]
-本文: [本文]"""
+"""
+        details += f"""## 宛先
+{context.target_person}宛のメール
 
-        # LLM呼び出し（より高品質な文章を生成するために設定を最適化）
-        response = self._call_ollama(prompt, temperature=0.6, max_tokens=1000)
-        
-        # レスポンスをパース
+上記の案件について、指定の形式でメール文面を作成してください。"""
+        return details
+    
+    def _parse_email_response(self, context: EmailGenerationContext, prompt: str, response: str) -> Dict[str, Any]:
+        """メール生成レスポンスをパースする"""
+        clean_response = response
         try:
             # デフォルト値を設定（実際の処理で使用されないように特殊な値を設定）
             subject = "__DEFAULT_SUBJECT__"
@@ -209,22 +1022,24 @@ class QwenLLM:
                 # 形式が全く整っていない場合、全体を本文として使用
                 body = clean_response
             
+            parse_failed = False
+            
             # 件名が抽出されなかった場合のフォールバック
             if not subject or subject.strip() == "" or subject == "__DEFAULT_SUBJECT__":
-                if context.reference_template and context.template_name:
-                    subject = f"【{context.candidate_name}様】{context.company}の件について"
-                else:
-                    subject = f"【{context.candidate_name}様】{context.company}案件の件"
+                subject = self._fallback_subject(context)
+                parse_failed = True
             
             # 本文が抽出されなかった場合のフォールバック
             if not body or body.strip() == "" or body == "__DEFAULT_BODY__":
-                body = f"お疲れ様です。{context.candidate_name}様の{context.company}の件についてご連絡いたします。\n\n詳細は別途お話しさせていただければと思います。"
+                body = self._fallback_body(context)
+                parse_failed = True
+            
+            self._record_text_parse("email", parse_failed)
             
-            # デバッグ情報を出力
-            print(f"[DEBUG] 生レスポンス長: {len(response)}")
-            print(f"[DEBUG] クリーンレスポンス長: {len(clean_response)}")
-            print(f"[DEBUG] 抽出された件名: {subject}")
-            print(f"[DEBUG] 抽出された本文長: {len(body)}")
+            logger.debug(
+                "生レスポンス長: %d / クリーンレスポンス長: %d / 抽出された件名: %s / 抽出された本文長: %d",
+                len(response), len(clean_response), subject, len(body)
+            )
             
             return {
                 "subject": subject,
@@ -234,12 +1049,15 @@ class QwenLLM:
                     "temperature": 0.6,
                     "context_length": len(prompt),
                     "has_reference_template": bool(context.reference_template),
-                    "template_name": context.template_name or "なし"
+                    "template_name": context.template_name or "なし",
+                    "structured": False,
+                    "parse_failed": parse_failed
                 },
                 "raw_response": response  # デバッグ用
             }
             
         except Exception as e:
+            self._record_text_parse("email", True)
             print(f"レスポンス解析エラー: {e}")
             print(f"生レスポンス: {response}")
             print(f"クリーンレスポンス: {clean_response}")
@@ -255,26 +1073,89 @@ class QwenLLM:
                 "raw_response": response
             }
 
-    def analyze_email_content(self, email_content: str) -> Dict[str, Any]:
-        """メール内容を解析してスコアを算出"""
+    def _fallback_subject(self, context: EmailGenerationContext) -> str:
+        """件名を取り出せなかった場合の件名"""
+        if context.reference_template and context.template_name:
+            return f"【{context.candidate_name}様】{context.company}の件について"
+        return f"【{context.candidate_name}様】{context.company}案件の件"
+    
+    def _fallback_body(self, context: EmailGenerationContext) -> str:
+        """本文を取り出せなかった場合の本文"""
+        return f"お疲れ様です。{context.candidate_name}様の{context.company}の件についてご連絡いたします。\n\n詳細は別途お話しさせていただければと思います。"
+    
+    def _record_text_parse(self, task: str, failed: bool) -> None:
+        """テキスト形式パーサーの成否を記録"""
+        stats = self._parse_stats[task]["text"]
+        stats["calls"] += 1
+        if failed:
+            stats["failures"] += 1
+
+    def analyze_email_content(self, email_content: str, regenerate: bool = False) -> Dict[str, Any]:
+        """メール内容を解析してスコアを算出（同期ラッパー）"""
+        return self._run_sync(self.aanalyze_email_content(email_content, regenerate=regenerate))
+    
+    async def aanalyze_email_content(
+        self,
+        email_content: str,
+        regenerate: bool = False,
+        priority: str = BACKGROUND,
+        owner: Optional[str] = None,
+        profile: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """メール内容を非同期で解析してスコアを算出（既定はバックグラウンド扱い・fastプロファイル）"""
+        selected = self.resolve_profile("analysis", profile)
+        max_tokens = selected.limit_tokens("analysis", 300)
+        if self.structured_output:
+            prompt = self._build_analysis_prompt(email_content, structured=True)
+            analysis, generation, attempts = await self._agenerate_structured(
+                prompt, EmailAnalysis, "analysis", temperature=0.3, max_tokens=max_tokens, regenerate=regenerate,
+                priority=priority, owner=owner, profile=selected,
+                sizing=self._plan_sizing("analysis", prompt, selected, max_tokens)
+            )
+            if analysis is None:
+                result = {
+                    "enthusiasm_score": 0.5,
+                    "concern_score": 0.5,
+                    "analysis_reason": "分析できませんでした",
+                    "raw_response": generation["response"]
+                }
+            else:
+                result = {
+                    "enthusiasm_score": analysis.enthusiasm_score,
+                    "concern_score": analysis.concern_score,
+                    "analysis_reason": analysis.analysis_reason,
+                    "raw_response": generation["response"]
+                }
+        else:
+            prompt = self._build_analysis_prompt(email_content)
+            generation = await self._agenerate(
+                prompt, temperature=0.3, max_tokens=max_tokens, regenerate=regenerate,
+                priority=priority, owner=owner, profile=selected,
+                sizing=self._plan_sizing("analysis", prompt, selected, max_tokens)
+            )
+            result = self._parse_analysis_response(generation["response"])
         
-        prompt = f"""以下のメール内容を分析して、候補者の熱意と懸念を0-1の範囲で評価してください。
+        result["metadata"] = self._generation_metadata(generation)
+        return result
+    
+    def _build_analysis_prompt(self, email_content: str, structured: bool = False) -> str:
+        """メール分析用のプロンプトを組み立てる"""
+        answer_format = ANALYSIS_JSON_FORMAT if structured else ANALYSIS_TEXT_FORMAT
+        return f"""以下のメール内容を分析して、候補者の熱意と懸念を0-1の範囲で評価してください。
 
 メール内容:
 {email_content}
 
-以下の形式で回答してください：
-熱意スコア: [0-1の値]
-懸念スコア: [0-1の値]
-分析理由: [理由]"""
-
-        response = self._call_ollama(prompt, temperature=0.3, max_tokens=300)
-        
+{answer_format}"""
+    
+    def _parse_analysis_response(self, response: str) -> Dict[str, Any]:
+        """分析レスポンスをパースする"""
         try:
             # スコアを抽出
             enthusiasm_score = 0.5
             concern_score = 0.5
             analysis_reason = "分析できませんでした"
+            parsed_fields = set()
             
             lines = response.split('\n')
             for line in lines:
@@ -282,15 +1163,19 @@ class QwenLLM:
                 if line.startswith("熱意スコア:"):
                     try:
                         enthusiasm_score = float(line.split(":", 1)[1].strip())
+                        parsed_fields.add("enthusiasm_score")
                     except:
                         pass
                 elif line.startswith("懸念スコア:"):
                     try:
                         concern_score = float(line.split(":", 1)[1].strip())
+                        parsed_fields.add("concern_score")
                     except:
                         pass
                 elif line.startswith("分析理由:"):
                     analysis_reason = line.split(":", 1)[1].strip()
+            
+            self._record_text_parse("analysis", not {"enthusiasm_score", "concern_score"} <= parsed_fields)
                     
             return {
                 "enthusiasm_score": enthusiasm_score,
@@ -300,6 +1185,7 @@ class QwenLLM:
             }
             
         except Exception as e:
+            self._record_text_parse("analysis", True)
             print(f"分析エラー: {e}")
             return {
                 "enthusiasm_score": 0.5,
@@ -308,10 +1194,58 @@ class QwenLLM:
                 "raw_response": response
             }
 
-    def generate_next_action(self, context: EmailGenerationContext) -> Dict[str, str]:
-        """次のアクションを提案"""
+    def generate_next_action(self, context: EmailGenerationContext, regenerate: bool = False) -> Dict[str, str]:
+        """次のアクションを提案（同期ラッパー）"""
+        return self._run_sync(self.agenerate_next_action(context, regenerate=regenerate))
+    
+    async def agenerate_next_action(
+        self,
+        context: EmailGenerationContext,
+        regenerate: bool = False,
+        priority: str = BACKGROUND,
+        owner: Optional[str] = None,
+        profile: Optional[str] = None,
+    ) -> Dict[str, str]:
+        """次のアクションを非同期で提案（既定はバックグラウンド扱い）"""
+        selected = self.resolve_profile("next_action", profile)
+        max_tokens = selected.limit_tokens("next_action", 300)
+        if self.structured_output:
+            prompt = self._build_next_action_prompt(context, structured=True)
+            suggestion, generation, attempts = await self._agenerate_structured(
+                prompt, NextActionSuggestion, "next_action", temperature=0.4, max_tokens=max_tokens,
+                regenerate=regenerate, priority=priority, owner=owner, profile=selected,
+                sizing=self._plan_sizing("next_action", prompt, selected, max_tokens, context)
+            )
+            if suggestion is None:
+                result = {
+                    "action": "候補者に連絡を取る",
+                    "reason": "状況を確認するため",
+                    "priority": "中",
+                    "raw_response": generation["response"]
+                }
+            else:
+                result = {
+                    "action": suggestion.action,
+                    "reason": suggestion.reason,
+                    "priority": suggestion.priority,
+                    "raw_response": generation["response"]
+                }
+        else:
+            prompt = self._build_next_action_prompt(context)
+            generation = await self._agenerate(
+                prompt, temperature=0.4, max_tokens=max_tokens, regenerate=regenerate,
+                priority=priority, owner=owner, profile=selected,
+                sizing=self._plan_sizing("next_action", prompt, selected, max_tokens, context)
+            )
+            result = self._parse_next_action_response(generation["response"])
         
-        prompt = f"""候補者の状況を分析して、次に取るべきアクションを提案してください。
+        result["metadata"] = self._generation_metadata(generation)
+        return result
+    
+    def _build_next_action_prompt(self, context: EmailGenerationContext, structured: bool = False) -> str:
+        """ネクストアクション提案用のプロンプトを組み立てる"""
+        answer_format = NEXT_ACTION_JSON_FORMAT if structured else NEXT_ACTION_TEXT_FORMAT
+        return f"""候補者の状況を分析して、次に取るべきアクションを提案してください。
 
 候補者: {context.candidate_name}様
 企業: {context.company}
@@ -323,27 +1257,28 @@ class QwenLLM:
 状況詳細:
 {context.latest_summary}
 
-以下の形式で回答してください：
-アクション: [具体的なアクション]
-理由: [理由]
-優先度: [高/中/低]"""
-
-        response = self._call_ollama(prompt, temperature=0.4, max_tokens=300)
-        
+{answer_format}"""
+    
+    def _parse_next_action_response(self, response: str) -> Dict[str, str]:
+        """アクション提案レスポンスをパースする"""
         try:
             action = "候補者に連絡を取る"
             reason = "状況を確認するため"
             priority = "中"
+            action_found = False
             
             lines = response.split('\n')
             for line in lines:
                 line = line.strip()
                 if line.startswith("アクション:"):
                     action = line.split(":", 1)[1].strip()
+                    action_found = True
                 elif line.startswith("理由:"):
                     reason = line.split(":", 1)[1].strip()
                 elif line.startswith("優先度:"):
                     priority = line.split(":", 1)[1].strip()
+            
+            self._record_text_parse("next_action", not action_found)
                     
             return {
                 "action": action,
@@ -353,6 +1288,7 @@ class QwenLLM:
             }
             
         except Exception as e:
+            self._record_text_parse("next_action", True)
             print(f"アクション生成エラー: {e}")
             return {
                 "action": "候補者に連絡を取る",
@@ -360,7 +1296,124 @@ class QwenLLM:
                 "priority": "中",
                 "raw_response": response
             }
+    
+    async def aupdate_conversation_summary(
+        self,
+        summary: Optional[str],
+        message: str,
+        max_chars: int = 600,
+        priority: str = BACKGROUND,
+        owner: Optional[str] = None,
+        profile: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """これまでの要約に新しいメッセージ1件を反映した要約を返す（既定はバックグラウンド扱い・fastプロファイル）
+        
+        生成に失敗した場合は "error" を含み、summaryは元の要約のまま返す。
+        """
+        selected = self.resolve_profile("summary", profile)
+        max_tokens = selected.limit_tokens("summary", 400)
+        prompt = self._build_summary_prompt(summary, message, max_chars)
+        generation = await self._agenerate(
+            prompt, temperature=0.2, max_tokens=max_tokens, priority=priority, owner=owner, profile=selected,
+            sizing=self._plan_sizing("summary", prompt, selected, max_tokens)
+        )
+        result = {"summary": summary or "", "metadata": self._generation_metadata(generation)}
+        text = THINK_BLOCK.sub("", generation["response"]).strip()
+        if "error" in generation or not text:
+            result["error"] = generation.get("error", "要約が空でした")
+        else:
+            result["summary"] = text[:max_chars]
+        return result
+    
+    def _build_summary_prompt(self, summary: Optional[str], message: str, max_chars: int) -> str:
+        """ローリング要約の更新用プロンプトを組み立てる（固定部分を先頭に置く）"""
+        return f"""候補者の選考に関するやり取りの要約を更新してください。
+- 年収・日程・志望度・懸念点・選考結果など、次の連絡に必要な事実を残す
+- 挨拶・署名・定型文は含めない
+- 古くなった情報（確定済みの日程調整など）は最新の状態に書き換える
+- {max_chars}文字以内の箇条書きで、要約のみを出力する
+
+現在の要約:
+{summary or "（なし）"}
+
+新しいメッセージ:
+{message}
+
+更新後の要約:"""
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """運用監視用の統計情報"""
+        return {
+            "model": self.model_name,
+            "cache": self.cache.stats() if self.cache is not None else None,
+            "singleflight": self._singleflight.stats(),
+            "parsing": self._parsing_stats(),
+            "keep_alive": self.keep_alive,
+            "backends": self.backends.stats(),
+            "hedging": self._hedging_stats(),
+            "scheduler": self.scheduler.stats() if self.scheduler is not None else None,
+            "cancelled": dict(self._cancel_stats),
+            "profiles": self._profiles_stats(),
+            "sizing": self.sizer.stats() if self.sizer is not None else None,
+            "timings": {key: window.summary() for key, window in self._timings.items()}
+        }
+    
+    def _profiles_stats(self) -> Dict[str, Any]:
+        """プロファイルごとの呼び出し数・レイテンシ（秒）・トークン数"""
+        return {
+            name: {
+                "model": (self.profiles[name].model if name in self.profiles else None) or self.model_name,
+                "calls": stats["calls"],
+                "cached": stats["cached"],
+                "latency": stats["latency"].summary(),
+                "prompt_eval_count": stats["prompt_eval_count"].summary(),
+                "eval_count": stats["eval_count"].summary()
+            }
+            for name, stats in self._profile_stats.items()
+        }
+    
+    def _hedging_stats(self) -> Dict[str, Any]:
+        """ヘッジの発生率と、利用者から見たレイテンシ（秒）"""
+        stats = dict(self._hedge_stats)
+        stats["enabled"] = self.hedge_requests
+        stats["hedge_rate"] = round(stats["hedged"] / stats["requests"], 3) if stats["requests"] else 0.0
+        stats["hedge_delay"] = round(self._hedge_delay(), 3)
+        stats["attempt_latency"] = self._attempt_latency.summary()
+        stats["request_latency"] = self._request_latency.summary()
+        return stats
+    
+    def _parsing_stats(self) -> Dict[str, Any]:
+        """テキスト形式・構造化出力それぞれのパース失敗率"""
+        report = {"structured_output": self.structured_output}
+        for task, modes in self._parse_stats.items():
+            text, structured = modes["text"], modes["structured"]
+            report[task] = {
+                "text": dict(text, failure_rate=round(text["failures"] / text["calls"], 3) if text["calls"] else None),
+                "structured": dict(
+                    structured,
+                    first_pass_failure_rate=round(structured["retries"] / structured["calls"], 3) if structured["calls"] else None,
+                    failure_rate=round(structured["failures"] / structured["calls"], 3) if structured["calls"] else None
+                )
+            }
+        return report
 
 
 # シングルトンインスタンス
-llm = QwenLLM() 
\ No newline at end of file
+# OLLAMA_BASE_URLS にカンマ区切りで複数ホストを指定できる
+OLLAMA_BASE_URLS = [url.strip() for url in os.getenv("OLLAMA_BASE_URLS", "http://localhost:11434").split(",") if url.strip()]
+# ホストごとに動かすモデルを限定する場合は "URL=モデル|モデル" をカンマ区切りで指定する（指定のないホストは全モデル）
+OLLAMA_HOST_MODELS = parse_host_models(os.getenv("OLLAMA_HOST_MODELS", ""))
+llm = QwenLLM(
+    base_urls=OLLAMA_BASE_URLS,
+    host_models=OLLAMA_HOST_MODELS,
+    # SQLiteファイルは最初の参照・保存のときに作る（空文字ならメモリのみ）
+    cache=LLMResponseCache(os.getenv("LLM_CACHE_DB_PATH", "llm_cache.db") or None),
+    structured_output=True,
+    hedge_requests=os.getenv("OLLAMA_HEDGE_REQUESTS", "false").lower() == "true",
+    hedge_percentile=float(os.getenv("OLLAMA_HEDGE_PERCENTILE", "95")),
+    scheduler=LLMScheduler(
+        max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "4")),
+        preempt_depth=int(os.getenv("LLM_PREEMPT_DEPTH", "2")),
+    ),
+    sizer=GenerationSizer(),
+)
@@ -0,0 +1,221 @@
+"""
+Ollamaバックエンドのプール
+複数のOllamaホストを束ね、実行中リクエスト数と直近のレイテンシから
+最も空いている正常なホストへリクエストを振り分ける
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence
+
+import httpx
+
+from app.core.llm_metrics import LatencyWindow
+
+
+def parse_host_models(spec: str) -> Dict[str, List[str]]:
+    """ホストごとのモデル指定を読む（"http://gpu1:11434=qwen3:30b|qwen3:8b,http://gpu2:11434=qwen3:8b"）"""
+    host_models = {}
+    for entry in spec.split(","):
+        base_url, _, models = entry.strip().partition("=")
+        models = [model.strip() for model in models.split("|") if model.strip()]
+        if base_url and models:
+            host_models[base_url.rstrip("/")] = models
+    return host_models
+
+
+class OllamaBackend:
+    """1台のOllamaホストの状態
+
+    切り離したホストは、実際の生成（ヘルスチェックの生成プローブか、振り分けたリクエスト）が
+    成功するまで戻さない。ejected_until は次にプローブしてよい時刻。
+    """
+
+    def __init__(self, base_url: str, models: Optional[Sequence[str]] = None):
+        self.base_url = base_url.rstrip("/")
+        self.api_url = f"{self.base_url}/api/generate"
+        # このホストで動かすモデル（Noneの場合はすべて）
+        self.models = tuple(models) if models else None
+        self.in_flight = 0
+        self.ewma_latency: Optional[float] = None
+        self.latencies = LatencyWindow(size=200)
+        self.consecutive_failures = 0
+        self.ejected = False
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def healthy(self) -> bool:
+        return not self.ejected
+
+    def serves(self, model: Optional[str]) -> bool:
+        return model is None or self.models is None or model in self.models
+
+    def record_success(self, latency: float, alpha: float = 0.3) -> None:
+        self.consecutive_failures = 0
+        self.ejected = False
+        self.latencies.add(latency)
+        if self.ewma_latency is None:
+            self.ewma_latency = latency
+        else:
+            self.ewma_latency = alpha * latency + (1 - alpha) * self.ewma_latency
+
+    def reinstate(self) -> None:
+        """生成プローブが成功したホストを戻す（プローブの所要時間はレイテンシに含めない）"""
+        self.consecutive_failures = 0
+        self.ejected = False
+
+    def record_failure(self, error: str, failure_threshold: int, eject_seconds: float) -> None:
+        self.errors += 1
+        self.consecutive_failures += 1
+        self.last_error = error
+        if self.ejected or self.consecutive_failures >= failure_threshold:
+            self.ejected = True
+            self.ejected_until = time.monotonic() + eject_seconds
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "base_url": self.base_url,
+            "models": list(self.models) if self.models is not None else None,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "consecutive_failures": self.consecutive_failures,
+            "ewma_latency": round(self.ewma_latency, 3) if self.ewma_latency is not None else None,
+            "latency": self.latencies.summary(),
+            "last_error": self.last_error,
+        }
+
+
+class BackendPool:
+    """正常なバックエンドのうち最も負荷の低いものを選ぶ
+
+    host_models でホストごとに動かすモデルを指定した場合、そのモデルのリクエストだけを振り分ける。
+    """
+
+    def __init__(
+        self,
+        base_urls: Iterable[str],
+        failure_threshold: int = 3,
+        eject_seconds: float = 30.0,
+        health_interval: float = 10.0,
+        host_models: Optional[Dict[str, Sequence[str]]] = None,
+        probe_timeout: float = 60.0,
+    ):
+        host_models = {url.rstrip("/"): models for url, models in (host_models or {}).items()}
+        self.backends: List[OllamaBackend] = [
+            OllamaBackend(url, host_models.get(url.rstrip("/"))) for url in base_urls
+        ]
+        if not self.backends:
+            raise ValueError("Ollamaのバックエンドが指定されていません")
+        self.failure_threshold = failure_threshold
+        self.eject_seconds = eject_seconds
+        self.health_interval = health_interval
+        # 生成プローブはモデルのロードを含むことがあるため長めに待つ
+        self.probe_timeout = probe_timeout
+        self._health_task: Optional["asyncio.Task"] = None
+
+    def _load(self, backend: OllamaBackend, default_latency: float) -> float:
+        """負荷の目安 = (実行中 + 1) × 直近レイテンシ"""
+        latency = backend.ewma_latency if backend.ewma_latency is not None else default_latency
+        return (backend.in_flight + 1) * latency
+
+    def serving(self, model: Optional[str]) -> List[OllamaBackend]:
+        """modelを動かすバックエンド（指定に合うものがなければ全台）"""
+        return [b for b in self.backends if b.serves(model)] or self.backends
+
+    def select(self, exclude: Iterable[OllamaBackend] = (), model: Optional[str] = None) -> OllamaBackend:
+        """振り分け先を選ぶ（全台が切り離し中ならプローブの予定が最も近いものを使う）"""
+        excluded = set(map(id, exclude))
+        serving = self.serving(model)
+        candidates = [b for b in serving if id(b) not in excluded] or serving
+        healthy = [b for b in candidates if b.healthy]
+        if not healthy:
+            return min(candidates, key=lambda b: b.ejected_until)
+        known = [b.ewma_latency for b in healthy if b.ewma_latency is not None]
+        default_latency = min(known) if known else 1.0
+        return min(healthy, key=lambda b: self._load(b, default_latency))
+
+    @asynccontextmanager
+    async def acquire(
+        self, exclude: Iterable[OllamaBackend] = (), model: Optional[str] = None
+    ) -> AsyncIterator[OllamaBackend]:
+        """バックエンドを確保し、実行中数・レイテンシ・失敗を記録する"""
+        backend = self.select(exclude, model)
+        backend.in_flight += 1
+        backend.requests += 1
+        started_at = time.perf_counter()
+        try:
+            yield backend
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            backend.record_failure(str(e), self.failure_threshold, self.eject_seconds)
+            raise
+        else:
+            backend.record_success(time.perf_counter() - started_at)
+        finally:
+            backend.in_flight -= 1
+
+    async def probe(self, client: httpx.AsyncClient, model: str) -> None:
+        """全バックエンドのヘルスチェック
+
+        正常なホストは /api/tags で確認する（失敗は切り離しの判定に数えるが、成功しても失敗回数は戻さない）。
+        切り離したホストは、プローブの時刻になったら1トークンだけ実際に生成させ、成功した場合のみ戻す。
+        modelはホストにモデルの指定がない場合に生成プローブで使うモデル。
+        """
+
+        async def probe_one(backend: OllamaBackend):
+            if backend.ejected:
+                if time.monotonic() >= backend.ejected_until:
+                    await self._probe_generation(client, backend, model)
+                return
+            try:
+                response = await client.get(f"{backend.base_url}/api/tags", timeout=5.0)
+                response.raise_for_status()
+            except Exception as e:
+                backend.record_failure(f"health check: {e}", self.failure_threshold, self.eject_seconds)
+
+        await asyncio.gather(*(probe_one(backend) for backend in self.backends))
+
+    async def _probe_generation(self, client: httpx.AsyncClient, backend: OllamaBackend, model: str) -> None:
+        """切り離したホストで実際に生成できるかを確かめる"""
+        payload = {
+            "model": backend.models[0] if backend.models else model,
+            "prompt": "OK",
+            "stream": False,
+            "options": {"num_predict": 1},
+        }
+        try:
+            response = await client.post(backend.api_url, json=payload, timeout=self.probe_timeout)
+            response.raise_for_status()
+            if response.json().get("error"):
+                raise RuntimeError(response.json()["error"])
+        except Exception as e:
+            backend.record_failure(f"generation probe: {e}", self.failure_threshold, self.eject_seconds)
+        else:
+            backend.reinstate()
+
+    def start_health_checks(self, client_factory, model: str) -> None:
+        """定期ヘルスチェックを開始（client_factoryは実行中ループのクライアントを返す）"""
+        if self._health_task is not None and not self._health_task.done():
+            return
+
+        async def loop():
+            while True:
+                await self.probe(client_factory(), model)
+                await asyncio.sleep(self.health_interval)
+
+        self._health_task = asyncio.get_running_loop().create_task(loop())
+
+    def stop_health_checks(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [backend.stats() for backend in self.backends]
@@ -0,0 +1,150 @@
+"""
+LLMレスポンスキャッシュ
+モデル・プロンプト・生成オプションのフィンガープリントをキーに、
+メモリ上のLRUとSQLiteの2段でOllamaの応答を保持する
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+def prompt_fingerprint(
+    model: str,
+    prompt: str,
+    options: Dict[str, Any],
+    response_format: Optional[Dict[str, Any]] = None,
+    think: Optional[bool] = None,
+) -> str:
+    """モデル・プロンプト・オプション（・出力形式・思考モード）からキャッシュキーを生成"""
+    material = {"model": model, "prompt": prompt, "options": options}
+    if response_format is not None:
+        material["format"] = response_format
+    if think is not None:
+        material["think"] = think
+    material = json.dumps(material, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """メモリLRU + SQLiteの2段キャッシュ"""
+
+    def __init__(
+        self,
+        db_path: Optional[str] = "llm_cache.db",
+        memory_entries: int = 256,
+        disk_entries: int = 5000,
+        ttl_seconds: float = 7 * 24 * 3600,
+    ):
+        self.db_path = db_path
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._conn = None
+        self._closed = False
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        """SQLiteの接続（最初に使うときに開く。モジュールをimportしただけではファイルを作らない）"""
+        if self._conn is None and self.db_path and not self._closed:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache (accessed_at)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """キャッシュを参照（期限切れは削除してミス扱い）"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if now - created_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+            conn = self._connection()
+            if conn is not None:
+                row = conn.execute(
+                    "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value_json, created_at = row
+                    if now - created_at <= self.ttl_seconds:
+                        conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+                        conn.commit()
+                        value = json.loads(value_json)
+                        self._remember(key, created_at, value)
+                        self._stats["disk_hits"] += 1
+                        return value
+                    conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    conn.commit()
+
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        """キャッシュに保存（サイズ上限を超えた分は古い順に追い出す）"""
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            self._stats["stores"] += 1
+            conn = self._connection()
+            if conn is None:
+                return
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now),
+            )
+            conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+            overflow = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] - self.disk_entries
+            if overflow > 0:
+                conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN "
+                    "(SELECT key FROM llm_cache ORDER BY accessed_at ASC LIMIT ?)",
+                    (overflow,),
+                )
+                self._stats["evictions"] += overflow
+            conn.commit()
+
+    def _remember(self, key: str, created_at: float, value: Dict[str, Any]) -> None:
+        """メモリ層に登録（LRU）"""
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """ヒット・ミスの統計"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            conn = self._connection()
+            stats["disk_entries"] = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] if conn is not None else 0
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 3) if lookups else 0.0
+        return stats
+
+    def close(self) -> None:
+        self._closed = True
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,63 @@
+"""
+LLM計測ユーティリティ
+Ollama応答に含まれる処理時間の取り出しと、直近の計測値の集計を行う
+"""
+
+import math
+from collections import deque
+from typing import Any, Dict, Iterable, Optional
+
+# Ollamaが返す所要時間（ナノ秒）とトークン数のフィールド
+OLLAMA_DURATION_FIELDS = ("total_duration", "load_duration", "prompt_eval_duration", "eval_duration")
+OLLAMA_COUNT_FIELDS = ("prompt_eval_count", "eval_count")
+
+
+def extract_ollama_metrics(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Ollamaの応答から計測値を取り出す（所要時間はミリ秒に変換）"""
+    metrics = {}
+    for field in OLLAMA_DURATION_FIELDS:
+        if isinstance(data.get(field), (int, float)):
+            metrics[field.replace("_duration", "_ms")] = round(data[field] / 1_000_000, 1)
+    for field in OLLAMA_COUNT_FIELDS:
+        if isinstance(data.get(field), int):
+            metrics[field] = data[field]
+    if data.get("done_reason"):
+        metrics["done_reason"] = data["done_reason"]  # "length" は num_predict で打ち切られたことを示す
+    return metrics
+
+
+def percentile(values: Iterable[float], pct: float) -> Optional[float]:
+    """最近傍法によるパーセンタイル"""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class LatencyWindow:
+    """直近N件の計測値を保持して統計を返す"""
+
+    def __init__(self, size: int = 500):
+        self._values = deque(maxlen=size)
+
+    def add(self, value: float) -> None:
+        self._values.append(value)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        return percentile(self._values, pct)
+
+    def summary(self) -> Dict[str, Any]:
+        count = len(self._values)
+        if not count:
+            return {"count": 0}
+        return {
+            "count": count,
+            "mean": round(sum(self._values) / count, 3),
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+        }
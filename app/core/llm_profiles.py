@@ -0,0 +1,49 @@
+"""
+生成プロファイル
+速度重視（fast: 小さいモデル・思考なし・短い出力上限）と
+品質重視（quality: 30bモデル・思考あり）を名前で切り替える
+"""
+
+import os
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+
+@dataclass(frozen=True)
+class GenerationProfile:
+    """モデル・思考モード・サンプリング・タスク別の出力上限"""
+    name: str
+    model: Optional[str] = None  # Noneの場合はQwenLLMのmodel_nameを使う
+    think: Optional[bool] = None  # Ollamaのthinkパラメータ（Noneの場合は送らない）
+    top_p: float = 0.9
+    top_k: int = 40
+    max_tokens: Dict[str, int] = field(default_factory=dict)  # タスク別のnum_predict上限
+
+    def limit_tokens(self, task: str, max_tokens: int) -> int:
+        """タスク既定のトークン数をプロファイルの上限で切り詰める"""
+        cap = self.max_tokens.get(task)
+        return min(max_tokens, cap) if cap is not None else max_tokens
+
+
+FAST = "fast"
+QUALITY = "quality"
+
+# メール生成の出力上限（num_predict）。2,500文字を超えるテンプレート（「登録お礼」など）は
+# 2,000トークン前後を出力するため、既定は見積もりが上限で切り詰められない値にする
+EMAIL_MAX_TOKENS = int(os.getenv("LLM_EMAIL_MAX_TOKENS", "3000"))
+
+# Non-Thinking Modeの推奨値は docs/qwen3-best-practices.md を参照
+DEFAULT_PROFILES = {
+    FAST: GenerationProfile(
+        name=FAST,
+        model=os.getenv("OLLAMA_FAST_MODEL", "qwen3:8b"),
+        think=False,
+        top_p=0.8,
+        top_k=20,
+        max_tokens={"email": 600, "analysis": 120, "next_action": 150, "summary": 400},
+    ),
+    QUALITY: GenerationProfile(name=QUALITY, think=True),
+}
+
+# タスクごとの既定プロファイル（スコア算出・履歴の要約は速度を優先する）
+DEFAULT_TASK_PROFILES = {"email": QUALITY, "analysis": FAST, "next_action": QUALITY, "summary": FAST}
@@ -0,0 +1,297 @@
+"""
+LLMジョブスケジューラ
+画面からの対話的な生成（interactive）とスコアリング等のバックグラウンド処理（background）を
+優先度クラスに分け、同じクラス内ではCAごとの重み付き公平キューイングでOllamaの処理枠を割り当てる。
+対話的な待ちが積み上がった場合は、実行中のバックグラウンド処理を中断して後回しにする。
+対話的な呼び出しがバックグラウンドの生成の結果を待つ場合（同じプロンプトへの相乗り）は、そのジョブを対話の優先度に上げる。
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from app.core.llm_metrics import LatencyWindow
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+PRIORITY_CLASSES = (INTERACTIVE, BACKGROUND)
+
+DEFAULT_OWNER = "default"
+
+
+@dataclass(order=True)
+class _Job:
+    """キュー内のジョブ（仮想終了時刻の小さい順に処理する）"""
+    finish_tag: float
+    seq: int
+    start_tag: float = field(compare=False)
+    priority: str = field(compare=False)
+    owner: str = field(compare=False)
+    factory: Optional[Callable[[], Awaitable[Any]]] = field(compare=False)
+    future: "asyncio.Future" = field(compare=False)
+    enqueued_at: float = field(compare=False)
+    started_at: Optional[float] = field(default=None, compare=False)
+    task: Optional["asyncio.Task"] = field(default=None, compare=False)
+    preempted: bool = field(default=False, compare=False)
+    key: Optional[str] = field(default=None, compare=False)
+
+
+class LLMScheduler:
+    """優先度クラス + CA単位の重み付き公平キューイング"""
+
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        background_limit: Optional[int] = None,
+        preempt_depth: int = 2,
+        owner_weights: Optional[Dict[str, float]] = None,
+    ):
+        self.max_concurrency = max_concurrency
+        # バックグラウンド処理が同時に使える枠（対話用に最低1枠を残す）
+        self.background_limit = background_limit if background_limit is not None else max(1, max_concurrency - 1)
+        # 対話的な待ちがこの件数以上になったら、実行中のバックグラウンド処理を中断する
+        self.preempt_depth = preempt_depth
+        self.owner_weights = dict(owner_weights or {})
+        self._queues: Dict[str, List[_Job]] = {cls: [] for cls in PRIORITY_CLASSES}
+        self._running: Dict[str, List[_Job]] = {cls: [] for cls in PRIORITY_CLASSES}
+        self._virtual_time = {cls: 0.0 for cls in PRIORITY_CLASSES}
+        self._last_finish: Dict[str, Dict[str, float]] = {cls: {} for cls in PRIORITY_CLASSES}
+        self._seq = itertools.count()
+        # キー付きのジョブ（promote で優先度を上げる対象）
+        self._keyed: Dict[str, _Job] = {}
+        self._counts = {
+            cls: {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "preempted": 0, "promoted": 0}
+            for cls in PRIORITY_CLASSES
+        }
+        self._wait_time = {cls: LatencyWindow() for cls in PRIORITY_CLASSES}
+        self._service_time = {cls: LatencyWindow() for cls in PRIORITY_CLASSES}
+
+    async def run(
+        self,
+        factory: Callable[[], Awaitable[Any]],
+        priority: str = INTERACTIVE,
+        owner: Optional[str] = None,
+        key: Optional[str] = None,
+    ) -> Any:
+        """処理枠が空き次第 factory() を実行して結果を返す
+
+        バックグラウンドのジョブは中断された場合 factory() を呼び直して再実行するため、
+        factoryは何度呼んでも問題ない処理にすること。keyを渡すと promote(key) で優先度を上げられる。
+        """
+        job = self._submit(factory, priority, owner, key)
+        try:
+            return await job.future
+        except asyncio.CancelledError:
+            self._abandon(job)
+            raise
+
+    @asynccontextmanager
+    async def slot(self, priority: str = INTERACTIVE, owner: Optional[str] = None) -> AsyncIterator[None]:
+        """処理枠を確保する（ストリーミング生成など、中断できない処理向け）"""
+        job = self._submit(None, priority, owner)
+        try:
+            await job.future
+        except asyncio.CancelledError:
+            self._abandon(job)
+            raise
+        try:
+            yield
+        finally:
+            self._release(job, failed=False)
+
+    def _submit(self, factory, priority: str, owner: Optional[str], key: Optional[str] = None) -> _Job:
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"未知の優先度クラスです: {priority}")
+        owner = owner or DEFAULT_OWNER
+        job = _Job(
+            finish_tag=0.0,
+            seq=next(self._seq),
+            start_tag=0.0,
+            priority=priority,
+            owner=owner,
+            factory=factory,
+            future=asyncio.get_running_loop().create_future(),
+            enqueued_at=time.perf_counter(),
+            key=key,
+        )
+        self._counts[priority]["submitted"] += 1
+        self._tag(job)
+        if key is not None:
+            self._keyed[key] = job
+        heapq.heappush(self._queues[priority], job)
+        self._dispatch()
+        return job
+
+    def _tag(self, job: _Job) -> None:
+        """ジョブの優先度クラス・CAの重みから仮想開始・終了時刻を決める"""
+        weight = self.owner_weights.get(job.owner, 1.0)
+        job.start_tag = max(self._virtual_time[job.priority], self._last_finish[job.priority].get(job.owner, 0.0))
+        job.finish_tag = job.start_tag + 1.0 / weight
+        self._last_finish[job.priority][job.owner] = job.finish_tag
+
+    def promote(self, key: str, retry: bool = True) -> bool:
+        """keyのバックグラウンドのジョブを対話の優先度に上げる（実行中なら中断の対象から外す）
+
+        上げた場合はTrueを返す。見つからない場合は、ジョブを投入するタスクがまだ動いていない可能性があるため、
+        実行待ちの処理の後（同じイベントループの次の周回）にもう一度だけ調べる。
+        """
+        job = self._keyed.get(key)
+        if job is None:
+            if retry:
+                asyncio.get_running_loop().call_soon(self.promote, key, False)
+            return False
+        if job.future.done() or job.priority == INTERACTIVE:
+            return False
+        self._counts[job.priority]["promoted"] += 1
+        if job in self._running[job.priority]:
+            self._running[job.priority].remove(job)
+            job.priority = INTERACTIVE
+            self._running[INTERACTIVE].append(job)
+        else:
+            self._queues[job.priority].remove(job)
+            heapq.heapify(self._queues[job.priority])
+            job.priority = INTERACTIVE
+            self._tag(job)
+            heapq.heappush(self._queues[INTERACTIVE], job)
+        self._dispatch()
+        return True
+
+    def _forget(self, job: _Job) -> None:
+        if job.key is not None and self._keyed.get(job.key) is job:
+            del self._keyed[job.key]
+
+    def _queue_depth(self, priority: str) -> int:
+        return sum(1 for job in self._queues[priority] if not job.future.done())
+
+    def _running_total(self) -> int:
+        return sum(len(jobs) for jobs in self._running.values())
+
+    def idle(self) -> bool:
+        """対話的な処理の待ち・実行がなく、空き枠がある（事前生成などの判断に使う）"""
+        return (
+            not self._running[INTERACTIVE]
+            and self._queue_depth(INTERACTIVE) == 0
+            and self._running_total() < self.max_concurrency
+        )
+
+    def _pop(self, priority: str) -> Optional[_Job]:
+        """キャンセル済みを読み飛ばして次のジョブを取り出す"""
+        queue = self._queues[priority]
+        while queue:
+            job = heapq.heappop(queue)
+            if not job.future.done():
+                return job
+        return None
+
+    def _next_job(self) -> Optional[_Job]:
+        """対話を優先し、対話の待ちがなく枠に余裕があるときだけバックグラウンドを流す"""
+        job = self._pop(INTERACTIVE)
+        if job is not None:
+            return job
+        if len(self._running[BACKGROUND]) >= self.background_limit:
+            return None
+        return self._pop(BACKGROUND)
+
+    def _dispatch(self) -> None:
+        self._preempt()
+        while self._running_total() < self.max_concurrency:
+            job = self._next_job()
+            if job is None:
+                break
+            self._start(job)
+
+    def _preempt(self) -> None:
+        """対話の待ちが閾値を超えたら、最後に始まったバックグラウンド処理から中断する"""
+        depth = self._queue_depth(INTERACTIVE)
+        if depth < self.preempt_depth:
+            return
+        shortage = depth - (self.max_concurrency - self._running_total())
+        # 終わったばかりで完了通知を待っているジョブは中断しない（結果を捨てて再実行することになる）
+        victims = sorted(
+            (
+                job for job in self._running[BACKGROUND]
+                if job.task is not None and not job.task.done() and not job.preempted
+            ),
+            key=lambda job: job.started_at,
+            reverse=True,
+        )
+        for job in victims[:max(0, shortage)]:
+            job.preempted = job.task.cancel()
+
+    def _start(self, job: _Job) -> None:
+        job.started_at = time.perf_counter()
+        self._wait_time[job.priority].add(job.started_at - job.enqueued_at)
+        self._virtual_time[job.priority] = max(self._virtual_time[job.priority], job.start_tag)
+        self._running[job.priority].append(job)
+        if job.factory is None:
+            job.future.set_result(None)
+            return
+        job.task = asyncio.ensure_future(job.factory())
+        job.task.add_done_callback(lambda task: self._on_task_done(job))
+
+    def _on_task_done(self, job: _Job) -> None:
+        task = job.task
+        if job.preempted and task.cancelled() and not job.future.done():
+            # 中断されたジョブは同じ順位のまま待ち行列に戻す
+            self._running[job.priority].remove(job)
+            self._counts[job.priority]["preempted"] += 1
+            job.preempted = False
+            job.task = None
+            job.enqueued_at = time.perf_counter()
+            heapq.heappush(self._queues[job.priority], job)
+            self._dispatch()
+            return
+        failed = False
+        if not job.future.done():
+            if task.cancelled():
+                job.future.cancel()
+            elif task.exception() is not None:
+                failed = True
+                job.future.set_exception(task.exception())
+            else:
+                job.future.set_result(task.result())
+        self._release(job, failed=failed, cancelled=task.cancelled())
+
+    def _release(self, job: _Job, failed: bool, cancelled: bool = False) -> None:
+        if job not in self._running[job.priority]:
+            return
+        self._running[job.priority].remove(job)
+        self._forget(job)
+        if cancelled:
+            self._counts[job.priority]["cancelled"] += 1
+        else:
+            self._counts[job.priority]["failed" if failed else "completed"] += 1
+            self._service_time[job.priority].add(time.perf_counter() - job.started_at)
+        self._dispatch()
+
+    def _abandon(self, job: _Job) -> None:
+        """呼び出し元がキャンセルされたジョブを片付ける"""
+        if job.task is not None and not job.task.done():
+            job.task.cancel()
+        elif job.started_at is None:
+            self._counts[job.priority]["cancelled"] += 1
+            self._forget(job)
+        elif job.factory is None:
+            self._release(job, failed=False, cancelled=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """クラスごとの待ち行列・待ち時間・処理時間（秒）"""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "background_limit": self.background_limit,
+            "preempt_depth": self.preempt_depth,
+            "classes": {
+                cls: dict(
+                    self._counts[cls],
+                    queue_depth=self._queue_depth(cls),
+                    running=len(self._running[cls]),
+                    wait_time=self._wait_time[cls].summary(),
+                    service_time=self._service_time[cls].summary(),
+                )
+                for cls in PRIORITY_CLASSES
+            },
+        }
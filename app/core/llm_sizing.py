@@ -0,0 +1,184 @@
+"""
+生成トークン数・コンテキスト長の見積もり
+参考テンプレートの長さと宛先から num_predict / num_ctx を決め、
+実際の eval_count を学習して見積もりを補正する
+"""
+
+import math
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+
+# 初期見積もり（学習前）に使う値（トークン数）
+FREEFORM_EMAIL_TOKENS = 400  # 自由記述メール（200-500文字程度）
+FORMAT_OVERHEAD_TOKENS = 50  # 件名・回答形式の分
+THINKING_TOKENS = 400  # 思考モードで消費する分
+SHORT_TASK_TOKENS = {"analysis": 120, "next_action": 150, "summary": 300}
+RECIPIENT_FACTORS = {"CS": 1.0, "candidate": 1.0, "RA": 0.9}
+
+
+def estimate_tokens(text: str) -> int:
+    """おおよそのトークン数（日本語は約1.3文字、英数字は約4文字で1トークン）"""
+    if not text:
+        return 0
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return math.ceil(ascii_chars / 4 + (len(text) - ascii_chars) / 1.3)
+
+
+@dataclass
+class SizingPlan:
+    """1回の生成に使う num_predict / num_ctx"""
+    key: Tuple[str, str, str, bool]  # (タスク, テンプレート名, 宛先, 思考モード)
+    num_predict: int
+    num_ctx: int
+    source: str  # "prior"（初期見積もり） / "learned"（実績から）
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"num_predict": self.num_predict, "num_ctx": self.num_ctx, "source": self.source}
+
+
+class GenerationSizer:
+    """テンプレート・宛先ごとの出力トークン数を見積もり、実績から学習する
+
+    num_ctxを変えるとOllamaはモデルを再ロードするため、num_ctxは粗い段階（ctx_buckets）に丸める。
+    さらにモデルごとにロード済みの段階を覚えておき、それより小さい段階で足りる場合もロード済みの段階を使う
+    （段階が上がるのは、より長いコンテキストが必要になったときの1回だけ）。
+    テンプレート名からの見積もりには template_source が返すテンプレートを毎回使う
+    （TemplateEngineのスナップショットを渡せば、テンプレートの再読み込みがそのまま反映される）。
+    """
+
+    def __init__(
+        self,
+        template_source: Optional[Callable[[], Mapping[str, str]]] = None,
+        headroom: float = 1.3,
+        min_predict: int = 64,
+        max_predict: int = 4096,
+        ctx_buckets: Tuple[int, ...] = (4096, 8192, 16384),
+        min_samples: int = 3,
+        alpha: float = 0.2,
+    ):
+        self._template_source = template_source
+        self.headroom = headroom
+        self.min_predict = min_predict
+        self.max_predict = max_predict
+        self.ctx_buckets = tuple(sorted(ctx_buckets))
+        self.min_samples = min_samples
+        self.alpha = alpha
+        self._learned: Dict[Tuple, Dict[str, float]] = {}
+        self._loaded_ctx: Dict[str, int] = {}  # モデルごとのロード済みの num_ctx
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def set_template_source(self, template_source: Callable[[], Mapping[str, str]]) -> None:
+        """テンプレートの取得元を設定する（シングルトンの生成後にTemplateEngineとつなぐため）"""
+        self._template_source = template_source
+
+    @property
+    def templates(self) -> Mapping[str, str]:
+        if self._template_source is None:
+            return {}
+        return self._template_source()
+
+    def plan(
+        self,
+        task: str,
+        prompt: str,
+        template_name: Optional[str] = None,
+        reference_template: Optional[str] = None,
+        target_person: Optional[str] = None,
+        think: bool = False,
+        cap: Optional[int] = None,
+        model: Optional[str] = None,
+    ) -> SizingPlan:
+        """生成前に num_predict / num_ctx を決める（capはプロファイルの上限、modelはロード済みの段階の照合用）"""
+        key = (task, template_name or "", target_person or "", bool(think))
+        with self._lock:
+            learned = self._learned.get(key)
+        if learned is not None and learned["count"] >= self.min_samples:
+            # 平均 + 3×平均偏差（最低でも平均の1.2倍）を確保する
+            needed = max(learned["mean"] + 3 * learned["deviation"], learned["mean"] * 1.2)
+            source = "learned"
+        else:
+            needed = self._prior(task, template_name, reference_template, target_person, think) * self.headroom
+            source = "prior"
+
+        num_predict = min(max(math.ceil(needed), self.min_predict), self.max_predict)
+        if cap is not None:
+            num_predict = min(num_predict, cap)
+        num_ctx = self._context_size(estimate_tokens(prompt) + num_predict)
+        if model is not None:
+            with self._lock:
+                num_ctx = max(num_ctx, self._loaded_ctx.get(model, 0))
+                self._loaded_ctx[model] = num_ctx
+        return SizingPlan(key, num_predict, num_ctx, source)
+
+    def warmup_context(self, model: str) -> int:
+        """ウォームアップで使う num_ctx（ロード済みの段階。未ロードなら最小の段階として記録する）"""
+        with self._lock:
+            return self._loaded_ctx.setdefault(model, self.ctx_buckets[0])
+
+    def _prior(
+        self,
+        task: str,
+        template_name: Optional[str],
+        reference_template: Optional[str],
+        target_person: Optional[str],
+        think: bool,
+    ) -> float:
+        """学習前の見積もり（トークン数）"""
+        if task == "email":
+            template = reference_template or self.templates.get(template_name or "", "")
+            body = estimate_tokens(template) * 1.1 if template else FREEFORM_EMAIL_TOKENS
+            tokens = body * RECIPIENT_FACTORS.get(target_person or "", 1.0) + FORMAT_OVERHEAD_TOKENS
+        else:
+            tokens = SHORT_TASK_TOKENS.get(task, 300)
+        return tokens + (THINKING_TOKENS if think else 0)
+
+    def _context_size(self, tokens: int) -> int:
+        """必要なトークン数を収められる最小の段階"""
+        needed = tokens * 1.1
+        for bucket in self.ctx_buckets:
+            if bucket >= needed:
+                return bucket
+        return self.ctx_buckets[-1]
+
+    def observe(self, plan: SizingPlan, metrics: Dict[str, Any]) -> None:
+        """生成結果の eval_count を学習し、打ち切り・過大見積もりを集計する"""
+        eval_count = metrics.get("eval_count")
+        if not isinstance(eval_count, int):
+            return
+        truncated = metrics.get("done_reason") == "length" or eval_count >= plan.num_predict
+        oversized = not truncated and eval_count < plan.num_predict / 2
+
+        with self._lock:
+            stats = self._stats.setdefault(plan.key[0], {
+                "generations": 0, "truncated": 0, "oversized": 0, "requested_tokens": 0, "used_tokens": 0
+            })
+            stats["generations"] += 1
+            stats["truncated"] += truncated
+            stats["oversized"] += oversized
+            stats["requested_tokens"] += plan.num_predict
+            stats["used_tokens"] += eval_count
+
+            # 打ち切られた場合は実際の必要量が不明なので、上限の1.5倍を観測値として扱う
+            observed = eval_count * 1.5 if truncated else float(eval_count)
+            learned = self._learned.get(plan.key)
+            if learned is None:
+                self._learned[plan.key] = {"count": 1, "mean": observed, "deviation": observed * 0.25}
+                return
+            learned["count"] += 1
+            learned["deviation"] += self.alpha * (abs(observed - learned["mean"]) - learned["deviation"])
+            learned["mean"] += self.alpha * (observed - learned["mean"])
+
+    def stats(self) -> Dict[str, Any]:
+        """タスクごとの打ち切り・過大見積もりの件数"""
+        with self._lock:
+            result = {}
+            for task, stats in self._stats.items():
+                stats = dict(stats)
+                generations = stats["generations"]
+                stats["truncated_rate"] = round(stats["truncated"] / generations, 3)
+                stats["oversized_rate"] = round(stats["oversized"] / generations, 3)
+                stats["unused_tokens"] = stats["requested_tokens"] - stats["used_tokens"]
+                result[task] = stats
+            return {"tasks": result, "learned_keys": len(self._learned), "loaded_ctx": dict(self._loaded_ctx)}
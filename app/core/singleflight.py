@@ -0,0 +1,66 @@
+"""
+同一リクエストの同時実行抑止（single-flight）
+同じプロンプトフィンガープリントの生成が進行中であれば、
+後続の呼び出しは新たにOllamaを叩かずにその結果を共有する
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class _Call:
+    """進行中の呼び出し"""
+
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """キーごとに実行中のタスクを1つにまとめる"""
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._stats = {"executions": 0, "coalesced": 0, "upstream_cancelled": 0}
+
+    async def do(
+        self,
+        key: str,
+        factory: Callable[[], Awaitable[Any]],
+        on_join: Optional[Callable[[], None]] = None,
+    ) -> Any:
+        """keyが実行中なら相乗りし、なければfactory()を実行して結果を返す
+
+        待ち手は個別にキャンセルできる。全員がキャンセルした場合は実行中のタスクも止める。
+        相乗りした場合は on_join() を呼ぶ（実行中の処理の優先度を待ち手に合わせて上げるなど）。
+        """
+        loop = asyncio.get_running_loop()
+        call = self._calls.get(key)
+        if call is None or call.task.get_loop() is not loop:
+            call = _Call(loop.create_task(factory()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _task, key=key, call=call: self._forget(key, call))
+            self._stats["executions"] += 1
+        else:
+            self._stats["coalesced"] += 1
+            if on_join is not None:
+                on_join()
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+                self._stats["upstream_cancelled"] += 1
+
+    def _forget(self, key: str, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """相乗り件数などの統計"""
+        stats = dict(self._stats)
+        stats["in_flight"] = len(self._calls)
+        return stats
@@ -0,0 +1,193 @@
+"""
+ステータス文字列の照合
+status_classification.json のステータス名とキーワード表から Aho–Corasick のオートマトンを作り、
+自由記述のステータス（「一次面接日程調整中」など）を1回の走査で対応するテンプレート一覧に解決する。
+
+速さの大半は照合結果のキャッシュによる（同じステータス文字列は繰り返し現れる）。
+キャッシュなしの1件あたりの照合は、現在の15件程度の表では従来の部分一致ループ（最初の一致で打ち切る）より遅く、
+ステータスが数十〜100件程度で同等、それ以上で速くなる（scripts/bench_status_matcher.py で計測できる）。
+オートマトンにしたのは、優先順位（長い一致 > 先に現れる一致 > 表の順）を表の並びに依存せず決めるため。
+"""
+
+from bisect import bisect_right
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+# 優先順位（小さいほど優先）
+EXACT = "exact"  # ステータス名と完全一致
+STATUS = "status"  # 入力がステータス名を含む
+ABBREVIATION = "abbreviation"  # 入力がステータス名の一部（「面接」→「面接日程調整中」など）
+KEYWORD = "keyword"  # 入力がキーワードを含む
+NONE = "none"
+
+KEY_SEPARATOR = "\x00"
+
+
+class AhoCorasick:
+    """複数パターンの同時検索（パターンの出現をすべて列挙する）
+
+    失敗遷移をたどる代わりに、パターンに現れる文字について全状態の遷移先を求めておく（1文字 = 辞書参照1回）。
+    """
+
+    def __init__(self, patterns: Sequence[str]):
+        self.patterns = list(patterns)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self.outputs: List[List[int]] = [[]]
+        for index, pattern in enumerate(self.patterns):
+            if pattern:
+                self._add(pattern, index)
+        self._link()
+
+    def _add(self, pattern: str, index: int) -> None:
+        state = 0
+        for ch in pattern:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][ch] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self.outputs.append([])
+            state = next_state
+        self.outputs[state].append(index)
+
+    def _link(self) -> None:
+        """失敗遷移を幅優先で求め、失敗先の出力を引き継ぐ"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(ch, 0)
+                self.outputs[next_state] = self.outputs[next_state] + self.outputs[self._fail[next_state]]
+        # 幅優先の順に、失敗先の遷移を引き継いだ完全な遷移表を作る（失敗先は必ず先に処理済み）
+        self.transitions: List[Dict[str, int]] = [dict(self._goto[0])] + [{} for _ in self._goto[1:]]
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            self.transitions[state] = dict(self.transitions[self._fail[state]], **self._goto[state])
+            queue.extend(self._goto[state].values())
+
+    def finditer(self, text: str) -> Iterator[Tuple[int, int]]:
+        """(開始位置, パターン番号) を出現順に返す"""
+        delta, output, lengths = self.transitions, self.outputs, [len(p) for p in self.patterns]
+        state = 0
+        for position, ch in enumerate(text):
+            state = delta[state].get(ch, 0)
+            for index in output[state]:
+                yield position + 1 - lengths[index], index
+
+    @property
+    def states(self) -> int:
+        return len(self._goto)
+
+
+@dataclass
+class StatusMatch:
+    """照合結果"""
+    templates: List[str]
+    kind: str = NONE
+    matched: str = ""  # 一致したステータス名・キーワード
+    candidates: List[str] = field(default_factory=list)  # 同じ優先順位で一致したもの（採用したものを含む）
+
+
+class StatusMatcher:
+    """ステータス文字列を、決まった優先順位でテンプレート一覧に解決する
+
+    優先順位は 完全一致 > ステータス名を含む > ステータス名の一部 > キーワードを含む。
+    同じ順位で複数一致した場合は、長いもの > 入力中で先に現れるもの > 表の順 で選ぶ。
+    「ステータス名の一部」は表の順で最初に含むステータス名を選ぶ。
+    """
+
+    def __init__(
+        self,
+        status_mapping: Dict[str, List[str]],
+        keywords_mapping: Dict[str, List[str]],
+        cache_size: int = 4096,
+    ):
+        self.status_mapping = status_mapping
+        self.keywords_mapping = keywords_mapping
+        self._statuses = list(status_mapping)
+        self._keywords = list(keywords_mapping)
+        # ステータス名・キーワードを1つのオートマトンにまとめる（番号がステータス数未満ならステータス名）
+        self._automaton = AhoCorasick(self._statuses + self._keywords)
+        boundary = len(self._statuses)
+        # 状態ごとの出力を (種別, 長さの符号反転, パターン番号) にしておく
+        self._hits = [
+            tuple((index >= boundary, -len(self._automaton.patterns[index]), index) for index in output)
+            for output in self._automaton.outputs
+        ]
+        # 「入力がステータス名の一部」の判定用（区切り文字で連結した全ステータス名を1回検索する）
+        self._joined = KEY_SEPARATOR.join(self._statuses)
+        self._offsets = []
+        offset = 0
+        for status in self._statuses:
+            self._offsets.append(offset)
+            offset += len(status) + len(KEY_SEPARATOR)
+        # 同じステータス文字列は繰り返し照合されるため、結果を保持する（上限を超えたら古いものから捨てる）
+        self.cache_size = cache_size
+        self._cache: Dict[str, StatusMatch] = {}
+
+    def match(self, status: str) -> StatusMatch:
+        """ステータス文字列に対応するテンプレート一覧を求める"""
+        result = self._cache.get(status)
+        if result is None:
+            result = self._match(status)
+            if self.cache_size:
+                if len(self._cache) >= self.cache_size:
+                    del self._cache[next(iter(self._cache))]
+                self._cache[status] = result
+        return result
+
+    def _match(self, status: str) -> StatusMatch:
+        if status in self.status_mapping:
+            return StatusMatch(self.status_mapping[status], EXACT, status, [status])
+
+        status_hits: List[Tuple[int, int, int]] = []
+        keyword_hits: List[Tuple[int, int, int]] = []
+        delta, outputs = self._automaton.transitions, self._hits
+        state = 0
+        for position, ch in enumerate(status):
+            state = delta[state].get(ch, 0)
+            for is_keyword, negative_length, index in outputs[state]:
+                (keyword_hits if is_keyword else status_hits).append(
+                    (negative_length, position + 1 + negative_length, index)
+                )
+
+        if status_hits:
+            return self._pick(STATUS, status_hits)
+
+        if KEY_SEPARATOR not in status:
+            position = self._joined.find(status)
+            if position >= 0:
+                matched = self._statuses[self._owner(position)]
+                return StatusMatch(self.status_mapping[matched], ABBREVIATION, matched, [matched])
+
+        if keyword_hits:
+            return self._pick(KEYWORD, keyword_hits)
+        return StatusMatch([])
+
+    def _pick(self, kind: str, hits: List[Tuple[int, int, int]]) -> StatusMatch:
+        _, _, index = min(hits)
+        patterns = self._automaton.patterns
+        matched = patterns[index]
+        mapping = self.status_mapping if kind == STATUS else self.keywords_mapping
+        candidates = list(dict.fromkeys(patterns[i] for _, _, i in sorted(hits)))
+        return StatusMatch(mapping[matched], kind, matched, candidates)
+
+    def _owner(self, position: int) -> int:
+        """連結文字列中の位置から、それを含むステータス名の番号を求める"""
+        return bisect_right(self._offsets, position) - 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "statuses": len(self._statuses),
+            "keywords": len(self._keywords),
+            "states": self._automaton.states,
+            "cached": len(self._cache),
+        }
@@ -0,0 +1,176 @@
+"""
+ストリーミング応答パーサー
+Qwen3のトークンストリームから<think>ブロックを除去し、
+件名・本文を逐次イベントとして取り出す
+"""
+
+from typing import List, Optional, Tuple
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+# 行頭マーカーと対応するセクション
+SECTION_MARKERS = {
+    "件名:": "subject",
+    "件名：": "subject",
+    "本文:": "body",
+    "本文：": "body",
+}
+
+
+def _partial_suffix_length(text: str, tag: str) -> int:
+    """textの末尾がtagの先頭部分と一致する最大長を返す"""
+    for length in range(min(len(tag) - 1, len(text)), 0, -1):
+        if text.endswith(tag[:length]):
+            return length
+    return 0
+
+
+class EmailStreamParser:
+    """件名・本文の逐次パーサー
+
+    feed()にトークン片を渡すと ("subject" | "body", テキスト差分) のリストを返す。
+    マーカーが現れる前のテキストは、非ストリーミング版のパーサーと同じく本文として扱う。
+    件名の行が再び現れた場合は、非ストリーミング版と同じく後の件名を採用する
+    （("subject_reset", "") を返すので、受け取った件名を捨てる）。
+    """
+
+    def __init__(self):
+        self._tag_buffer = ""
+        self._in_think = False
+        self._think_text = ""  # 閉じていない<think>の中身（ストリームが終わった場合に件名・本文を探す）
+        self._seen_visible = False
+        self._section: Optional[str] = None
+        self._line_start = True
+        self._pending = ""
+        self._skip_space = False
+        self._subject_closed = False
+        self._subject_started = False
+        self._body_started = False
+        self._events: List[Tuple[str, str]] = []
+
+    def feed(self, chunk: str) -> List[Tuple[str, str]]:
+        """トークン片を処理してイベントを返す"""
+        self._consume_visible(self._strip_think(chunk))
+        return self._take_events()
+
+    def close(self) -> List[Tuple[str, str]]:
+        """ストリーム終了時に保留中のテキストを吐き出す"""
+        if self._in_think:
+            # </think>が来ないまま終わった場合は、非ストリーミング版と同じく思考部分から件名・本文を取り出す
+            self._in_think = False
+            self._consume_visible(self._recover_unclosed_think(self._think_text + self._tag_buffer))
+        elif self._tag_buffer:
+            self._consume_visible(self._tag_buffer)
+        self._tag_buffer = ""
+        self._think_text = ""
+        if self._pending.strip():
+            self._emit(self._pending)
+        self._pending = ""
+        return self._take_events()
+
+    def _strip_think(self, chunk: str) -> str:
+        """<think>...</think>を到着順に除去する"""
+        buffer = self._tag_buffer + chunk
+        visible = []
+        while buffer:
+            if self._in_think:
+                end_idx = buffer.find(THINK_CLOSE)
+                if end_idx < 0:
+                    hold = _partial_suffix_length(buffer, THINK_CLOSE)
+                    self._think_text += buffer[:len(buffer) - hold]
+                    buffer = buffer[len(buffer) - hold:]
+                    break
+                buffer = buffer[end_idx + len(THINK_CLOSE):]
+                self._in_think = False
+                self._think_text = ""
+            else:
+                start_idx = buffer.find(THINK_OPEN)
+                if start_idx < 0:
+                    hold = _partial_suffix_length(buffer, THINK_OPEN)
+                    visible.append(buffer[:len(buffer) - hold])
+                    buffer = buffer[len(buffer) - hold:]
+                    break
+                visible.append(buffer[:start_idx])
+                buffer = buffer[start_idx + len(THINK_OPEN):]
+                self._in_think = True
+        self._tag_buffer = buffer
+        return "".join(visible)
+
+    def _recover_unclosed_think(self, text: str) -> str:
+        """閉じていない<think>の中身のうち、表示するテキスト
+
+        件名・本文の行があればそこから先を、なければ<think>より前に何もなかった場合に限り全体を返す。
+        """
+        lines = text.split("\n")
+        for index, line in enumerate(lines):
+            if line.strip().startswith(tuple(SECTION_MARKERS)):
+                return "\n".join(lines[index:])
+        return "" if self._seen_visible else text
+
+    def _consume_visible(self, text: str) -> None:
+        """思考部分を除いたテキストを行単位でセクションに振り分ける"""
+        if text.strip():
+            self._seen_visible = True
+        for char in text:
+            if char == "\n":
+                if self._pending.strip():
+                    self._emit(self._pending)
+                self._pending = ""
+                if self._section == "subject":
+                    self._subject_closed = True
+                else:
+                    self._emit("\n")
+                self._line_start = True
+                self._skip_space = False
+                continue
+
+            if self._line_start:
+                self._pending += char
+                stripped = self._pending.lstrip()
+                if not stripped:
+                    continue
+                if stripped in SECTION_MARKERS:
+                    self._section = SECTION_MARKERS[stripped]
+                    if self._section == "subject":
+                        self._subject_closed = False
+                        if self._subject_started:
+                            self._events.append(("subject_reset", ""))
+                            self._subject_started = False
+                    self._pending = ""
+                    self._line_start = False
+                    self._skip_space = True
+                    continue
+                if any(marker.startswith(stripped) for marker in SECTION_MARKERS):
+                    continue
+                self._line_start = False
+                pending, self._pending = self._pending, ""
+                self._emit(pending)
+                continue
+
+            if self._skip_space and char in " 　\t":
+                continue
+            self._skip_space = False
+            self._emit(char)
+
+    def _emit(self, text: str) -> None:
+        """現在のセクションにテキストを追加する"""
+        if self._section == "subject":
+            if self._subject_closed:
+                return
+            self._subject_started = True
+            event = "subject"
+        else:
+            # 本文冒頭の空行は送らない
+            if not self._body_started and not text.strip():
+                return
+            self._body_started = True
+            event = "body"
+        if self._events and self._events[-1][0] == event:
+            self._events[-1] = (event, self._events[-1][1] + text)
+        else:
+            self._events.append((event, text))
+
+    def _take_events(self) -> List[Tuple[str, str]]:
+        events, self._events = self._events, []
+        return events
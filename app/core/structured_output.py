@@ -0,0 +1,145 @@
+"""
+構造化出力（Ollama format / JSONスキーマ）
+LLM応答を行単位の文字列マッチではなく、JSONスキーマで制約した上で
+型付きの結果オブジェクトとして検証する
+"""
+
+import json
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+THINK_BLOCK_PATTERN = re.compile(r"<think>.*?</think>", re.DOTALL)
+
+# 検証に失敗した場合に1回だけ付け加える再指示
+STRUCTURED_RETRY_NOTE = """
+
+## 注意
+前回の回答は指定のJSON形式として解釈できませんでした。
+説明や前置きは付けず、指定されたキーをすべて含むJSONオブジェクトのみを出力してください。"""
+
+
+def load_json_object(text: str) -> Optional[Dict[str, Any]]:
+    """応答テキストからJSONオブジェクトを取り出す（失敗時はNone）"""
+    text = THINK_BLOCK_PATTERN.sub("", text or "")
+    start = text.find("{")
+    end = text.rfind("}")
+    if start < 0 or end <= start:
+        return None
+    try:
+        data = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _non_empty_str(value: Any) -> Optional[str]:
+    if isinstance(value, str) and value.strip():
+        return value.strip()
+    return None
+
+
+def _unit_score(value: Any) -> Optional[float]:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    value = float(value)
+    return value if 0.0 <= value <= 1.0 else None
+
+
+@dataclass
+class EmailDraft:
+    """メール文面の生成結果"""
+    subject: str
+    body: str
+
+    @staticmethod
+    def json_schema() -> Dict[str, Any]:
+        return {
+            "type": "object",
+            "properties": {
+                "subject": {"type": "string"},
+                "body": {"type": "string"},
+            },
+            "required": ["subject", "body"],
+        }
+
+    @classmethod
+    def parse(cls, text: str) -> Optional["EmailDraft"]:
+        data = load_json_object(text)
+        if data is None:
+            return None
+        subject = _non_empty_str(data.get("subject"))
+        body = _non_empty_str(data.get("body"))
+        if subject is None or body is None:
+            return None
+        return cls(subject=subject, body=body)
+
+
+@dataclass
+class EmailAnalysis:
+    """メール分析の結果"""
+    enthusiasm_score: float
+    concern_score: float
+    analysis_reason: str
+
+    @staticmethod
+    def json_schema() -> Dict[str, Any]:
+        return {
+            "type": "object",
+            "properties": {
+                "enthusiasm_score": {"type": "number", "minimum": 0, "maximum": 1},
+                "concern_score": {"type": "number", "minimum": 0, "maximum": 1},
+                "analysis_reason": {"type": "string"},
+            },
+            "required": ["enthusiasm_score", "concern_score", "analysis_reason"],
+        }
+
+    @classmethod
+    def parse(cls, text: str) -> Optional["EmailAnalysis"]:
+        data = load_json_object(text)
+        if data is None:
+            return None
+        enthusiasm_score = _unit_score(data.get("enthusiasm_score"))
+        concern_score = _unit_score(data.get("concern_score"))
+        analysis_reason = _non_empty_str(data.get("analysis_reason"))
+        if enthusiasm_score is None or concern_score is None or analysis_reason is None:
+            return None
+        return cls(
+            enthusiasm_score=enthusiasm_score,
+            concern_score=concern_score,
+            analysis_reason=analysis_reason,
+        )
+
+
+@dataclass
+class NextActionSuggestion:
+    """ネクストアクションの提案結果"""
+    action: str
+    reason: str
+    priority: str
+
+    PRIORITIES = ("高", "中", "低")
+
+    @classmethod
+    def json_schema(cls) -> Dict[str, Any]:
+        return {
+            "type": "object",
+            "properties": {
+                "action": {"type": "string"},
+                "reason": {"type": "string"},
+                "priority": {"type": "string", "enum": list(cls.PRIORITIES)},
+            },
+            "required": ["action", "reason", "priority"],
+        }
+
+    @classmethod
+    def parse(cls, text: str) -> Optional["NextActionSuggestion"]:
+        data = load_json_object(text)
+        if data is None:
+            return None
+        action = _non_empty_str(data.get("action"))
+        reason = _non_empty_str(data.get("reason"))
+        priority = _non_empty_str(data.get("priority"))
+        if action is None or reason is None or priority not in cls.PRIORITIES:
+            return None
+        return cls(action=action, reason=reason, priority=priority)
@@ -0,0 +1,104 @@
+"""
+テンプレート関連性スコアの一括計算
+複数の応募 × 全テンプレートの関連性スコアを NumPy でまとめて計算する。
+TemplateEngine._score_features と同じ規則・同じ順序の浮動小数点演算で求めるため、結果は完全に一致する。
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+RECENT_MESSAGES = 3  # 減点の対象にする直近の件名の数
+
+
+class BatchRelevanceScorer:
+    """テンプレートのスナップショットから作る一括スコア計算器（スナップショットごとに作り直す）"""
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.names: List[str] = list(snapshot.template_index)
+        features = [snapshot.template_index[name] for name in self.names]
+        self.positive = np.array([f.is_thanks or f.congratulates for f in features], dtype=bool)
+        self.asks = np.array([f.asks for f in features], dtype=bool)
+        self.addresses_concern = np.array([f.addresses_concern for f in features], dtype=bool)
+        self._names_lower = [f.name_lower for f in features]
+        # 件名ごとの、件名に含まれるテンプレートの列番号（同じ件名は繰り返し現れるため保持する）
+        self._subject_columns: Dict[str, Tuple[int, ...]] = {}
+        self._statuses: Dict[str, int] = {}
+        self._status_match = np.zeros((0, len(self.names)), dtype=bool)
+        self._status_position = np.zeros((0, len(self.names)), dtype=np.int64)
+
+    def status_ids(self, statuses: Sequence[str]) -> np.ndarray:
+        """ステータス文字列を番号に変換する（初めてのステータスはテンプレート名との一致・適用可否を求めておく）"""
+        new = [status for status in dict.fromkeys(statuses) if status not in self._statuses]
+        if new:
+            matches = np.zeros((len(new), len(self.names)), dtype=bool)
+            # 適用できないテンプレートは推奨の並び順で最後になる
+            positions = np.full((len(new), len(self.names)), np.iinfo(np.int64).max, dtype=np.int64)
+            index = {name: column for column, name in enumerate(self.names)}
+            for row, status in enumerate(new):
+                matches[row] = [status in name or name in status for name in self.names]
+                for position, name in enumerate(self.snapshot.status_matcher.match(status).templates):
+                    column = index.get(name)
+                    if column is not None and positions[row, column] > position:
+                        positions[row, column] = position
+                self._statuses[status] = len(self._statuses)
+            self._status_match = np.vstack([self._status_match, matches])
+            self._status_position = np.vstack([self._status_position, positions])
+        return np.array([self._statuses[status] for status in statuses], dtype=np.int64)
+
+    def recent_flags(self, histories: Sequence[Optional[List[Dict]]]) -> np.ndarray:
+        """直近の件名ごとに、テンプレート名を含むかどうか（応募 × 件名 × テンプレート）"""
+        flags = np.zeros((len(histories), RECENT_MESSAGES, len(self.names)), dtype=bool)
+        rows, slots, columns = [], [], []
+        for row, history in enumerate(histories):
+            for slot, message in enumerate((history or [])[-RECENT_MESSAGES:]):
+                subject = message.get('subject', '')
+                matched = self._subject_columns.get(subject)
+                if matched is None:
+                    lowered = subject.lower()
+                    matched = tuple(column for column, name in enumerate(self._names_lower) if name in lowered)
+                    self._subject_columns[subject] = matched
+                for column in matched:
+                    rows.append(row)
+                    slots.append(slot)
+                    columns.append(column)
+        flags[rows, slots, columns] = True
+        return flags
+
+    def score_matrix(
+        self,
+        enthusiasm: np.ndarray,
+        concern: np.ndarray,
+        status_ids: np.ndarray,
+        recent: np.ndarray,
+    ) -> np.ndarray:
+        """応募 × テンプレートの関連性スコア（_score_features と同じ順序で加減算する）"""
+        enthusiasm = np.asarray(enthusiasm, dtype=np.float64)[:, None]
+        concern = np.asarray(concern, dtype=np.float64)[:, None]
+        score = np.full((len(status_ids), len(self.names)), 0.5)
+        # ステータスマッチング
+        score = score + np.where(self._status_match[status_ids], 0.3, 0.0)
+        # 熱意・懸念スコアによる調整
+        score = score + np.where(
+            enthusiasm > 0.8,
+            np.where(self.positive, 0.2, 0.0),
+            np.where((enthusiasm < 0.5) & self.asks, 0.1, 0.0),
+        )
+        score = score + np.where((concern > 0.6) & self.addresses_concern, 0.2, 0.0)
+        # メッセージ履歴による調整（件名1件ごとに減点する）
+        for slot in range(recent.shape[1]):
+            score = score - np.where(recent[:, slot], 0.1, 0.0)
+        return np.minimum(1.0, np.maximum(0.0, score))
+
+    def top_k(self, scores: np.ndarray, status_ids: np.ndarray, k: int) -> List[List[Tuple[int, float]]]:
+        """応募ごとに、適用できるテンプレートをスコアの高い順（同点は推奨一覧の順）にk件選ぶ"""
+        positions = self._status_position[status_ids]
+        applicable = positions != np.iinfo(np.int64).max
+        order = np.lexsort((positions, -np.where(applicable, scores, -np.inf)), axis=-1)[:, :k]
+        selected = np.take_along_axis(applicable, order, axis=1).tolist()
+        selected_scores = np.take_along_axis(scores, order, axis=1).tolist()
+        return [
+            [(column, score) for column, score, ok in zip(columns, row_scores, row_selected) if ok]
+            for columns, row_scores, row_selected in zip(order.tolist(), selected_scores, selected)
+        ]
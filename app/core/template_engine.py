@@ -4,13 +4,40 @@
 Qwen3での文章生成をサポートする
 """
 
+import asyncio
+import hashlib
 import json
 import re
+import threading
+import time
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple
+from types import MappingProxyType
+from typing import Any, List, Dict, Mapping, Optional, Tuple
 from dataclasses import dataclass
 from enum import Enum
 
+from app.core.status_matcher import StatusMatcher
+from app.core.template_batch import BatchRelevanceScorer
+from app.core.template_fill import (
+    CANDIDATE_NAME, COMPANY, JOB_TITLE, FillPlan, FilledDraft, compile_fill_plan, render_fill_plan
+)
+
+# テンプレート中の差し込み箇所（●●・○○など）
+PLACEHOLDER_PATTERN = re.compile(r"[●○]{2,}")
+
+# ステータス名に一致しない場合に使うキーワードとテンプレート
+STATUS_KEYWORDS = {
+    "登録": ["登録お礼"],
+    "面談": ["面談お礼", "リマインド"],
+    "求人": ["求人紹介", "応募書類リマインド"],
+    "応募": ["応募お礼"],
+    "書類": ["書類通過(CA→CS)", "書類お見送り"],
+    "面接": ["面接感想依頼", "日程最終確認(CA→CS)", "面接結果＋日程調整(CA→CS)"],
+    "意向": ["意向確認(CA→CS)"],
+    "内定": ["内定連絡(CA→CS)", "正式内定ログ(CA→CS)"],
+    "退職": ["退職交渉ログ(CA→CS)"]
+}
+
 class TemplateType(Enum):
     """テンプレートタイプ"""
     INITIAL = "初期段階"
@@ -33,6 +60,7 @@ class TemplateRecommendation:
     receiver: str
     template_type: TemplateType
     customization_hints: List[str]
+    template_version: Optional[int] = None  # 推奨に使ったテンプレートの版
 
 @dataclass
 class StatusContext:
@@ -46,20 +74,90 @@ class StatusContext:
     latest_summary: str
     message_history: List[Dict] = None
 
+@dataclass(frozen=True)
+class TemplateFeatures:
+    """テンプレート自体から決まる特徴（読み込み時に1回だけ求める）"""
+    name: str
+    content: str
+    sender: str
+    receiver: str
+    template_type: TemplateType
+    is_thanks: bool  # 名前に「お礼」
+    congratulates: bool  # 本文に「おめでとう」
+    asks: bool  # 名前に「確認」または「依頼」
+    addresses_concern: bool  # 名前に「追加情報」または「意向確認」
+    name_lower: str
+    trait_reason: Optional[str]  # テンプレート特性による推奨理由
+    trait_hint: Optional[str]  # テンプレート固有のカスタマイズヒント
+    length: int
+    placeholders: Tuple[Tuple[int, int], ...]  # 差し込み箇所の (開始, 終了) 位置
+    fill_plan: FillPlan  # 応募の情報を差し込むための分解結果
+
+@dataclass(frozen=True)
+class TemplateSnapshot:
+    """ある時点のテンプレート・ステータス対応表と、そこから作った索引（更新時は丸ごと差し替える）"""
+    version: int
+    templates: Mapping[str, str]
+    status_mapping: Mapping[str, List[str]]
+    template_index: Mapping[str, TemplateFeatures]
+    status_matcher: StatusMatcher
+    loaded_at: float
+    missing_templates: Tuple[str, ...]  # ステータス対応表にあるがテンプレートが存在しないもの
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "templates": len(self.templates),
+            "statuses": len(self.status_mapping),
+            "loaded_at": self.loaded_at,
+            "missing_templates": list(self.missing_templates),
+        }
+
 class TemplateEngine:
-    """テンプレート提案エンジン"""
+    """テンプレート提案エンジン
+    
+    テンプレートとステータス対応表はスナップショットとして保持する。reload()（またはstart_watching()）で
+    ファイルの変更を検出すると新しいスナップショットを作って差し替え、処理中のリクエストは古いものを使い続ける。
+    """
+    
+    def __init__(self, template_path: str = "extracted_templates.json", status_path: str = "status_classification.json"):
+        self.template_path = Path(template_path)
+        self.status_path = Path(status_path)
+        # ファイルごとの (mtime, 内容のハッシュ)
+        self._sources: Dict[Path, Tuple[int, str]] = {}
+        self._reload_lock = threading.Lock()
+        self._watch_task: Optional["asyncio.Task"] = None
+        self._batch_scorer: Optional[BatchRelevanceScorer] = None
+        self._stats = {"checks": 0, "reloads": 0, "failures": 0, "compiled_templates": 0}
+        self._snapshot = self._build_snapshot(self._load_templates(), self._load_status_mapping())
+    
+    @property
+    def snapshot(self) -> TemplateSnapshot:
+        """現在のスナップショット（1回の処理の中ではこれを取得して使い続ける）"""
+        return self._snapshot
     
-    def __init__(self):
-        self.templates = self._load_templates()
-        self.status_mapping = self._load_status_mapping()
+    @property
+    def templates(self) -> Mapping[str, str]:
+        return self._snapshot.templates
+    
+    @property
+    def status_mapping(self) -> Mapping[str, List[str]]:
+        return self._snapshot.status_mapping
+    
+    @property
+    def template_index(self) -> Mapping[str, TemplateFeatures]:
+        return self._snapshot.template_index
+    
+    @property
+    def status_matcher(self) -> StatusMatcher:
+        return self._snapshot.status_matcher
         
     def _load_templates(self) -> Dict[str, str]:
         """抽出されたテンプレートを読み込み"""
         try:
-            template_file = Path("extracted_templates.json")
-            if template_file.exists():
-                with open(template_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+            raw = self._read_if_changed(self.template_path, force=True)
+            if raw is not None:
+                return self._parse_templates(raw)
             else:
                 # フォールバック: デフォルトテンプレート
                 return self._get_default_templates()
@@ -70,21 +168,144 @@ class TemplateEngine:
     def _load_status_mapping(self) -> Dict[str, List[str]]:
         """ステータスとテンプレートのマッピングを読み込み"""
         try:
-            status_file = Path("status_classification.json")
-            if status_file.exists():
-                with open(status_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    # available_templatesを抽出
-                    mapping = {}
-                    for status, info in data.items():
-                        mapping[status] = info.get("available_templates", [])
-                    return mapping
+            raw = self._read_if_changed(self.status_path, force=True)
+            if raw is not None:
+                return self._parse_status_mapping(raw)
             else:
                 return self._get_default_status_mapping()
         except Exception as e:
             print(f"ステータスマッピング読み込みエラー: {e}")
             return self._get_default_status_mapping()
     
+    def _read_if_changed(self, path: Path, force: bool = False) -> Optional[bytes]:
+        """前回読んだときから内容が変わっていればファイルの中身を返す（mtimeが同じならハッシュも求めない）"""
+        try:
+            mtime = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            # 書き換えの途中などで一時的に存在しない場合は、現在の内容を使い続ける
+            return None
+        previous = self._sources.get(path)
+        if not force and previous is not None and previous[0] == mtime:
+            return None
+        raw = path.read_bytes()
+        digest = hashlib.sha256(raw).hexdigest()
+        self._sources[path] = (mtime, digest)
+        if not force and previous is not None and previous[1] == digest:
+            return None
+        return raw
+    
+    def _parse_templates(self, raw: bytes) -> Dict[str, str]:
+        """テンプレートファイル（名前 → 本文）を読み取り、形式を検証する"""
+        data = json.loads(raw.decode("utf-8"))
+        if not isinstance(data, dict) or not data:
+            raise ValueError("テンプレートは「名前 → 本文」の空でないオブジェクトである必要があります")
+        invalid = [name for name, content in data.items() if not isinstance(content, str)]
+        if invalid:
+            raise ValueError(f"本文が文字列ではないテンプレートがあります: {invalid[:5]}")
+        return data
+    
+    def _parse_status_mapping(self, raw: bytes) -> Dict[str, List[str]]:
+        """ステータス分類ファイルから available_templates を取り出し、形式を検証する"""
+        data = json.loads(raw.decode("utf-8"))
+        if not isinstance(data, dict) or not data:
+            raise ValueError("ステータス分類は「ステータス → 情報」の空でないオブジェクトである必要があります")
+        # available_templatesを抽出
+        mapping = {}
+        for status, info in data.items():
+            templates = info.get("available_templates", []) if isinstance(info, dict) else None
+            if not isinstance(templates, list) or not all(isinstance(name, str) for name in templates):
+                raise ValueError(f"ステータス「{status}」のavailable_templatesが不正です")
+            mapping[status] = templates
+        return mapping
+    
+    def _build_snapshot(
+        self,
+        templates: Mapping[str, str],
+        status_mapping: Mapping[str, List[str]],
+        previous: Optional[TemplateSnapshot] = None,
+    ) -> TemplateSnapshot:
+        """新しいスナップショットを作る（前の版と本文が同じテンプレート・同じ対応表は作り直さない）"""
+        index = {}
+        for name, content in templates.items():
+            features = previous.template_index.get(name) if previous else None
+            if features is None or features.content != content:
+                features = self._compile_template(name, content)
+                self._stats["compiled_templates"] += 1
+            index[name] = features
+        if previous is not None and status_mapping is previous.status_mapping:
+            matcher = previous.status_matcher
+        else:
+            matcher = StatusMatcher(status_mapping, STATUS_KEYWORDS)
+        missing = dict.fromkeys(
+            name for names in status_mapping.values() for name in names if name not in templates
+        )
+        return TemplateSnapshot(
+            version=previous.version + 1 if previous else 1,
+            templates=MappingProxyType(dict(templates)),
+            status_mapping=status_mapping if previous and status_mapping is previous.status_mapping
+            else MappingProxyType(dict(status_mapping)),
+            template_index=MappingProxyType(index),
+            status_matcher=matcher,
+            loaded_at=time.time(),
+            missing_templates=tuple(missing),
+        )
+    
+    def _reload_source(self, path: Path, parse, force: bool):
+        """変更があったファイルだけを読み直す（不正な内容なら None を返して現在のものを使い続ける）"""
+        try:
+            raw = self._read_if_changed(path, force)
+            return parse(raw) if raw is not None else None
+        except Exception as e:
+            # 同じ内容のまま再度読み直さないよう、ハッシュは記録したままにする（ファイルが直れば次の変更で読む）
+            self._stats["failures"] += 1
+            print(f"テンプレート再読み込みエラー ({path}、版{self._snapshot.version}を使い続けます): {e}")
+            return None
+    
+    def reload(self, force: bool = False) -> bool:
+        """テンプレート・ステータス分類のファイルが変わっていれば読み直し、スナップショットを差し替える
+        
+        検証を通った場合だけ差し替える。差し替えた場合はTrueを返す。
+        """
+        with self._reload_lock:
+            self._stats["checks"] += 1
+            current = self._snapshot
+            templates = self._reload_source(self.template_path, self._parse_templates, force)
+            status_mapping = self._reload_source(self.status_path, self._parse_status_mapping, force)
+            if templates is None and status_mapping is None:
+                return False
+            self._snapshot = self._build_snapshot(
+                current.templates if templates is None else templates,
+                current.status_mapping if status_mapping is None else status_mapping,
+                previous=current
+            )
+            self._stats["reloads"] += 1
+            print(f"テンプレートを再読み込みしました（版{self._snapshot.version}）")
+            return True
+    
+    def start_watching(self, interval: float = 5.0) -> None:
+        """定期的にファイルの変更を確認する（読み込み・検証はイベントループの外で行う）"""
+        if self._watch_task is not None and not self._watch_task.done():
+            return
+        
+        async def loop():
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    await asyncio.to_thread(self.reload)
+                except Exception as e:
+                    print(f"テンプレート監視エラー: {e}")
+        
+        self._watch_task = asyncio.get_running_loop().create_task(loop())
+    
+    def stop_watching(self) -> None:
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            self._watch_task = None
+    
+    def stats(self) -> Dict[str, Any]:
+        """現在の版と、再読み込み・再計算したテンプレートの件数"""
+        return dict(self._stats, **self._snapshot.info())
+    
     def _get_default_templates(self) -> Dict[str, str]:
         """デフォルトテンプレート"""
         return {
@@ -103,88 +324,120 @@ class TemplateEngine:
             "内定": ["内定連絡(CA→CS)"]
         }
     
-    def recommend_templates(self, context: StatusContext) -> List[TemplateRecommendation]:
-        """ステータスコンテキストに基づいてテンプレートを推奨"""
+    def _compile_template(self, template_name: str, template_content: str) -> TemplateFeatures:
+        """テンプレート名・本文の文字列検査をまとめて行う"""
+        sender, receiver = self._determine_sender_receiver(template_name)
+        if "お礼" in template_name:
+            trait_reason = "感謝の気持ちを伝える重要なタイミング"
+        elif "確認" in template_name:
+            trait_reason = "状況確認が必要な段階"
+        elif "調整" in template_name:
+            trait_reason = "日程調整が必要な段階"
+        else:
+            trait_reason = None
+        if "日程" in template_name:
+            trait_hint = "具体的な日時候補を複数提示"
+        elif "内定" in template_name:
+            trait_hint = "条件詳細と回答期限を明確に記載"
+        elif "面接" in template_name:
+            trait_hint = "面接内容と準備事項を具体的に説明"
+        else:
+            trait_hint = None
+        return TemplateFeatures(
+            name=template_name,
+            content=template_content,
+            sender=sender,
+            receiver=receiver,
+            template_type=self._determine_template_type(template_name),
+            is_thanks="お礼" in template_name,
+            congratulates="おめでとう" in template_content,
+            asks="確認" in template_name or "依頼" in template_name,
+            addresses_concern="追加情報" in template_name or "意向確認" in template_name,
+            name_lower=template_name.lower(),
+            trait_reason=trait_reason,
+            trait_hint=trait_hint,
+            length=len(template_content),
+            placeholders=tuple(m.span() for m in PLACEHOLDER_PATTERN.finditer(template_content)),
+            fill_plan=compile_fill_plan(template_name, template_content),
+        )
+    
+    def recommend_templates(
+        self, context: StatusContext, snapshot: Optional[TemplateSnapshot] = None
+    ) -> List[TemplateRecommendation]:
+        """ステータスコンテキストに基づいてテンプレートを推奨（snapshot省略時は現在の版）"""
         recommendations = []
+        # 処理の途中でテンプレートが差し替わっても、同じ版で推奨する
+        snapshot = snapshot or self._snapshot
         
         # 現在のステータスに対応するテンプレートを取得
-        applicable_templates = self._get_applicable_templates(context.current_status)
+        applicable_templates = snapshot.status_matcher.match(context.current_status).templates
+        recent_subjects = [
+            msg.get('subject', '').lower() for msg in (context.message_history or [])[-3:]
+        ]
         
         for template_name in applicable_templates:
-            if template_name in self.templates:
-                template_content = self.templates[template_name]
-                
-                # 関連性スコアを計算
-                relevance_score = self._calculate_relevance_score(
-                    template_name, template_content, context
-                )
-                
-                # 推奨理由を生成
-                reason = self._generate_recommendation_reason(
-                    template_name, context
-                )
-                
-                # 送信者・受信者を判定
-                sender, receiver = self._determine_sender_receiver(template_name)
-                
-                # テンプレートタイプを判定
-                template_type = self._determine_template_type(template_name)
-                
-                # カスタマイズヒントを生成
-                customization_hints = self._generate_customization_hints(
-                    template_name, context
-                )
-                
-                recommendation = TemplateRecommendation(
-                    template_name=template_name,
-                    template_content=template_content,
-                    relevance_score=relevance_score,
-                    reason=reason,
-                    sender=sender,
-                    receiver=receiver,
-                    template_type=template_type,
-                    customization_hints=customization_hints
-                )
-                
-                recommendations.append(recommendation)
+            features = snapshot.template_index.get(template_name)
+            if features is None:
+                continue
+            
+            recommendation = TemplateRecommendation(
+                template_name=template_name,
+                template_content=features.content,
+                relevance_score=self._score_features(features, context, recent_subjects),
+                reason=self._reason_for_features(features, context),
+                sender=features.sender,
+                receiver=features.receiver,
+                template_type=features.template_type,
+                customization_hints=self._hints_for_features(features, context),
+                template_version=snapshot.version
+            )
+            
+            recommendations.append(recommendation)
         
         # スコア順でソート
         recommendations.sort(key=lambda x: x.relevance_score, reverse=True)
         
         return recommendations
     
-    def _get_applicable_templates(self, status: str) -> List[str]:
-        """ステータスに適用可能なテンプレートを取得"""
-        # 完全一致を試す
-        if status in self.status_mapping:
-            return self.status_mapping[status]
+    def recommend_templates_batch(self, contexts: List[StatusContext], top_k: int = 3) -> List[List[TemplateRecommendation]]:
+        """複数の応募について、推奨テンプレートの上位top_k件をまとめて求める
         
-        # 部分一致を試す
-        for mapped_status, templates in self.status_mapping.items():
-            if status in mapped_status or mapped_status in status:
-                return templates
+        応募 × テンプレートのスコアを一括で計算する。結果は recommend_templates(context)[:top_k] と同じ。
+        """
+        snapshot = self._snapshot
+        scorer = self._batch_scorer
+        if scorer is None or scorer.snapshot is not snapshot:
+            scorer = self._batch_scorer = BatchRelevanceScorer(snapshot)
+        status_ids = scorer.status_ids([context.current_status for context in contexts])
+        scores = scorer.score_matrix(
+            [context.enthusiasm_score for context in contexts],
+            [context.concern_score for context in contexts],
+            status_ids,
+            scorer.recent_flags([context.message_history for context in contexts]),
+        )
         
-        # キーワードベースのマッチング
-        keywords_mapping = {
-            "登録": ["登録お礼"],
-            "面談": ["面談お礼", "リマインド"],
-            "求人": ["求人紹介", "応募書類リマインド"],
-            "応募": ["応募お礼"],
-            "書類": ["書類通過(CA→CS)", "書類お見送り"],
-            "面接": ["面接感想依頼", "日程最終確認(CA→CS)", "面接結果＋日程調整(CA→CS)"],
-            "意向": ["意向確認(CA→CS)"],
-            "内定": ["内定連絡(CA→CS)", "正式内定ログ(CA→CS)"],
-            "退職": ["退職交渉ログ(CA→CS)"]
-        }
-        
-        for keyword, templates in keywords_mapping.items():
-            if keyword in status:
-                return templates
-        
-        return []
+        results = []
+        for context, top in zip(contexts, scorer.top_k(scores, status_ids, top_k)):
+            recommendations = []
+            for column, score in top:
+                features = snapshot.template_index[scorer.names[column]]
+                recommendations.append(TemplateRecommendation(
+                    template_name=features.name,
+                    template_content=features.content,
+                    relevance_score=score,
+                    reason=self._reason_for_features(features, context),
+                    sender=features.sender,
+                    receiver=features.receiver,
+                    template_type=features.template_type,
+                    customization_hints=self._hints_for_features(features, context),
+                    template_version=snapshot.version
+                ))
+            results.append(recommendations)
+        return results
     
-    def _calculate_relevance_score(self, template_name: str, template_content: str, context: StatusContext) -> float:
-        """関連性スコアを計算"""
+    def _score_features(self, features: TemplateFeatures, context: StatusContext, recent_subjects: List[str]) -> float:
+        """関連性スコアのうち、応募の状況に依存する部分を計算（recent_subjectsは直近3件の件名・小文字）"""
+        template_name = features.name
         score = 0.5  # ベーススコア
         
         # ステータスマッチング
@@ -193,31 +446,29 @@ class TemplateEngine:
         
         # 熱意・懸念スコアによる調整
         if context.enthusiasm_score > 0.8:
-            if "お礼" in template_name or "おめでとう" in template_content:
+            if features.is_thanks or features.congratulates:
                 score += 0.2
         elif context.enthusiasm_score < 0.5:
-            if "確認" in template_name or "依頼" in template_name:
+            if features.asks:
                 score += 0.1
         
         if context.concern_score > 0.6:
-            if "追加情報" in template_name or "意向確認" in template_name:
+            if features.addresses_concern:
                 score += 0.2
         
         # メッセージ履歴による調整
-        if context.message_history:
-            recent_messages = context.message_history[-3:]
-            for msg in recent_messages:
-                if template_name.lower() in msg.get('subject', '').lower():
-                    score -= 0.1  # 最近使用したテンプレートは減点
+        for subject in recent_subjects:
+            if features.name_lower in subject:
+                score -= 0.1  # 最近使用したテンプレートは減点
         
         return min(1.0, max(0.0, score))
     
-    def _generate_recommendation_reason(self, template_name: str, context: StatusContext) -> str:
-        """推奨理由を生成"""
+    def _reason_for_features(self, features: TemplateFeatures, context: StatusContext) -> str:
+        """推奨理由のうち、応募の状況に依存する部分を組み立てる"""
         reasons = []
         
         # ステータス関連
-        if context.current_status in template_name:
+        if context.current_status in features.name:
             reasons.append(f"現在のステータス「{context.current_status}」に最適")
         
         # スコア関連
@@ -230,12 +481,8 @@ class TemplateEngine:
             reasons.append("候補者の懸念解消が必要なため")
         
         # テンプレート特性
-        if "お礼" in template_name:
-            reasons.append("感謝の気持ちを伝える重要なタイミング")
-        elif "確認" in template_name:
-            reasons.append("状況確認が必要な段階")
-        elif "調整" in template_name:
-            reasons.append("日程調整が必要な段階")
+        if features.trait_reason:
+            reasons.append(features.trait_reason)
         
         return "、".join(reasons) if reasons else "標準的な対応として推奨"
     
@@ -273,8 +520,8 @@ class TemplateEngine:
         else:
             return TemplateType.INITIAL
     
-    def _generate_customization_hints(self, template_name: str, context: StatusContext) -> List[str]:
-        """カスタマイズヒントを生成"""
+    def _hints_for_features(self, features: TemplateFeatures, context: StatusContext) -> List[str]:
+        """カスタマイズヒントのうち、応募の状況に依存する部分を組み立てる"""
         hints = []
         
         # 候補者名の置換
@@ -292,22 +539,39 @@ class TemplateEngine:
             hints.append("候補者の懸念があるため、丁寧な説明と配慮を追加")
         
         # テンプレート固有のヒント
-        if "日程" in template_name:
-            hints.append("具体的な日時候補を複数提示")
-        elif "内定" in template_name:
-            hints.append("条件詳細と回答期限を明確に記載")
-        elif "面接" in template_name:
-            hints.append("面接内容と準備事項を具体的に説明")
+        if features.trait_hint:
+            hints.append(features.trait_hint)
         
         return hints
     
+    def fill_template(
+        self,
+        template_name: str,
+        context: StatusContext,
+        values: Optional[Dict[str, str]] = None,
+        snapshot: Optional[TemplateSnapshot] = None,
+    ) -> Optional[FilledDraft]:
+        """テンプレートの差し込み箇所を応募の情報で埋める（LLMを使わない。valuesで求人番号・日付などを追加できる）
+
+        snapshotを渡した場合はその版のテンプレートを使う（テンプレートがなければ None）。
+        """
+        features = (snapshot or self._snapshot).template_index.get(template_name)
+        if features is None:
+            return None
+        filled_values = {
+            CANDIDATE_NAME: context.candidate_name,
+            COMPANY: context.company,
+            JOB_TITLE: context.job_title,
+        }
+        filled_values.update(values or {})
+        return render_fill_plan(features.fill_plan, filled_values)
+    
     def get_template_for_qwen3(self, template_name: str, context: StatusContext) -> str:
         """Qwen3用のテンプレート情報を整形"""
-        if template_name not in self.templates:
+        template_content = self.templates.get(template_name)
+        if template_content is None:
             return ""
         
-        template_content = self.templates[template_name]
-        
         # Qwen3用の指示を追加
         qwen3_prompt = f"""
 以下のテンプレートを参考に、具体的な状況に合わせてメール文面を生成してください。
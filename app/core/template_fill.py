@@ -0,0 +1,127 @@
+"""
+テンプレートの差し込み
+テンプレート本文を、固定の文字列と型付きの差し込み箇所（候補者名・企業名・職種・求人番号・日付など）の列に
+読み込み時に分解しておき、応募の情報から決まった手順で埋める（LLMを使わないため即座に下書きを返せる）。
+"""
+
+import re
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Dict, List, Mapping, Optional, Tuple, Union
+
+CANDIDATE_NAME = "candidate_name"
+COMPANY = "company"
+JOB_TITLE = "job_title"
+JOB_ID = "job_id"
+DATE = "date"
+UNKNOWN = "unknown"  # 年収など、応募の情報からは埋められないもの
+
+SLOT_PATTERN = re.compile(
+    r"(?P<date>(?:[●○]{2,4}年)?[●○]{1,2}月[●○]{1,2}日)"
+    r"|(?P<name>CS様|[●○]{2,}様)"
+    r"|(?P<company>[●○]{2,}社)"
+    r"|(?P<blank>[●○]{2,})"
+)
+
+# 記号だけの差し込み箇所は、同じ行の直前にある項目名で種類を決める（先に一致したものを使う）
+LABEL_KINDS = (
+    ("求職者名", CANDIDATE_NAME),
+    ("氏名", CANDIDATE_NAME),
+    ("候補者", CANDIDATE_NAME),
+    ("企業名", COMPANY),
+    ("会社名", COMPANY),
+    ("職種", JOB_TITLE),
+    ("ポジション", JOB_TITLE),
+    ("求人No", JOB_ID),
+    ("求人番号", JOB_ID),
+)
+
+WEEKDAYS = "月火水木金土日"
+
+
+@dataclass(frozen=True)
+class Slot:
+    """差し込み箇所（埋められない場合は placeholder をそのまま残す）"""
+    kind: str
+    placeholder: str
+    suffix: str = ""  # 値の後ろに付ける文字列（「様」など）
+
+
+@dataclass(frozen=True)
+class FillPlan:
+    """テンプレート本文を固定の文字列と差し込み箇所に分解したもの"""
+    template_name: str
+    segments: Tuple[Union[str, Slot], ...]
+
+    @property
+    def slots(self) -> List[Slot]:
+        return [segment for segment in self.segments if isinstance(segment, Slot)]
+
+
+@dataclass
+class FilledDraft:
+    """差し込み済みの本文と、埋めた・埋められなかった箇所"""
+    body: str
+    filled: Dict[str, int] = field(default_factory=dict)  # 種類ごとの埋めた箇所の数
+    unresolved: List[str] = field(default_factory=list)  # 埋められなかった箇所の種類（出現順）
+
+
+def _label_kind(line_prefix: str) -> str:
+    for label, kind in LABEL_KINDS:
+        if label in line_prefix:
+            return kind
+    return UNKNOWN
+
+
+def compile_fill_plan(template_name: str, content: str) -> FillPlan:
+    """テンプレート本文を差し込み計画に分解する"""
+    segments: List[Union[str, Slot]] = []
+    position = 0
+    for match in SLOT_PATTERN.finditer(content):
+        if match.start() > position:
+            segments.append(content[position:match.start()])
+        text = match.group()
+        if match.group("date"):
+            slot = Slot(DATE, text)
+        elif match.group("name"):
+            slot = Slot(CANDIDATE_NAME, text, "様")
+        elif match.group("company"):
+            slot = Slot(COMPANY, text)
+        else:
+            line_start = content.rfind("\n", 0, match.start()) + 1
+            slot = Slot(_label_kind(content[line_start:match.start()]), text)
+        segments.append(slot)
+        position = match.end()
+    if position < len(content):
+        segments.append(content[position:])
+    return FillPlan(template_name, tuple(segments))
+
+
+def render_fill_plan(plan: FillPlan, values: Mapping[str, Optional[str]]) -> FilledDraft:
+    """差し込み計画を値で埋める（値のない箇所は元の記号を残す）"""
+    parts = []
+    filled: Dict[str, int] = {}
+    unresolved = []
+    for segment in plan.segments:
+        if isinstance(segment, str):
+            parts.append(segment)
+            continue
+        value = values.get(segment.kind)
+        if value:
+            parts.append(value + segment.suffix)
+            filled[segment.kind] = filled.get(segment.kind, 0) + 1
+        else:
+            parts.append(segment.placeholder)
+            unresolved.append(segment.kind)
+    return FilledDraft("".join(parts), filled, unresolved)
+
+
+def date_candidates(start: Optional[date] = None, count: int = 3) -> List[str]:
+    """日付の差し込み候補（翌営業日から土日を除いてcount日分）"""
+    day = start or date.today()
+    candidates = []
+    while len(candidates) < count:
+        day += timedelta(days=1)
+        if day.weekday() < 5:
+            candidates.append(f"{day.year}年{day.month}月{day.day}日({WEEKDAYS[day.weekday()]})")
+    return candidates
@@ -4,4 +4,5 @@ from .job import *
 from .application import *
 from .event import *
 from .task import *
-from .message import * 
\ No newline at end of file
+from .message import *
+from .draft import * 
\ No newline at end of file
@@ -12,6 +12,9 @@ class Application(BaseModel, table=True):
     job_id: str = Field(foreign_key="jobs.id", description="求人ID")
     status: str = Field(default="書類選考中", description="応募ステータス")
     latest_summary: Optional[str] = Field(default=None, description="最新要約")
+    history_summary: Optional[str] = Field(default=None, description="やり取りのローリング要約")
+    summary_version: int = Field(default=0, description="ローリング要約の版（更新回数）")
+    summary_watermark: Optional[str] = Field(default=None, description="ローリング要約に最後に反映したメッセージID")
     enthusiasm_score: Optional[float] = Field(default=None, description="熱意スコア (0-1)")
     concern_score: Optional[float] = Field(default=None, description="懸念スコア (0-1)")
     
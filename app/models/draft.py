@@ -0,0 +1,25 @@
+from sqlmodel import Field
+from typing import Optional
+from .base import BaseModel
+
+
+class GeneratedDraft(BaseModel, table=True):
+    """生成済みメール下書きモデル"""
+    __tablename__ = "email_drafts"
+    
+    application_id: str = Field(foreign_key="applications.id", index=True, description="応募ID")
+    version: int = Field(description="応募ごとの版数（1から）")
+    template_name: Optional[str] = Field(default=None, description="参考テンプレート名")
+    subject: str = Field(description="件名")
+    body: str = Field(description="本文")
+    prompt_fingerprint: Optional[str] = Field(default=None, index=True, description="プロンプトのフィンガープリント")
+    state_fingerprint: str = Field(description="生成時の応募状態（ステータス・スコア・履歴）のフィンガープリント")
+    model: Optional[str] = Field(default=None, description="生成モデル")
+    profile: Optional[str] = Field(default=None, description="生成プロファイル (fast, quality)")
+    source: str = Field(default="generate", description="生成元 (generate, regenerate, prefetch)")
+    latency: Optional[float] = Field(default=None, description="生成時間（秒）")
+    prompt_tokens: Optional[int] = Field(default=None, description="プロンプトのトークン数")
+    completion_tokens: Optional[int] = Field(default=None, description="生成したトークン数")
+    
+    def __repr__(self):
+        return f"<GeneratedDraft(application_id='{self.application_id}', version={self.version}, template='{self.template_name}')>" 
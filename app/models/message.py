@@ -1,4 +1,4 @@
-from sqlmodel import SQLModel, Field, Column
+from sqlmodel import SQLModel, Field, Column, JSON
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 from .base import BaseModel
@@ -14,7 +14,8 @@ class MessageRaw(BaseModel, table=True):
     subject: Optional[str] = Field(default=None, description="件名")
     sender: Optional[str] = Field(default=None, description="送信者")
     recipient: Optional[str] = Field(default=None, description="受信者")
-    metadata: Optional[Dict[str, Any]] = Field(default=None, description="メタデータ")
+    # metadata は SQLModel の予約名のため、属性名は meta（列名は metadata）
+    meta: Optional[Dict[str, Any]] = Field(default=None, sa_column=Column("metadata", JSON), description="メタデータ")
     
     def __repr__(self):
         return f"<MessageRaw(type='{self.msg_type}', external_id='{self.external_id}')>"
@@ -27,8 +28,8 @@ class EmbeddingChunk(BaseModel, table=True):
     message_id: str = Field(foreign_key="message_raw.id", description="メッセージID")
     chunk_index: int = Field(description="チャンクインデックス")
     text: str = Field(description="チャンクテキスト")
-    vector: Optional[List[float]] = Field(default=None, description="埋め込みベクトル")
-    meta: Optional[Dict[str, Any]] = Field(default=None, description="メタデータ")
+    vector: Optional[List[float]] = Field(default=None, sa_column=Column(JSON), description="埋め込みベクトル")
+    meta: Optional[Dict[str, Any]] = Field(default=None, sa_column=Column(JSON), description="メタデータ")
     
     def __repr__(self):
         return f"<EmbeddingChunk(message_id='{self.message_id}', chunk_index={self.chunk_index})>" 
\ No newline at end of file
@@ -4,14 +4,25 @@ CA Support System - デモ版 API
 データベースを使わずにメモリ上のサンプルデータで動作する簡易版
 """
 
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import HTMLResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Any, List, Optional
 from datetime import datetime, timedelta
+from dataclasses import replace
+import asyncio
 import json
+import os
+import time
+from app.core.conversation_summary import ConversationSummarizer
+from app.core.draft_prefetch import DraftPrefetcher, PrefetchJob, application_state
+from app.core.draft_ranking import DraftRanker
+from app.core.draft_store import DraftStore, is_reusable
+from app.core.history_context import HistoryContextBuilder
 from app.core.llm import llm, EmailGenerationContext
+from app.core.llm_scheduler import BACKGROUND, PRIORITY_CLASSES
 from app.core.template_engine import TemplateEngine, StatusContext, TemplateRecommendation
+from app.core.template_fill import DATE, JOB_ID, date_candidates
 
 # FastAPIアプリケーション
 app = FastAPI(
@@ -23,6 +34,36 @@ app = FastAPI(
 # テンプレートエンジンのインスタンス作成
 template_engine = TemplateEngine()
 
+# 生成トークン数の見積もりにも現在のスナップショットのテンプレートを使う（再読み込みに追従する）
+if llm.sizer is not None:
+    llm.sizer.set_template_source(lambda: template_engine.snapshot.templates)
+
+# テンプレート・ステータス分類ファイルの変更を確認する間隔（秒、0で無効。変更は再起動なしで反映される）
+TEMPLATE_RELOAD_INTERVAL = float(os.getenv("TEMPLATE_RELOAD_INTERVAL", "5"))
+
+# 一括生成時のOllama同時リクエスト数（GPUホストの処理能力に合わせて調整）
+BATCH_GENERATION_CONCURRENCY = int(os.getenv("BATCH_GENERATION_CONCURRENCY", "2"))
+
+# プロンプトに含めるやり取り履歴のトークン予算
+HISTORY_TOKEN_BUDGET = int(os.getenv("LLM_HISTORY_TOKEN_BUDGET", "1000"))
+
+# 期限の近いネクストアクションの下書きを、LLMの空き時間に事前生成する
+DRAFT_PREFETCH_ENABLED = os.getenv("DRAFT_PREFETCH_ENABLED", "true").lower() == "true"
+DRAFT_PREFETCH_INTERVAL = float(os.getenv("DRAFT_PREFETCH_INTERVAL", "60"))
+
+# 宛先別の同時生成で指定できる宛先（EmailGenerationContext.target_person）
+EMAIL_RECIPIENTS = ("CS", "candidate", "RA")
+
+# 候補を複数生成して採点する場合の候補数の上限
+MAX_DRAFT_CANDIDATES = int(os.getenv("MAX_DRAFT_CANDIDATES", "5"))
+draft_ranker = DraftRanker()
+
+# 生成済みの下書きの保存先（モーダルを開き直しても再生成しない）
+draft_store = DraftStore(os.getenv("DRAFT_DB_PATH", "ca_support.db"))
+
+# 生成中にクライアントが切断したリクエスト数（エンドポイント別）
+client_disconnects = {}
+
 # データモデル（簡易版）
 class Candidate(BaseModel):
     id: str
@@ -49,6 +90,10 @@ class Application(BaseModel):
     candidate_name: str
     job_title: str
     company: str
+    # やり取りのローリング要約（summary_watermark のIDのメッセージまで反映済み）
+    history_summary: Optional[str] = None
+    summary_version: int = 0
+    summary_watermark: Optional[str] = None
 
 class Task(BaseModel):
     id: str
@@ -259,6 +304,31 @@ sample_next_actions = [
 # メッセージ履歴（統合されたリアルなデータ）
 from complete_integrated_history import all_message_history
 
+# 履歴の関連度採点・定型文除去は全履歴から学習しておく
+history_builder = HistoryContextBuilder(budget_tokens=HISTORY_TOKEN_BUDGET).fit(all_message_history)
+
+# 応募ごとのローリング要約（新しいメッセージ1件ごとに小さなLLM呼び出しで更新する）
+conversation_summaries = ConversationSummarizer(llm, history_builder)
+
+@app.on_event("startup")
+async def startup_event():
+    """起動時にLLMモデルをウォームアップ（起動自体は待たせない）"""
+    llm.start_health_checks()
+    asyncio.create_task(llm.awarmup())
+    if DRAFT_PREFETCH_ENABLED:
+        draft_prefetcher.start()
+    if TEMPLATE_RELOAD_INTERVAL > 0:
+        template_engine.start_watching(TEMPLATE_RELOAD_INTERVAL)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """終了時にLLMの接続プールを閉じる"""
+    llm.stop_health_checks()
+    draft_prefetcher.stop()
+    template_engine.stop_watching()
+    draft_store.close()
+    await llm.aclose()
+
 # API エンドポイント
 @app.get("/")
 async def root():
@@ -300,6 +370,42 @@ async def get_application_detail(application_id: str):
         "message_history": messages
     }
 
+@app.post("/api/applications/{application_id}/messages")
+async def add_message(application_id: str, message: MessageHistory):
+    """メッセージ履歴を追加し、ローリング要約をバックグラウンドで更新する"""
+    app = next((a for a in sample_applications if a.id == application_id), None)
+    if not app:
+        raise HTTPException(status_code=404, detail="Application not found")
+    if message.application_id != application_id:
+        raise HTTPException(status_code=400, detail="application_id does not match")
+    
+    # 届いた順のまま追加する（要約の反映位置は届いた順で管理する。時系列が必要な箇所はそれぞれ並べ替える）
+    all_message_history.append(message)
+    messages = [m for m in all_message_history if m.application_id == application_id]
+    draft_prefetcher.invalidate(application_id)
+    scheduled = conversation_summaries.schedule_refresh(app, messages)
+    return {"success": True, "message_id": message.id, "summary_update_scheduled": scheduled}
+
+@app.get("/api/applications/{application_id}/summary")
+async def get_conversation_summary(application_id: str, refresh: bool = False):
+    """ローリング要約を取得（refresh=trueで未反映のメッセージを反映してから返す）"""
+    app = next((a for a in sample_applications if a.id == application_id), None)
+    if not app:
+        raise HTTPException(status_code=404, detail="Application not found")
+    
+    messages = [m for m in all_message_history if m.application_id == application_id]
+    report = None
+    if refresh:
+        report = await conversation_summaries.refresh(app, messages)
+    return {
+        "application_id": application_id,
+        "summary": app.history_summary,
+        "version": app.summary_version,
+        "watermark": app.summary_watermark,
+        "pending_messages": len(conversation_summaries.pending(app, messages)),
+        "refresh": report
+    }
+
 @app.get("/api/tasks", response_model=List[Task])
 async def get_tasks():
     """タスク一覧を取得"""
@@ -315,9 +421,8 @@ async def get_jobs():
     """求人一覧を取得"""
     return sample_jobs
 
-@app.post("/api/generate-email/{application_id}")
-async def generate_email(application_id: str):
-    """AI文面生成API"""
+def build_email_context(application_id: str, template_name: Optional[str] = None, reference_template: Optional[str] = None):
+    """応募IDからLLM用のメール生成コンテキストを組み立てる"""
     # 対象の応募を取得
     app = next((a for a in sample_applications if a.id == application_id), None)
     if not app:
@@ -330,22 +435,24 @@ async def generate_email(application_id: str):
     
     # 関連するメッセージ履歴を取得
     messages = [m for m in all_message_history if m.application_id == application_id]
+    pending = conversation_summaries.pending(app, messages)
     
     # 履歴を時系列で整理
     messages.sort(key=lambda x: x.timestamp)
     
-    # 履歴サマリーを作成
-    history_context = ""
-    if messages:
-        history_context = "\n\n## 過去のやり取り履歴\n"
-        for msg in messages[-3:]:  # 最新3件を使用
-            direction = "送信" if msg.is_outbound else "受信"
-            history_context += f"""
-### {msg.timestamp} - {direction}
-**{msg.sender} → {msg.receiver}**
-件名: {msg.subject}
-内容: {msg.content}
-"""
+    # 履歴サマリーを作成（ステータス・テンプレートに関連する履歴を、定型文を除いてトークン予算内で選ぶ）
+    # ローリング要約がある場合は、要約と未反映のメッセージだけを使う（履歴が増えてもプロンプトは一定の長さ）
+    template = reference_template or template_engine.templates.get(template_name or "")
+    history = history_builder.build(
+        messages,
+        query="\n".join([app.status, app.latest_summary, next_action.subject, next_action.message_template]),
+        template=template,
+        summary=app.history_summary,
+        pending_ids=[m.id for m in pending] if app.history_summary else None,
+    )
+    if app.history_summary:
+        history.summary_version = app.summary_version
+    history_context = history.text
     
     # LLM用のコンテキストを作成（履歴情報を含む）
     context = EmailGenerationContext(
@@ -357,20 +464,291 @@ async def generate_email(application_id: str):
         enthusiasm_score=app.enthusiasm_score,
         concern_score=app.concern_score,
         target_person=next_action.target_person,
-        current_template=next_action.message_template
+        current_template=next_action.message_template,
+        reference_template=reference_template,
+        template_name=template_name
+    )
+    
+    return next_action, messages, context, history
+
+def build_status_context(app: Application) -> StatusContext:
+    """テンプレート推奨用のステータスコンテキストを組み立てる"""
+    messages = sorted((m for m in all_message_history if m.application_id == app.id), key=lambda x: x.timestamp)
+    message_history = [
+        {
+            "timestamp": m.timestamp,
+            "subject": m.subject,
+            "content": m.content,
+            "is_outbound": m.is_outbound
+        }
+        for m in messages
+    ]
+    return StatusContext(
+        current_status=app.status,
+        candidate_name=app.candidate_name,
+        company=app.company,
+        job_title=app.job_title,
+        enthusiasm_score=app.enthusiasm_score,
+        concern_score=app.concern_score,
+        latest_summary=app.latest_summary,
+        message_history=message_history
+    )
+
+def prefetch_jobs() -> List[PrefetchJob]:
+    """メール送信のネクストアクションと未完了タスクの期限・優先度から事前生成の対象を作る"""
+    jobs = {}
+    for action in sample_next_actions:
+        if action.action_type == "send_email":
+            jobs[action.application_id] = PrefetchJob.create(action.application_id, action.due_date, action.priority)
+    for task in sample_tasks:
+        if task.status != "completed" and task.application_id in jobs:
+            job = PrefetchJob.create(task.application_id, task.due, task.priority)
+            jobs[task.application_id] = min(jobs[task.application_id], job)
+    return list(jobs.values())
+
+def current_application_state(application_id: str) -> str:
+    """応募のステータス・スコア・履歴のフィンガープリント（変わると事前生成した下書きは破棄される）"""
+    app = next((a for a in sample_applications if a.id == application_id), None)
+    messages = [m for m in all_message_history if m.application_id == application_id]
+    return application_state(app, messages) if app else ""
+
+async def prefetch_draft(job: PrefetchJob):
+    """AI文面生成の画面と同じく、最も適合するテンプレートを参考に下書きを生成する"""
+    app = next(a for a in sample_applications if a.id == job.application_id)
+    recommendations = template_engine.recommend_templates(build_status_context(app))
+    best = recommendations[0] if recommendations else None
+    template_name = best.template_name if best else None
+    next_action, messages, context, history = build_email_context(
+        job.application_id, template_name=template_name, reference_template=best.template_content if best else None
     )
+    result = await llm.agenerate_email_content(context, priority=BACKGROUND)
+    result["metadata"]["history"] = history.to_dict()
+    save_draft(job.application_id, template_name, result, "prefetch", llm.email_fingerprint(context))
+    return template_name, result
+
+def save_draft(application_id: str, template_name: Optional[str], result: dict, source: str, fingerprint: str) -> None:
+    """生成した下書きを新しい版として保存し、版番号をメタデータに付ける
+    
+    fingerprintは llm.email_fingerprint で求めた照合キー（find_saved_draft で同じものを使う）。
+    生成に失敗した・解析に失敗した・num_predictで打ち切られた下書きは保存しない（開き直したときに再生成する）。
+    """
+    metadata = result.setdefault("metadata", {})
+    if not is_reusable(metadata):
+        return
+    row = draft_store.save(
+        application_id, template_name, result["subject"], result["body"],
+        current_application_state(application_id), metadata, source, fingerprint
+    )
+    metadata["draft_id"] = row["id"]
+    metadata["draft_version"] = row["version"]
+
+def find_saved_draft(application_id: str, template_name: Optional[str], fingerprint: str) -> Optional[dict]:
+    """事前生成・保存済みの下書きのうち、現在の応募状態・同じプロンプトで有効なものを生成結果と同じ形式で返す"""
+    draft = draft_prefetcher.take(application_id, template_name, fingerprint)
+    if draft is not None:
+        return dict(
+            draft.result,
+            metadata=dict(
+                draft.result.get("metadata", {}),
+                prefetched=True,
+                prefetched_age=round(time.time() - draft.generated_at, 1)
+            )
+        )
+    saved = draft_store.latest(application_id, template_name, current_application_state(application_id), fingerprint)
+    if saved is None:
+        return None
+    return {
+        "subject": saved["subject"],
+        "body": saved["body"],
+        "metadata": {
+            "model": saved["model"],
+            "profile": saved["profile"],
+            "latency": saved["latency"],
+            "prompt_tokens": saved["prompt_tokens"],
+            "completion_tokens": saved["completion_tokens"],
+            "prompt_fingerprint": saved["prompt_fingerprint"],
+            "saved_draft": True,
+            "draft_id": saved["id"],
+            "draft_version": saved["version"],
+            "draft_source": saved["source"],
+            "draft_created_at": saved["created_at"]
+        }
+    }
+
+draft_prefetcher = DraftPrefetcher(
+    jobs=prefetch_jobs,
+    state=current_application_state,
+    generate=prefetch_draft,
+    is_idle=lambda: llm.scheduler is None or llm.scheduler.idle(),
+    interval=DRAFT_PREFETCH_INTERVAL
+)
+
+def check_profile(task: str, profile: Optional[str]) -> Optional[str]:
+    """生成プロファイル名を検証する（未知の名前は400）"""
+    try:
+        llm.resolve_profile(task, profile)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return profile
+
+def check_concurrency(value: Any) -> int:
+    """一括生成の同時実行数を検証する（数値でなければ400）"""
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail=f"concurrency must be an integer: {value!r}")
+
+def check_flag(name: str, value: Any) -> bool:
+    """真偽値のパラメータを検証する（true/false 以外は400。文字列の "false" を真として扱わない）"""
+    if not isinstance(value, bool):
+        raise HTTPException(status_code=400, detail=f"{name} must be true or false: {value!r}")
+    return value
+
+def record_client_disconnect(endpoint: str) -> None:
+    client_disconnects[endpoint] = client_disconnects.get(endpoint, 0) + 1
+    print(f"[INFO] クライアント切断のため生成を中止しました: {endpoint}")
+
+async def wait_for_disconnect(request: Request) -> None:
+    """クライアントの切断を待つ（リクエストボディは読み込み済みであること）"""
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+async def run_until_disconnect(request: Request, coro, endpoint: str):
+    """クライアントが切断したら生成を打ち切る
+    
+    生成タスクをキャンセルすると、待ち行列から外れるかOllamaへの接続が閉じられ、
+    GPUの処理枠がすぐに解放される。
+    """
+    task = asyncio.ensure_future(coro)
+    disconnect = asyncio.ensure_future(wait_for_disconnect(request))
+    try:
+        await asyncio.wait({task, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        disconnect.cancel()
+        disconnected = not task.done()
+        if disconnected:
+            task.cancel()
+    if disconnected:
+        record_client_disconnect(endpoint)
+        raise HTTPException(status_code=499, detail="Client closed request")
+    return task.result()
+
+@app.post("/api/generate-email/batch")
+async def generate_email_batch(request_data: dict):
+    """一括AI文面生成API
+    
+    application_ids（応募IDのリスト）またはstatus（ステータス絞り込み）で対象を指定する。
+    結果は完了した応募から順にNDJSONで返す。画面からの生成より後回しになるバックグラウンド扱い。
+    """
+    application_ids = request_data.get("application_ids")
+    if application_ids is not None and (
+        not isinstance(application_ids, list) or not all(isinstance(a, str) for a in application_ids)
+    ):
+        raise HTTPException(status_code=400, detail="application_ids must be a list of strings")
+    status = request_data.get("status")
+    regenerate = check_flag("regenerate", request_data.get("regenerate", False))
+    ca_id = request_data.get("ca_id")
+    profile = check_profile("email", request_data.get("profile"))
+    concurrency = check_concurrency(request_data.get("concurrency", BATCH_GENERATION_CONCURRENCY))
+    
+    if application_ids is None:
+        application_ids = [a.id for a in sample_applications if status is None or a.status == status]
+    
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def generate_one(application_id: str):
+        queued_at = time.perf_counter()
+        async with semaphore:
+            started_at = time.perf_counter()
+            try:
+                next_action, messages, context, history = build_email_context(application_id)
+                result = await llm.agenerate_email_content(
+                    context, regenerate=regenerate, priority=BACKGROUND, owner=ca_id, profile=profile
+                )
+                save_draft(application_id, None, result, "batch", llm.email_fingerprint(context, profile))
+                item = {
+                    "application_id": application_id,
+                    "success": True,
+                    "generated_subject": result["subject"],
+                    "generated_body": result["body"],
+                    "metadata": dict(result.get("metadata", {}), history=history.to_dict()),
+                    "context_used": f"履歴{len(messages)}件から{len(history.selected)}件を選んだ詳細コンテキスト"
+                }
+            except HTTPException as e:
+                item = {"application_id": application_id, "success": False, "error": e.detail}
+            except Exception as e:
+                print(f"[ERROR] 一括生成でエラー ({application_id}): {e}")
+                item = {"application_id": application_id, "success": False, "error": str(e)}
+            finished_at = time.perf_counter()
+        item["wait_time"] = round(started_at - queued_at, 3)
+        item["latency"] = round(finished_at - started_at, 3)
+        return item
+    
+    async def result_stream():
+        batch_started_at = time.perf_counter()
+        tasks = [asyncio.create_task(generate_one(application_id)) for application_id in application_ids]
+        succeeded = 0
+        try:
+            for finished in asyncio.as_completed(tasks):
+                item = await finished
+                succeeded += item["success"]
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+        summary = {
+            "total": len(tasks),
+            "succeeded": succeeded,
+            "concurrency": concurrency,
+            "elapsed": round(time.perf_counter() - batch_started_at, 3)
+        }
+        yield json.dumps({"summary": summary}, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+@app.post("/api/generate-email/{application_id}")
+async def generate_email(
+    request: Request,
+    application_id: str,
+    regenerate: bool = False,
+    ca_id: Optional[str] = None,
+    profile: Optional[str] = None
+):
+    """AI文面生成API（regenerate=trueで保存済みの下書き・キャッシュを使わず再生成、ca_idは担当CA、profileはfast/quality）"""
+    check_profile("email", profile)
+    next_action, messages, context, history = build_email_context(application_id)
+    fingerprint = llm.email_fingerprint(context, profile)
+    
+    # 保存済みの下書きがあれば即座に返す
+    saved = find_saved_draft(application_id, None, fingerprint) if not regenerate and profile is None else None
+    if saved is not None:
+        return {
+            "success": True,
+            "generated_subject": saved["subject"],
+            "generated_body": saved["body"],
+            "metadata": saved["metadata"],
+            "original_template": next_action.message_template,
+            "context_used": f"生成済みの下書き（第{saved['metadata'].get('draft_version')}版）"
+        }
     
     # AI文面生成
     try:
-        result = llm.generate_email_content(context)
+        result = await run_until_disconnect(
+            request,
+            llm.agenerate_email_content(context, regenerate=regenerate, owner=ca_id, profile=profile),
+            "generate-email"
+        )
+        save_draft(application_id, None, result, "regenerate" if regenerate else "generate", fingerprint)
         return {
             "success": True,
             "generated_subject": result["subject"],
             "generated_body": result["body"],
-            "metadata": result.get("metadata", {}),
+            "metadata": dict(result.get("metadata", {}), history=history.to_dict()),
             "original_template": next_action.message_template,
-            "context_used": f"履歴{len(messages)}件を含む詳細コンテキスト"
+            "context_used": f"履歴{len(messages)}件から{len(history.selected)}件を選んだ詳細コンテキスト"
         }
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"[ERROR] AI文面生成でエラー: {e}")
         import traceback
@@ -382,22 +760,168 @@ async def generate_email(application_id: str):
             "generated_body": next_action.message_template
         }
 
+@app.post("/api/generate-email/{application_id}/variants")
+async def generate_email_variants(request: Request, application_id: str, request_data: dict):
+    """宛先別（CS / candidate / RA）のメール文面を同時に生成するAPI
+    
+    履歴・テンプレートのコンテキストは1回だけ組み立て、全宛先の生成を並行して行う。
+    templatesで宛先ごとの参考テンプレート {"CS": {"template_name": ..., "reference_template": ...}} を指定できる。
+    """
+    recipients = request_data.get("recipients") or list(EMAIL_RECIPIENTS)
+    unknown = [r for r in recipients if r not in EMAIL_RECIPIENTS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"recipients must be in {list(EMAIL_RECIPIENTS)}: {unknown}")
+    recipients = list(dict.fromkeys(recipients))
+    template_name = request_data.get("template_name")
+    reference_template = request_data.get("reference_template")
+    raw_templates = request_data.get("templates") or {}
+    if not isinstance(raw_templates, dict) or not all(isinstance(t, dict) for t in raw_templates.values()):
+        raise HTTPException(
+            status_code=400,
+            detail='templates must be {"<recipient>": {"template_name": ..., "reference_template": ...}}'
+        )
+    templates = {
+        recipient: (template.get("template_name"), template.get("reference_template"))
+        for recipient, template in raw_templates.items()
+    }
+    regenerate = check_flag("regenerate", request_data.get("regenerate", False))
+    profile = check_profile("email", request_data.get("profile"))
+    
+    next_action, messages, context, history = build_email_context(
+        application_id, template_name=template_name, reference_template=reference_template
+    )
+    
+    try:
+        result = await run_until_disconnect(
+            request,
+            llm.agenerate_email_variants(
+                context, recipients, templates=templates, regenerate=regenerate,
+                owner=request_data.get("ca_id"), profile=profile
+            ),
+            "generate-email/variants"
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] 宛先別の文面生成でエラー: {e}")
+        return {"success": False, "error": str(e), "application_id": application_id}
+    
+    # 宛先ごとに、その宛先・参考テンプレートのプロンプトのフィンガープリントで保存する
+    for recipient, variant in result["variants"].items():
+        variant_template, variant_reference = templates.get(recipient, (template_name, reference_template))
+        variant_context = replace(
+            context, target_person=recipient, template_name=variant_template, reference_template=variant_reference
+        )
+        save_draft(
+            application_id, variant_template, variant, "regenerate" if regenerate else "generate",
+            llm.email_fingerprint(variant_context, profile)
+        )
+    
+    return {
+        "success": True,
+        "application_id": application_id,
+        "variants": {
+            recipient: {
+                "generated_subject": variant["subject"],
+                "generated_body": variant["body"],
+                "metadata": variant.get("metadata", {}),
+                "template_name": templates.get(recipient, (template_name, None))[0]
+            }
+            for recipient, variant in result["variants"].items()
+        },
+        "timings": result["timings"],
+        "shared_prefix_tokens": result["shared_prefix_tokens"],
+        "prompt_tokens": result["prompt_tokens"],
+        "history": history.to_dict(),
+        "context_used": f"履歴{len(messages)}件から{len(history.selected)}件を選んだ共通コンテキストで{len(recipients)}宛先を生成"
+    }
+
+@app.post("/api/generate-email/{application_id}/candidates")
+async def generate_email_candidates(request: Request, application_id: str, request_data: dict):
+    """温度・シードを変えた候補を同時に生成し、ローカルの採点で最も良い下書きと次点を返すAPI
+    
+    採点は差し込み記号（●●・○○）の残り、候補者名・企業名・職種の有無、本文の長さ、参考テンプレートとの構成の近さで行う。
+    """
+    n = request_data.get("n", 3)
+    if not isinstance(n, int) or not 1 <= n <= MAX_DRAFT_CANDIDATES:
+        raise HTTPException(status_code=400, detail=f"n must be an integer between 1 and {MAX_DRAFT_CANDIDATES}")
+    template_name = request_data.get("template_name")
+    regenerate = check_flag("regenerate", request_data.get("regenerate", False))
+    profile = check_profile("email", request_data.get("profile"))
+    
+    next_action, messages, context, history = build_email_context(
+        application_id, template_name=template_name, reference_template=request_data.get("reference_template")
+    )
+    
+    try:
+        result = await run_until_disconnect(
+            request,
+            llm.agenerate_email_candidates(
+                context, n=n, regenerate=regenerate, owner=request_data.get("ca_id"), profile=profile
+            ),
+            "generate-email/candidates"
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] 候補の生成でエラー: {e}")
+        return {"success": False, "error": str(e), "application_id": application_id}
+    
+    ranked = [
+        {
+            "generated_subject": candidate["subject"],
+            "generated_body": candidate["body"],
+            "metadata": candidate.get("metadata", {})
+        }
+        for candidate in draft_ranker.rank(result["candidates"], context)
+    ]
+    best = ranked[0]
+    save_draft(
+        application_id, template_name,
+        {"subject": best["generated_subject"], "body": best["generated_body"], "metadata": best["metadata"]},
+        "regenerate" if regenerate else "generate", llm.email_fingerprint(context, profile)
+    )
+    return {
+        "success": True,
+        "application_id": application_id,
+        "best": best,
+        "runners_up": ranked[1:],
+        "timings": result["timings"],
+        "history": history.to_dict(),
+        "template_name": template_name,
+        "context_used": f"{n}件の候補から採点で選択"
+    }
+
 @app.post("/api/analyze-email")
-async def analyze_email(email_data: dict):
+async def analyze_email(request: Request, email_data: dict):
     """メール内容分析API"""
     content = email_data.get("content", "")
     if not content:
         raise HTTPException(status_code=400, detail="Email content is required")
+    regenerate = check_flag("regenerate", email_data.get("regenerate", False))
+    priority = email_data.get("priority", BACKGROUND)
+    if priority not in PRIORITY_CLASSES:
+        raise HTTPException(status_code=400, detail=f"priority must be one of {list(PRIORITY_CLASSES)}")
+    profile = check_profile("analysis", email_data.get("profile"))
     
     try:
-        result = llm.analyze_email_content(content)
+        result = await run_until_disconnect(
+            request,
+            llm.aanalyze_email_content(
+                content, regenerate=regenerate, priority=priority, owner=email_data.get("ca_id"), profile=profile
+            ),
+            "analyze-email"
+        )
         return {
             "success": True,
             "enthusiasm_score": result["enthusiasm_score"],
             "concern_score": result["concern_score"],
             "analysis_reason": result["analysis_reason"],
-            "raw_response": result.get("raw_response", "")
+            "raw_response": result.get("raw_response", ""),
+            "metadata": result.get("metadata", {})
         }
+    except HTTPException:
+        raise
     except Exception as e:
         return {
             "success": False,
@@ -411,7 +935,8 @@ async def analyze_email(email_data: dict):
 async def test_llm():
     """LLMテスト用API"""
     try:
-        result = llm._call_ollama("こんにちは、簡単な挨拶をお願いします。", temperature=0.5, max_tokens=100)
+        # 疎通確認のためキャッシュは使わない
+        result = await llm._acall_ollama("こんにちは、簡単な挨拶をお願いします。", temperature=0.5, max_tokens=100, regenerate=True)
         return {
             "success": True,
             "response": result,
@@ -424,6 +949,72 @@ async def test_llm():
             "test": "simple_greeting"
         }
 
+@app.get("/api/llm/stats")
+async def get_llm_stats():
+    """LLM統計API（キャッシュのヒット率など）"""
+    stats = llm.get_stats()
+    stats["client_disconnects"] = dict(client_disconnects)
+    stats["history_context"] = history_builder.stats()
+    stats["conversation_summaries"] = conversation_summaries.stats()
+    stats["prefetch"] = draft_prefetcher.stats()
+    stats["drafts"] = draft_store.stats()
+    stats["draft_ranking"] = draft_ranker.stats()
+    stats["templates"] = template_engine.stats()
+    return stats
+
+@app.get("/api/drafts/{application_id}")
+async def get_drafts(application_id: str, limit: int = 20):
+    """保存済みの下書きを新しい版から順に取得（validは現在の応募状態で生成したものか）"""
+    app = next((a for a in sample_applications if a.id == application_id), None)
+    if not app:
+        raise HTTPException(status_code=404, detail="Application not found")
+    
+    state = current_application_state(application_id)
+    drafts = [dict(draft, valid=draft["state_fingerprint"] == state) for draft in draft_store.versions(application_id, limit)]
+    return {
+        "application_id": application_id,
+        "latest_valid": next((draft for draft in drafts if draft["valid"]), None),
+        "drafts": drafts,
+        "total": len(drafts)
+    }
+
+@app.post("/api/template-recommendations/batch")
+async def get_template_recommendations_batch(request_data: dict):
+    """複数の応募（省略時は全応募）の推奨テンプレート上位top_k件をまとめて返すAPI"""
+    application_ids = request_data.get("application_ids") or [a.id for a in sample_applications]
+    top_k = request_data.get("top_k", 3)
+    if not isinstance(top_k, int) or top_k < 1:
+        raise HTTPException(status_code=400, detail="top_k must be a positive integer")
+    applications = {a.id: a for a in sample_applications}
+    unknown = [application_id for application_id in application_ids if application_id not in applications]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Application not found: {unknown}")
+    
+    started_at = time.perf_counter()
+    contexts = [build_status_context(applications[application_id]) for application_id in application_ids]
+    results = template_engine.recommend_templates_batch(contexts, top_k)
+    elapsed = time.perf_counter() - started_at
+    return {
+        "success": True,
+        "top_k": top_k,
+        "template_version": template_engine.snapshot.version,
+        "recommendations": {
+            application_id: [
+                {
+                    "template_name": rec.template_name,
+                    "relevance_score": rec.relevance_score,
+                    "reason": rec.reason,
+                    "sender": rec.sender,
+                    "receiver": rec.receiver,
+                    "template_type": rec.template_type.value
+                }
+                for rec in recommendations
+            ]
+            for application_id, recommendations in zip(application_ids, results)
+        },
+        "elapsed_ms": round(elapsed * 1000, 3)
+    }
+
 @app.get("/api/template-recommendations/{application_id}")
 async def get_template_recommendations(application_id: str):
     """テンプレート推奨API"""
@@ -432,29 +1023,8 @@ async def get_template_recommendations(application_id: str):
     if not app:
         raise HTTPException(status_code=404, detail="Application not found")
     
-    # メッセージ履歴を取得
-    messages = [m for m in all_message_history if m.application_id == application_id]
-    message_history = [
-        {
-            "timestamp": m.timestamp,
-            "subject": m.subject,
-            "content": m.content,
-            "is_outbound": m.is_outbound
-        }
-        for m in messages
-    ]
-    
     # ステータスコンテキストを作成
-    context = StatusContext(
-        current_status=app.status,
-        candidate_name=app.candidate_name,
-        company=app.company,
-        job_title=app.job_title,
-        enthusiasm_score=app.enthusiasm_score,
-        concern_score=app.concern_score,
-        latest_summary=app.latest_summary,
-        message_history=message_history
-    )
+    context = build_status_context(app)
     
     # テンプレート推奨を取得
     try:
@@ -480,7 +1050,8 @@ async def get_template_recommendations(application_id: str):
             "candidate_name": app.candidate_name,
             "current_status": app.status,
             "recommendations": formatted_recommendations,
-            "total_recommendations": len(formatted_recommendations)
+            "total_recommendations": len(formatted_recommendations),
+            "template_version": recommendations[0].template_version if recommendations else template_engine.snapshot.version
         }
     except Exception as e:
         return {
@@ -489,68 +1060,103 @@ async def get_template_recommendations(application_id: str):
             "application_id": application_id
         }
 
-@app.post("/api/generate-email-with-template/{application_id}")
-async def generate_email_with_template(application_id: str, request_data: dict):
-    """テンプレートを参考にしたメール生成API"""
-    # 対象の応募を取得
+@app.get("/api/instant-draft/{application_id}")
+async def get_instant_draft(application_id: str, template_name: Optional[str] = None, date: Optional[str] = None):
+    """テンプレートに応募の情報を差し込んだ下書きを即座に返すAPI（LLMを使わない）
+    
+    template_name省略時は推奨度の最も高いテンプレートを使う。dateを指定すると日付の差し込み箇所も埋める。
+    """
     app = next((a for a in sample_applications if a.id == application_id), None)
     if not app:
         raise HTTPException(status_code=404, detail="Application not found")
     
-    # 対応するネクストアクションを取得
-    next_action = next((a for a in sample_next_actions if a.application_id == application_id), None)
-    if not next_action:
-        raise HTTPException(status_code=404, detail="Next action not found")
-    
-    # 関連するメッセージ履歴を取得
-    messages = [m for m in all_message_history if m.application_id == application_id]
-    messages.sort(key=lambda x: x.timestamp)
-    
-    # 履歴サマリーを作成
-    history_context = ""
-    if messages:
-        history_context = "\n\n## 過去のやり取り履歴\n"
-        for msg in messages[-3:]:  # 最新3件を使用
-            direction = "送信" if msg.is_outbound else "受信"
-            history_context += f"""
-### {msg.timestamp} - {direction}
-**{msg.sender} → {msg.receiver}**
-件名: {msg.subject}
-内容: {msg.content}
-"""
+    started_at = time.perf_counter()
+    context = build_status_context(app)
+    snapshot = template_engine.snapshot
+    if template_name is None:
+        recommendations = template_engine.recommend_templates(context, snapshot)
+        if not recommendations:
+            return {"success": False, "error": "このステータスに対応するテンプレートがありません", "application_id": application_id}
+        template_name = recommendations[0].template_name
     
+    # 推奨・差し込みとも同じ版のテンプレートを使う（途中で再読み込みされても template_version と一致する）
+    filled = template_engine.fill_template(template_name, context, {JOB_ID: app.job_id, DATE: date}, snapshot)
+    if filled is None:
+        raise HTTPException(status_code=404, detail="Template not found")
+    elapsed = time.perf_counter() - started_at
+    return {
+        "success": True,
+        "application_id": application_id,
+        "template_name": template_name,
+        "template_version": snapshot.version,
+        "generated_subject": f"【{app.candidate_name}様】{app.company}の件について",
+        "generated_body": filled.body,
+        "filled": filled.filled,
+        "unresolved": filled.unresolved,
+        "date_candidates": date_candidates() if DATE in filled.unresolved else [],
+        "elapsed_ms": round(elapsed * 1000, 3)
+    }
+
+@app.get("/api/templates/snapshot")
+async def get_template_snapshot():
+    """現在使っているテンプレートの版"""
+    return template_engine.stats()
+
+@app.post("/api/templates/reload")
+async def reload_templates():
+    """テンプレート・ステータス分類ファイルの変更をすぐに反映するAPI（変更がなければ何もしない）"""
+    reloaded = await asyncio.to_thread(template_engine.reload)
+    return {"success": True, "reloaded": reloaded, "snapshot": template_engine.stats()}
+
+@app.post("/api/generate-email-with-template/{application_id}")
+async def generate_email_with_template(request: Request, application_id: str, request_data: dict):
+    """テンプレートを参考にしたメール生成API"""
     # テンプレート情報を取得
     template_name = request_data.get("template_name")
     reference_template = request_data.get("reference_template")
+    regenerate = check_flag("regenerate", request_data.get("regenerate", False))
+    ca_id = request_data.get("ca_id")
+    profile = check_profile("email", request_data.get("profile"))
     
-    # LLM用のコンテキストを作成
-    context = EmailGenerationContext(
-        candidate_name=app.candidate_name,
-        company=app.company,
-        job_title=app.job_title,
-        status=app.status,
-        latest_summary=app.latest_summary + history_context,
-        enthusiasm_score=app.enthusiasm_score,
-        concern_score=app.concern_score,
-        target_person=next_action.target_person,
-        current_template=next_action.message_template,
-        reference_template=reference_template,
-        template_name=template_name
+    next_action, messages, context, history = build_email_context(
+        application_id, template_name=template_name, reference_template=reference_template
     )
+    fingerprint = llm.email_fingerprint(context, profile)
+    
+    # 事前生成・保存済みの下書きがあれば即座に返す（regenerate=trueで作り直す）
+    saved = find_saved_draft(application_id, template_name, fingerprint) if not regenerate and profile is None else None
+    if saved is not None:
+        return {
+            "success": True,
+            "generated_subject": saved["subject"],
+            "generated_body": saved["body"],
+            "metadata": saved["metadata"],
+            "original_template": next_action.message_template,
+            "reference_template": reference_template,
+            "template_name": template_name,
+            "context_used": f"テンプレート「{template_name}」を参考に生成済みの下書き（第{saved['metadata'].get('draft_version')}版）"
+        }
     
     # AI文面生成
     try:
-        result = llm.generate_email_content(context)
+        result = await run_until_disconnect(
+            request,
+            llm.agenerate_email_content(context, regenerate=regenerate, owner=ca_id, profile=profile),
+            "generate-email-with-template"
+        )
+        save_draft(application_id, template_name, result, "regenerate" if regenerate else "generate", fingerprint)
         return {
             "success": True,
             "generated_subject": result["subject"],
             "generated_body": result["body"],
-            "metadata": result.get("metadata", {}),
+            "metadata": dict(result.get("metadata", {}), history=history.to_dict()),
             "original_template": next_action.message_template,
             "reference_template": reference_template,
             "template_name": template_name,
-            "context_used": f"テンプレート「{template_name}」を参考に、履歴{len(messages)}件を含む詳細コンテキストで生成"
+            "context_used": f"テンプレート「{template_name}」を参考に、履歴{len(messages)}件から{len(history.selected)}件を選んだ詳細コンテキストで生成"
         }
+    except HTTPException:
+        raise
     except Exception as e:
         return {
             "success": False,
@@ -560,6 +1166,68 @@ async def generate_email_with_template(application_id: str, request_data: dict):
             "template_name": template_name
         }
 
+@app.post("/api/generate-email-with-template/{application_id}/stream")
+async def generate_email_with_template_stream(application_id: str, request_data: dict):
+    """テンプレートを参考にしたメール生成API（SSEストリーミング）"""
+    template_name = request_data.get("template_name")
+    reference_template = request_data.get("reference_template")
+    regenerate = check_flag("regenerate", request_data.get("regenerate", False))
+    ca_id = request_data.get("ca_id")
+    profile = check_profile("email", request_data.get("profile"))
+    
+    next_action, messages, context, history = build_email_context(
+        application_id, template_name=template_name, reference_template=reference_template
+    )
+    # ストリーミングはテキスト形式で生成するため、そのプロンプトのフィンガープリントで保存する
+    # （保存済みの下書きは、非ストリーミング版で生成したものも使う）
+    fingerprint = llm.email_fingerprint(context, profile, structured=False)
+    saved = None
+    if not regenerate and profile is None:
+        saved = (
+            find_saved_draft(application_id, template_name, llm.email_fingerprint(context, profile))
+            or find_saved_draft(application_id, template_name, fingerprint)
+        )
+    
+    async def saved_events():
+        """生成済みの下書きを一括で流す"""
+        yield {"event": "subject", "data": saved["subject"]}
+        yield {"event": "body", "data": saved["body"]}
+        yield {"event": "done", "data": saved}
+    
+    async def event_stream():
+        # 切断時はStarletteがこのジェネレータをキャンセルし、Ollamaへのストリームも閉じられる
+        if saved is not None:
+            events = saved_events()
+        else:
+            events = llm.astream_email_content(context, regenerate=regenerate, owner=ca_id, profile=profile)
+        try:
+            async for event in events:
+                data = event["data"]
+                if event["event"] == "done":
+                    if saved is None:
+                        save_draft(application_id, template_name, data, "regenerate" if regenerate else "generate", fingerprint)
+                    # 最終結果は非ストリーミング版と同じ形式で返す
+                    data = {
+                        "success": True,
+                        "generated_subject": data["subject"],
+                        "generated_body": data["body"],
+                        "metadata": dict({"history": history.to_dict()}, **data.get("metadata", {})),
+                        "original_template": next_action.message_template,
+                        "reference_template": reference_template,
+                        "template_name": template_name,
+                        "context_used": f"テンプレート「{template_name}」を参考に、履歴{len(messages)}件から{len(history.selected)}件を選んだ詳細コンテキストで生成"
+                    }
+                yield f"event: {event['event']}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        except (asyncio.CancelledError, GeneratorExit):
+            record_client_disconnect("generate-email-with-template/stream")
+            raise
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/application/{application_id}", response_class=HTMLResponse)
 async def application_detail_page(application_id: str):
     """案件詳細画面"""
@@ -822,10 +1490,20 @@ async def application_detail_page(application_id: str):
                 element.classList.add('selected');
             }}
             
+            // 実行中のAI生成リクエスト（モーダルを閉じたら中断してサーバー側の生成も止める）
+            let aiRequestController = null;
+            
+            function startAIRequest() {{
+                if (aiRequestController) aiRequestController.abort();
+                aiRequestController = new AbortController();
+                return aiRequestController.signal;
+            }}
+            
             // テンプレートを使用してメール生成
             async function generateEmailWithTemplate(applicationId, templateName, templateContent) {{
                 const modal = document.getElementById('aiModal');
                 const modalBody = document.getElementById('aiModalBody');
+                const signal = startAIRequest();
                 
                 // ローディング表示
                 modalBody.innerHTML = `
@@ -833,8 +1511,25 @@ async def application_detail_page(application_id: str):
                         <div class="spinner"></div>
                         <p>テンプレート「${{templateName}}」を参考にQwen3で文面を生成中...</p>
                     </div>
+                    <div id="instantDraft"></div>
                 `;
                 
+                // 生成を待つ間、テンプレートに応募情報を差し込んだだけの下書きを先に表示する
+                fetch(`/api/instant-draft/${{applicationId}}?template_name=${{encodeURIComponent(templateName)}}`, {{ signal }})
+                    .then(response => response.json())
+                    .then(draft => {{
+                        const target = document.getElementById('instantDraft');
+                        if (!draft.success || !target) return;
+                        target.innerHTML = `
+                            <div class="ai-result">
+                                <h4>📝 差し込み済みテンプレート（AI生成完了までの下書き）</h4>
+                                <div class="ai-content">${{draft.generated_body}}</div>
+                                ${{draft.unresolved.length ? `<p style="font-size: 0.9em;">未入力の箇所: ${{draft.unresolved.length}}件</p>` : ''}}
+                            </div>
+                        `;
+                    }})
+                    .catch(() => {{}});
+                
                 try {{
                     const response = await fetch(`/api/generate-email-with-template/${{applicationId}}`, {{
                         method: 'POST',
@@ -844,7 +1539,8 @@ async def application_detail_page(application_id: str):
                         body: JSON.stringify({{
                             template_name: templateName,
                             reference_template: templateContent
-                        }})
+                        }}),
+                        signal
                     }});
                     
                     const result = await response.json();
@@ -878,6 +1574,7 @@ async def application_detail_page(application_id: str):
                         `;
                     }}
                 }} catch (error) {{
+                    if (error.name === 'AbortError') return;
                     modalBody.innerHTML = `
                         <div class="ai-result">
                             <h4>❌ エラーが発生しました</h4>
@@ -887,10 +1584,67 @@ async def application_detail_page(application_id: str):
                 }}
             }}
             
+            // テンプレートを使用してメール生成（SSEストリーミング）
+            async function streamEmailWithTemplate(applicationId, templateName, templateContent, onProgress, signal, regenerate = false) {{
+                const response = await fetch(`/api/generate-email-with-template/${{applicationId}}/stream`, {{
+                    method: 'POST',
+                    headers: {{
+                        'Content-Type': 'application/json'
+                    }},
+                    body: JSON.stringify({{
+                        template_name: templateName,
+                        reference_template: templateContent,
+                        regenerate: regenerate
+                    }}),
+                    signal
+                }});
+                
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                let subject = '';
+                let body = '';
+                let result = null;
+                
+                while (true) {{
+                    const {{ done, value }} = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, {{ stream: true }});
+                    const events = buffer.split('\\n\\n');
+                    buffer = events.pop();
+                    
+                    for (const rawEvent of events) {{
+                        let eventName = 'message';
+                        let data = '';
+                        for (const line of rawEvent.split('\\n')) {{
+                            if (line.startsWith('event: ')) eventName = line.slice(7);
+                            else if (line.startsWith('data: ')) data += line.slice(6);
+                        }}
+                        const payload = JSON.parse(data);
+                        if (eventName === 'subject') {{
+                            subject += payload;
+                            onProgress(subject, body);
+                        }} else if (eventName === 'subject_reset') {{
+                            // 件名の行が再び現れた場合は後の件名を使う
+                            subject = '';
+                            onProgress(subject, body);
+                        }} else if (eventName === 'body') {{
+                            body += payload;
+                            onProgress(subject, body);
+                        }} else if (eventName === 'done') {{
+                            result = payload;
+                        }}
+                    }}
+                }}
+                
+                return result;
+            }}
+            
             // AI文面生成（自動テンプレート選択付き）
-            async function generateAIEmail(applicationId) {{
+            async function generateAIEmail(applicationId, regenerate = false) {{
                 const modal = document.getElementById('aiModal');
                 const modalBody = document.getElementById('aiModalBody');
+                const signal = startAIRequest();
                 
                 // モーダルを表示
                 modal.style.display = 'block';
@@ -905,7 +1659,7 @@ async def application_detail_page(application_id: str):
                 
                 try {{
                     // 1. まずテンプレート推奨を取得
-                    const templateResponse = await fetch(`/api/template-recommendations/${{applicationId}}`);
+                    const templateResponse = await fetch(`/api/template-recommendations/${{applicationId}}`, {{ signal }});
                     const templateResult = await templateResponse.json();
                     
                     if (templateResult.success && templateResult.recommendations.length > 0) {{
@@ -920,21 +1674,27 @@ async def application_detail_page(application_id: str):
                             </div>
                         `;
                         
-                        // 2. 選択されたテンプレートでAI文面生成
-                        const emailResponse = await fetch(`/api/generate-email-with-template/${{applicationId}}`, {{
-                            method: 'POST',
-                            headers: {{
-                                'Content-Type': 'application/json'
+                        // 2. 選択されたテンプレートでAI文面生成（生成途中の文面を逐次表示）
+                        const emailResult = await streamEmailWithTemplate(
+                            applicationId,
+                            bestTemplate.template_name,
+                            bestTemplate.template_content,
+                            (subject, body) => {{
+                                modalBody.innerHTML = `
+                                    <div class="ai-result">
+                                        <h4>✍️ 「${{bestTemplate.template_name}}」を参考に生成中...</h4>
+                                        <p><strong>件名:</strong></p>
+                                        <div class="ai-content">${{subject}}</div>
+                                        <p><strong>本文:</strong></p>
+                                        <div class="ai-content">${{body}}</div>
+                                    </div>
+                                `;
                             }},
-                            body: JSON.stringify({{
-                                template_name: bestTemplate.template_name,
-                                reference_template: bestTemplate.template_content
-                            }})
-                        }});
+                            signal,
+                            regenerate
+                        );
                         
-                        const emailResult = await emailResponse.json();
-                        
-                        if (emailResult.success) {{
+                        if (emailResult && emailResult.success) {{
                             modalBody.innerHTML = `
                                 <div class="ai-result">
                                     <h4>✅ AI文面生成完了</h4>
@@ -966,8 +1726,9 @@ async def application_detail_page(application_id: str):
                                     <h4>🔧 生成情報</h4>
                                     <p><strong>モデル:</strong> ${{emailResult.metadata.model || 'Qwen3:30b'}}</p>
                                     <p><strong>テンプレート:</strong> ${{emailResult.template_name}}</p>
-                                    <p><strong>生成方式:</strong> テンプレート参考型</p>
+                                    <p><strong>生成方式:</strong> テンプレート参考型${{emailResult.metadata.prefetched ? '（事前生成済み）' : ''}}</p>
                                     <p><strong>生成時刻:</strong> ${{new Date().toLocaleString('ja-JP')}}</p>
+                                    <button class="copy-button" onclick="generateAIEmail('${{applicationId}}', true)">🔄 再生成</button>
                                 </div>
                                 
                                 <div style="margin-top: 20px; padding-top: 20px; border-top: 1px solid #eee;">
@@ -990,7 +1751,7 @@ async def application_detail_page(application_id: str):
                             modalBody.innerHTML = `
                                 <div class="ai-result">
                                     <h4>❌ 生成に失敗しました</h4>
-                                    <p>エラー: ${{emailResult.error}}</p>
+                                    <p>エラー: ${{emailResult ? emailResult.error : 'ストリームが途中で終了しました'}}</p>
                                     <p>選択テンプレート: ${{bestTemplate.template_name}}</p>
                                     <button class="send-button" onclick="showTemplateRecommendations('${{applicationId}}')">テンプレート提案を試す</button>
                                 </div>
@@ -1010,7 +1771,8 @@ async def application_detail_page(application_id: str):
                             method: 'POST',
                             headers: {{
                                 'Content-Type': 'application/json'
-                            }}
+                            }},
+                            signal
                         }});
                         
                         const result = await response.json();
@@ -1053,6 +1815,7 @@ async def application_detail_page(application_id: str):
                     }}
                     
                 }} catch (error) {{
+                    if (error.name === 'AbortError') return;
                     modalBody.innerHTML = `
                         <div style="text-align: center; padding: 40px; color: #f44336;">
                             <h4>❌ 通信エラー</h4>
@@ -1066,6 +1829,10 @@ async def application_detail_page(application_id: str):
             // モーダルを閉じる
             function closeAIModal() {{
                 document.getElementById('aiModal').style.display = 'none';
+                if (aiRequestController) {{
+                    aiRequestController.abort();
+                    aiRequestController = null;
+                }}
             }}
             
             // クリップボードにコピー
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+LLM呼び出しのベンチマーク
+Ollamaモックサーバー（または実サーバー）に対してメール生成を同時実行し、
+スループットとレイテンシ分布を計測する
+
+使い方:
+    python scripts/bench_llm.py --requests 200 --concurrency 16
+    python scripts/bench_llm.py --base-url http://gpu-host:11434 --requests 20
+    python scripts/bench_llm.py --backends 2 --stall-rate 0.05 --hedge  # ヘッジの効果を確認
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+# プロジェクトルートをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.llm import EmailGenerationContext, QwenLLM
+from app.core.llm_metrics import percentile
+from scripts.mock_ollama_server import MockOllamaConfig, run_in_thread
+
+
+def build_context(index: int) -> EmailGenerationContext:
+    """ベンチマーク用のコンテキスト（キャッシュ・相乗りが効かないよう案件ごとに変える）"""
+    return EmailGenerationContext(
+        candidate_name=f"候補者{index:04d}",
+        company="Acme株式会社",
+        job_title="シニアエンジニア",
+        status="書類選考中",
+        latest_summary="技術力は高いが、転職理由を詳しく聞く必要がある。",
+        enthusiasm_score=0.8,
+        concern_score=0.3,
+        target_person="CS",
+        current_template="",
+    )
+
+
+async def run_benchmark(llm: QwenLLM, requests: int, concurrency: int, stream: bool) -> dict:
+    """指定件数のメール生成を同時実行して計測"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    first_text = []
+
+    async def one(index: int):
+        async with semaphore:
+            started_at = time.perf_counter()
+            if stream:
+                async for event in llm.astream_email_content(build_context(index)):
+                    if event["event"] == "done":
+                        first_text.append(event["data"]["metadata"]["time_to_first_text"])
+            else:
+                await llm.agenerate_email_content(build_context(index))
+            latencies.append(time.perf_counter() - started_at)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started_at
+    await llm.aclose()
+
+    report = {
+        "requests": requests,
+        "concurrency": concurrency,
+        "stream": stream,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 2),
+        "latency_s": {
+            "p50": round(percentile(latencies, 50), 3),
+            "p90": round(percentile(latencies, 90), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "max": round(max(latencies), 3),
+        },
+        "llm_stats": llm.get_stats(),
+    }
+    if first_text:
+        report["time_to_first_text_s"] = {
+            "p50": round(percentile(first_text, 50), 3),
+            "p99": round(percentile(first_text, 99), 3),
+        }
+    return report
+
+
+def main():
+    """メイン実行関数"""
+    parser = argparse.ArgumentParser(description="LLMベンチマーク")
+    parser.add_argument("--base-url", default=None, help="省略時はモックサーバーをプロセス内で起動（カンマ区切りで複数指定可）")
+    parser.add_argument("--port", type=int, default=11435, help="モックサーバーのポート（複数台の場合は連番）")
+    parser.add_argument("--backends", type=int, default=1, help="起動するモックサーバーの台数")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--stream", action="store_true", help="ストリーミング生成を計測")
+    parser.add_argument("--structured", action="store_true", help="構造化出力モードで計測")
+    parser.add_argument("--token-latency", type=float, default=0.005)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--stall-rate", type=float, default=0.0)
+    parser.add_argument("--stall-seconds", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--hedge", action="store_true", help="ヘッジ付きリクエストを有効化")
+    parser.add_argument("--hedge-percentile", type=float, default=95.0)
+    args = parser.parse_args()
+
+    servers = []
+    if args.base_url is not None:
+        base_urls = args.base_url.split(",")
+    else:
+        base_urls = []
+        for index in range(args.backends):
+            config = MockOllamaConfig(
+                token_latency=args.token_latency,
+                error_rate=args.error_rate,
+                stall_rate=args.stall_rate,
+                stall_seconds=args.stall_seconds,
+                seed=args.seed + index,
+            )
+            server, base_url = run_in_thread(config, port=args.port + index)
+            servers.append(server)
+            base_urls.append(base_url)
+
+    # 生成処理のデバッグ出力は計測結果の妨げになるため抑制する
+    llm = QwenLLM(
+        base_urls=base_urls,
+        structured_output=args.structured,
+        max_connections=args.concurrency,
+        hedge_requests=args.hedge,
+        hedge_percentile=args.hedge_percentile,
+    )
+    devnull = open(os.devnull, "w")
+    stdout, sys.stdout = sys.stdout, devnull
+    try:
+        report = asyncio.run(run_benchmark(llm, args.requests, args.concurrency, args.stream))
+    finally:
+        sys.stdout = stdout
+        devnull.close()
+        for server in servers:
+            server.should_exit = True
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+テンプレート推奨の一括計算のベンチマーク
+CAの担当応募をまとめて推奨する場合について、従来のスカラー計算（応募ごと・テンプレートごとの関数呼び出し）と
+NumPyでの一括計算の処理時間を比べ、スコア・推奨結果が完全に一致することを確認する
+
+使い方:
+    python scripts/bench_template_batch.py --applications 500
+    python scripts/bench_template_batch.py --applications 2000 --top-k 5
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+# プロジェクトルートをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.template_engine import StatusContext, TemplateEngine
+
+EXTRA_STATUSES = ["一次面接日程調整中", "最終面接完了", "内定承諾待ち", "書類選考中", "退職交渉中", "面談"]
+
+
+def build_contexts(engine: TemplateEngine, count: int, rng: random.Random):
+    """ステータス・スコア・直近の件名がばらばらな応募を作る"""
+    statuses = list(engine.status_mapping) + EXTRA_STATUSES
+    names = list(engine.templates)
+    contexts = []
+    for index in range(count):
+        history = [
+            {"subject": rng.choice([f"Re: {rng.choice(names)}", "ご連絡", rng.choice(names)])}
+            for _ in range(rng.randint(0, 5))
+        ]
+        contexts.append(StatusContext(
+            current_status=rng.choice(statuses),
+            candidate_name=f"候補者{index:04d}",
+            company="Acme株式会社",
+            job_title="シニアエンジニア",
+            enthusiasm_score=round(rng.random(), 2),
+            concern_score=round(rng.random(), 2),
+            latest_summary="",
+            message_history=history or None,
+        ))
+    return contexts
+
+
+def scalar_score(engine: TemplateEngine, name: str, context: StatusContext) -> float:
+    """1件の応募・1件のテンプレートの関連性スコア（recommend_templates と同じスカラー計算）"""
+    recent_subjects = [msg.get("subject", "").lower() for msg in (context.message_history or [])[-3:]]
+    return engine._score_features(engine.template_index[name], context, recent_subjects)
+
+
+def best_of(repeat: int, func):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started_at)
+    return best, result
+
+
+def main():
+    """メイン実行関数"""
+    parser = argparse.ArgumentParser(description="テンプレート推奨の一括計算ベンチマーク")
+    parser.add_argument("--applications", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    engine = TemplateEngine()
+    contexts = build_contexts(engine, args.applications, random.Random(args.seed))
+    names = list(engine.templates)
+
+    # スコア行列（応募 × 全テンプレート）
+    scalar_time, scalar_scores = best_of(args.repeat, lambda: [
+        [scalar_score(engine, name, context) for name in names]
+        for context in contexts
+    ])
+
+    def batch_scores():
+        scorer = engine._batch_scorer
+        status_ids = scorer.status_ids([context.current_status for context in contexts])
+        return scorer.score_matrix(
+            [context.enthusiasm_score for context in contexts],
+            [context.concern_score for context in contexts],
+            status_ids,
+            scorer.recent_flags([context.message_history for context in contexts]),
+        )
+
+    engine.recommend_templates_batch(contexts[:1], args.top_k)  # 計算器を作っておく
+    batch_time, matrix = best_of(args.repeat, batch_scores)
+    score_mismatches = sum(
+        1 for row, scores in enumerate(scalar_scores) for column, score in enumerate(scores)
+        if matrix[row, column] != score
+    )
+
+    # 推奨結果（上位k件）
+    loop_time, loop_results = best_of(args.repeat, lambda: [
+        engine.recommend_templates(context)[:args.top_k] for context in contexts
+    ])
+    top_time, batch_results = best_of(args.repeat, lambda: engine.recommend_templates_batch(contexts, args.top_k))
+    recommendation_mismatches = sum(
+        1 for expected, actual in zip(loop_results, batch_results)
+        if [(r.template_name, r.relevance_score) for r in expected] != [(r.template_name, r.relevance_score) for r in actual]
+    )
+
+    pairs = len(contexts) * len(names)
+    print(f"応募数: {len(contexts)} / テンプレート数: {len(names)}（{pairs}組）")
+    print(f"スコア行列  スカラー: {scalar_time * 1000:8.2f} ms / 一括: {batch_time * 1000:8.2f} ms "
+          f"（{scalar_time / batch_time:.1f}x、不一致 {score_mismatches}組）")
+    print(f"上位{args.top_k}件  ループ: {loop_time * 1000:8.2f} ms / 一括: {top_time * 1000:8.2f} ms "
+          f"（{loop_time / top_time:.1f}x、不一致 {recommendation_mismatches}件）")
+
+
+if __name__ == "__main__":
+    main()
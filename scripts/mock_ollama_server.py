@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+負荷試験用のOllamaモックサーバー
+GPUなしで /api/generate（ストリーミング・非ストリーミング）を再現する。
+トークンごとの遅延・プロンプト評価時間・エラー率・停止（ストール）率と、
+<think>ブロックや崩れた件名/本文を含む定型出力を設定できる。
+
+使い方:
+    python scripts/mock_ollama_server.py --port 11435 --token-latency 0.02
+    # QwenLLM(base_url="http://localhost:11435") で接続する
+
+テスト・ベンチマークからは run_in_thread() でプロセス内に起動できる。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+# プロジェクトルートをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import uvicorn
+
+
+# 定型出力（シナリオ名, 本文）
+CANNED_OUTPUTS: Dict[str, str] = {
+    "well_formed": (
+        "<think>\n候補者の状況を整理します。熱意は高く、懸念は少ないようです。\n</think>\n"
+        "件名: 【ご連絡】面接日程のご案内\n"
+        "本文: ●●様\n\nいつもお世話になっております。\n面接日程についてご案内いたします。\n\n"
+        "ご確認のほどよろしくお願いいたします。"
+    ),
+    "no_think": (
+        "件名: 選考状況のご報告\n"
+        "本文: お世話になっております。\n現在の選考状況についてご報告いたします。"
+    ),
+    "unclosed_think": (
+        "<think>\n宛先はCSなので丁寧に書く。\n"
+        "件名: 書類選考通過のご連絡\n"
+        "本文: 書類選考を通過されました。次回の面接についてご案内いたします。"
+    ),
+    "malformed": (
+        "承知しました。以下のようなメールはいかがでしょうか。\n"
+        "面接のご案内\nお世話になっております。面接についてご連絡いたします。"
+    ),
+}
+
+DEFAULT_SCENARIO_WEIGHTS = {"well_formed": 0.6, "no_think": 0.2, "unclosed_think": 0.1, "malformed": 0.1}
+
+# モデルごとのトークン生成時間の倍率（小さいモデルほど速い）
+DEFAULT_MODEL_SPEED = {"qwen3:30b": 1.0, "qwen3:14b": 0.6, "qwen3:8b": 0.35, "qwen3:4b": 0.2}
+
+THINK_PATTERN = re.compile(r"<think>.*?</think>\n?", re.DOTALL)
+
+
+@dataclass
+class MockOllamaConfig:
+    """モックサーバーの挙動設定（秒単位）"""
+    token_latency: float = 0.02
+    prompt_eval_delay: float = 0.05
+    prompt_eval_per_kchar: float = 0.05
+    prefix_cache: bool = True
+    error_rate: float = 0.0
+    stall_rate: float = 0.0
+    stall_seconds: float = 30.0
+    scenario_weights: Dict[str, float] = field(default_factory=lambda: dict(DEFAULT_SCENARIO_WEIGHTS))
+    model_speed: Dict[str, float] = field(default_factory=lambda: dict(DEFAULT_MODEL_SPEED))
+    seed: Optional[int] = None
+
+
+def _tokenize(text: str, size: int = 2) -> List[str]:
+    """出力をおおよそのトークン単位（数文字ずつ）に区切る"""
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def _common_prefix_length(a: str, b: str) -> int:
+    length = min(len(a), len(b))
+    for i in range(length):
+        if a[i] != b[i]:
+            return i
+    return length
+
+
+def _structured_output(schema: Dict[str, Any], malformed: bool) -> str:
+    """JSONスキーマ指定時の出力"""
+    properties = schema.get("properties", {}) if isinstance(schema, dict) else {}
+    if "subject" in properties:
+        data = {"subject": "【ご連絡】面接日程のご案内", "body": "いつもお世話になっております。\n面接日程についてご案内いたします。"}
+    elif "enthusiasm_score" in properties:
+        data = {"enthusiasm_score": 0.8, "concern_score": 0.3, "analysis_reason": "前向きな返信が続いているため"}
+    elif "action" in properties:
+        data = {"action": "候補者に面接日程を確認する", "reason": "日程調整が未完了のため", "priority": "高"}
+    else:
+        data = {key: "" for key in properties}
+    text = json.dumps(data, ensure_ascii=False)
+    return text[: len(text) // 2] if malformed else text
+
+
+class MockOllama:
+    """モックの状態（統計・直前のプロンプト）"""
+
+    def __init__(self, config: MockOllamaConfig):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.last_prompt = ""
+        self.stats = {"requests": 0, "completed": 0, "errors": 0, "stalls": 0, "cancelled": 0, "in_flight": 0}
+
+    def plan(self, payload: Dict[str, Any]) -> Tuple[str, float, int, int]:
+        """出力・プロンプト評価時間・プロンプトトークン数・応答に含めない思考トークン数を決める"""
+        prompt = payload.get("prompt", "")
+        cached = _common_prefix_length(prompt, self.last_prompt) if self.config.prefix_cache else 0
+        self.last_prompt = prompt
+        prompt_eval = self.config.prompt_eval_delay + self.config.prompt_eval_per_kchar * (len(prompt) - cached) / 1000
+
+        scenarios = list(self.config.scenario_weights)
+        weights = [self.config.scenario_weights[name] for name in scenarios]
+        scenario = self.random.choices(scenarios, weights=weights)[0]
+        if payload.get("format"):
+            output = _structured_output(payload["format"], malformed=scenario == "malformed")
+        else:
+            output = CANNED_OUTPUTS[scenario]
+
+        # thinkを指定した場合、思考部分は応答に含めない（think=Trueなら生成時間だけかかる）
+        hidden_tokens = 0
+        if "think" in payload:
+            if payload["think"]:
+                hidden_tokens = sum(len(_tokenize(block)) for block in THINK_PATTERN.findall(output))
+            output = THINK_PATTERN.sub("", output).replace("<think>\n", "")
+
+        num_predict = payload.get("options", {}).get("num_predict")
+        tokens = _tokenize(output)
+        if isinstance(num_predict, int) and num_predict > 0:
+            output = "".join(tokens[:max(0, num_predict - hidden_tokens)])
+            hidden_tokens = min(hidden_tokens, num_predict)
+        return output, prompt_eval, max(1, len(prompt) // 2), hidden_tokens
+
+    def final_fields(
+        self, prompt_eval: float, prompt_tokens: int, eval_count: int, started_at: float, truncated: bool = False
+    ) -> Dict[str, Any]:
+        """Ollama互換の計測フィールド（ナノ秒）"""
+        total = time.perf_counter() - started_at
+        return {
+            "done": True,
+            "done_reason": "length" if truncated else "stop",
+            "total_duration": int(total * 1e9),
+            "load_duration": 0,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(prompt_eval * 1e9),
+            "eval_count": eval_count,
+            "eval_duration": int(max(0.0, total - prompt_eval) * 1e9),
+        }
+
+
+def create_app(config: Optional[MockOllamaConfig] = None) -> FastAPI:
+    """モックサーバーのFastAPIアプリを作成"""
+    mock = MockOllama(config or MockOllamaConfig())
+    app = FastAPI(title="Mock Ollama")
+    app.state.mock = mock
+
+    @app.get("/api/tags")
+    async def tags():
+        """モデル一覧（ヘルスチェック用）"""
+        return {"models": [{"name": "qwen3:30b"}, {"name": "qwen3:8b"}]}
+
+    @app.get("/mock/stats")
+    async def stats():
+        """モックの処理件数"""
+        return mock.stats
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        payload = await request.json()
+        model = payload.get("model", "qwen3:30b")
+        mock.stats["requests"] += 1
+        started_at = time.perf_counter()
+
+        if mock.random.random() < mock.config.error_rate:
+            mock.stats["errors"] += 1
+            return JSONResponse(status_code=500, content={"error": "mock: simulated failure"})
+
+        output, prompt_eval, prompt_tokens, hidden_tokens = mock.plan(payload)
+        tokens = _tokenize(output)
+        eval_count = len(tokens) + hidden_tokens
+        num_predict = payload.get("options", {}).get("num_predict")
+        truncated = isinstance(num_predict, int) and 0 < num_predict <= eval_count
+        token_latency = mock.config.token_latency * mock.config.model_speed.get(model, 1.0)
+        stall = mock.random.random() < mock.config.stall_rate
+        if stall:
+            mock.stats["stalls"] += 1
+
+        async def wait_prompt_eval():
+            await asyncio.sleep(mock.config.stall_seconds if stall else prompt_eval)
+
+        if not payload.get("stream", True):
+            async def wait_disconnect():
+                while (await request.receive())["type"] != "http.disconnect":
+                    pass
+
+            async def work():
+                await wait_prompt_eval()
+                await asyncio.sleep(token_latency * eval_count)
+
+            # Ollamaと同様、クライアントが切断したら生成を打ち切る
+            mock.stats["in_flight"] += 1
+            generation = asyncio.ensure_future(work())
+            disconnect = asyncio.ensure_future(wait_disconnect())
+            try:
+                await asyncio.wait({generation, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                mock.stats["in_flight"] -= 1
+                disconnect.cancel()
+                aborted = not generation.done()
+                if aborted:
+                    generation.cancel()
+                    mock.stats["cancelled"] += 1
+            if aborted:
+                return JSONResponse(status_code=499, content={"error": "mock: client disconnected"})
+            mock.stats["completed"] += 1
+            body = {"model": model, "response": output}
+            body.update(mock.final_fields(prompt_eval, prompt_tokens, eval_count, started_at, truncated))
+            return body
+
+        async def token_stream():
+            mock.stats["in_flight"] += 1
+            finished = False
+            try:
+                await wait_prompt_eval()
+                await asyncio.sleep(token_latency * hidden_tokens)
+                for token in tokens:
+                    yield json.dumps({"model": model, "response": token, "done": False}, ensure_ascii=False) + "\n"
+                    await asyncio.sleep(token_latency)
+                final = {"model": model, "response": ""}
+                final.update(mock.final_fields(prompt_eval, prompt_tokens, eval_count, started_at, truncated))
+                finished = True
+                mock.stats["completed"] += 1
+                yield json.dumps(final) + "\n"
+            finally:
+                mock.stats["in_flight"] -= 1
+                if not finished:
+                    mock.stats["cancelled"] += 1
+
+        return StreamingResponse(token_stream(), media_type="application/x-ndjson")
+
+    return app
+
+
+def run_in_thread(config: Optional[MockOllamaConfig] = None, host: str = "127.0.0.1", port: int = 11435):
+    """モックサーバーを別スレッドで起動し、(サーバー, base_url) を返す
+
+    停止するには server.should_exit = True を設定する。
+    """
+    server = uvicorn.Server(uvicorn.Config(create_app(config), host=host, port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, f"http://{host}:{port}"
+
+
+def main():
+    """メイン実行関数"""
+    parser = argparse.ArgumentParser(description="Ollamaモックサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--token-latency", type=float, default=0.02, help="1トークンあたりの生成時間（秒）")
+    parser.add_argument("--prompt-eval-delay", type=float, default=0.05, help="プロンプト評価の固定時間（秒）")
+    parser.add_argument("--prompt-eval-per-kchar", type=float, default=0.05, help="未キャッシュのプロンプト1000文字あたりの評価時間（秒）")
+    parser.add_argument("--no-prefix-cache", action="store_true", help="プロンプト先頭一致のキャッシュを無効化")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="HTTP 500を返す割合")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="応答が止まる割合")
+    parser.add_argument("--stall-seconds", type=float, default=30.0, help="停止時の待ち時間（秒）")
+    parser.add_argument("--malformed-rate", type=float, default=None, help="崩れた出力の割合")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    weights = dict(DEFAULT_SCENARIO_WEIGHTS)
+    if args.malformed_rate is not None:
+        scale = (1 - args.malformed_rate) / (1 - weights["malformed"])
+        weights = {name: weight * scale for name, weight in weights.items()}
+        weights["malformed"] = args.malformed_rate
+
+    config = MockOllamaConfig(
+        token_latency=args.token_latency,
+        prompt_eval_delay=args.prompt_eval_delay,
+        prompt_eval_per_kchar=args.prompt_eval_per_kchar,
+        prefix_cache=not args.no_prefix_cache,
+        error_rate=args.error_rate,
+        stall_rate=args.stall_rate,
+        stall_seconds=args.stall_seconds,
+        scenario_weights=weights,
+        seed=args.seed,
+    )
+    print(f"🧪 Ollamaモックサーバーを起動します: http://{args.host}:{args.port}")
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+テスト共通の設定
+プロジェクトルートをパスに追加し、モックOllamaサーバーのフィクスチャを提供する
+"""
+
+import os
+import socket
+import sys
+
+import pytest
+
+# プロジェクトルートをパスに追加
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.mock_ollama_server import MockOllamaConfig, run_in_thread
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="session")
+def mock_ollama_url():
+    """思考なしの整形済み応答を遅延なしで返すモックOllamaのURL"""
+    config = MockOllamaConfig(
+        token_latency=0.0, prompt_eval_delay=0.0, prompt_eval_per_kchar=0.0,
+        scenario_weights={"no_think": 1.0}, seed=1,
+    )
+    server, base_url = run_in_thread(config, port=_free_port())
+    yield base_url
+    server.should_exit = True
+
+
+@pytest.fixture(scope="session")
+def malformed_ollama_url():
+    """構造化出力で常に途中で切れたJSONを返すモックOllamaのURL"""
+    config = MockOllamaConfig(
+        token_latency=0.0, prompt_eval_delay=0.0, prompt_eval_per_kchar=0.0,
+        scenario_weights={"malformed": 1.0}, seed=1,
+    )
+    server, base_url = run_in_thread(config, port=_free_port())
+    yield base_url
+    server.should_exit = True
@@ -0,0 +1,113 @@
+"""ConversationSummarizer のテスト（ウォーターマーク、新しいメッセージだけを要約へ反映すること）"""
+
+import asyncio
+from dataclasses import dataclass
+from typing import Optional
+
+from app.core.conversation_summary import ConversationSummarizer
+
+
+@dataclass
+class Application:
+    id: str
+    history_summary: Optional[str] = None
+    summary_version: int = 0
+    summary_watermark: Optional[str] = None
+
+
+@dataclass
+class Message:
+    id: str
+    content: str
+    subject: str = "ご連絡"
+    timestamp: str = "2024-12-01 10:00"
+    sender: str = "CA"
+    receiver: str = "候補者"
+    is_outbound: bool = True
+
+
+class FakeLLM:
+    """受け取ったメッセージを要約の末尾に足していくだけのLLM（fail_onの本文を含むと失敗する）"""
+
+    def __init__(self, fail_on: Optional[str] = None, delay: float = 0.0):
+        self.fail_on = fail_on
+        self.delay = delay
+        self.calls = []
+
+    async def aupdate_conversation_summary(self, summary, message, max_chars, priority, owner):
+        self.calls.append(message)
+        await asyncio.sleep(self.delay)
+        if self.fail_on is not None and self.fail_on in message:
+            return {"summary": summary, "error": "生成に失敗しました"}
+        body = message.splitlines()[-1]
+        return {"summary": f"{summary} / {body}" if summary else body}
+
+
+def make_messages(count):
+    return [Message(f"m{i}", f"本文{i}") for i in range(1, count + 1)]
+
+
+def test_pending_follows_the_watermark():
+    messages = make_messages(3)
+    application = Application("app_001")
+    assert ConversationSummarizer.pending(application, messages) == messages
+    application.summary_watermark = "m2"
+    assert ConversationSummarizer.pending(application, messages) == messages[2:]
+    # 反映済みのメッセージが一覧から消えた場合は最初から反映し直す
+    application.summary_watermark = "m9"
+    assert ConversationSummarizer.pending(application, messages) == messages
+
+
+def test_refresh_folds_only_new_messages():
+    llm = FakeLLM()
+    summarizer = ConversationSummarizer(llm)
+    application = Application("app_001")
+    messages = make_messages(2)
+
+    report = asyncio.run(summarizer.refresh(application, messages))
+    assert report == {"application_id": "app_001", "folded": 2, "version": 2, "watermark": "m2", "pending": 0}
+    assert application.history_summary == "本文1 / 本文2"
+
+    messages += [Message("m3", "本文3")]
+    report = asyncio.run(summarizer.refresh(application, messages))
+    assert report["folded"] == 1 and report["version"] == 3 and report["watermark"] == "m3"
+    assert len(llm.calls) == 3 and "本文3" in llm.calls[-1]
+    assert application.history_summary == "本文1 / 本文2 / 本文3"
+
+    assert asyncio.run(summarizer.refresh(application, messages))["folded"] == 0
+    assert len(llm.calls) == 3
+
+
+def test_failure_stops_at_the_failed_message_and_resumes_there():
+    llm = FakeLLM(fail_on="本文2")
+    summarizer = ConversationSummarizer(llm)
+    application = Application("app_001")
+    messages = make_messages(3)
+
+    report = asyncio.run(summarizer.refresh(application, messages))
+    assert report["folded"] == 1 and report["watermark"] == "m1" and report["pending"] == 2
+    assert report["error"] == "生成に失敗しました"
+
+    llm.fail_on = None
+    report = asyncio.run(summarizer.refresh(application, messages))
+    assert report["folded"] == 2 and report["watermark"] == "m3"
+    assert application.history_summary == "本文1 / 本文2 / 本文3"
+    assert summarizer.stats()["failures"] == 1
+
+
+def test_messages_arriving_during_a_refresh_are_folded_afterwards():
+    async def scenario():
+        llm = FakeLLM(delay=0.01)
+        summarizer = ConversationSummarizer(llm)
+        application = Application("app_001")
+        messages = make_messages(2)
+        assert summarizer.schedule_refresh(application, messages)
+        await asyncio.sleep(0)
+        assert summarizer.schedule_refresh(application, messages + [Message("m3", "本文3")])
+        await summarizer._tasks["app_001"]
+        assert not summarizer.schedule_refresh(application, messages + [Message("m3", "本文3")])
+        return application, llm
+
+    application, llm = asyncio.run(scenario())
+    assert application.summary_watermark == "m3" and application.summary_version == 3
+    assert len(llm.calls) == 3
@@ -0,0 +1,126 @@
+"""DraftPrefetcher のテスト（期限順の事前生成、同じ状態での重複生成の防止、状態変化・停止での破棄）"""
+
+import asyncio
+from datetime import date, timedelta
+
+from app.core.draft_prefetch import DraftPrefetcher, PrefetchJob
+
+
+def day(offset: int) -> str:
+    return (date.today() + timedelta(days=offset)).isoformat()
+
+
+class Harness:
+    """対象・状態・生成をテストから差し替えられるようにまとめたもの"""
+
+    def __init__(self, jobs, **kwargs):
+        self.job_list = jobs
+        self.states = {job.application_id: "v1" for job in jobs}
+        self.generated = []
+        self.results = {}
+        self.on_generate = None
+        self.prefetcher = DraftPrefetcher(self.jobs, self.state, self.generate, **kwargs)
+
+    def jobs(self):
+        return list(self.job_list)
+
+    def state(self, application_id):
+        return self.states[application_id]
+
+    async def generate(self, job):
+        self.generated.append(job.application_id)
+        if self.on_generate is not None:
+            self.on_generate(job)
+        result = self.results.get(job.application_id, {"subject": "件名", "body": "本文", "metadata": {}})
+        return "面接日程調整", result
+
+
+def test_due_jobs_are_ordered_by_due_date_then_priority_within_horizon():
+    harness = Harness([
+        PrefetchJob.create("app_low", day(1), "low"),
+        PrefetchJob.create("app_late", day(5), "high"),
+        PrefetchJob.create("app_high", day(1) + "T09:00", "high"),
+        PrefetchJob.create("app_today", day(0), "low"),
+    ], horizon_days=2)
+    assert [job.application_id for job in harness.prefetcher.due_jobs()] == ["app_today", "app_high", "app_low"]
+
+
+def test_prefetched_draft_is_served_and_not_regenerated():
+    harness = Harness([PrefetchJob.create("app_001", day(0), "high")])
+    prefetcher = harness.prefetcher
+    assert asyncio.run(prefetcher.run_once()) == 1
+    assert asyncio.run(prefetcher.run_once()) == 0
+    assert harness.generated == ["app_001"]
+
+    draft = prefetcher.take("app_001", "面接日程調整")
+    assert draft is not None and draft.result["subject"] == "件名" and draft.served == 1
+    assert prefetcher.take("app_001", "内定連絡") is None
+    stats = prefetcher.stats()
+    assert (stats["hits"], stats["misses"], stats["wasted"]) == (1, 1, 0)
+
+
+def test_max_per_cycle_and_busy_backend_limit_generation():
+    jobs = [PrefetchJob.create(f"app_{i}", day(0), "medium") for i in range(5)]
+    harness = Harness(jobs, max_per_cycle=2)
+    assert asyncio.run(harness.prefetcher.run_once()) == 2
+
+    busy = Harness(jobs, is_idle=lambda: False)
+    assert asyncio.run(busy.prefetcher.run_once()) == 0
+    assert busy.prefetcher.stats()["skipped_busy"] == 1
+
+
+def test_state_change_discards_the_draft_and_regenerates():
+    harness = Harness([PrefetchJob.create("app_001", day(0), "high")])
+    prefetcher = harness.prefetcher
+    asyncio.run(prefetcher.run_once())
+    harness.states["app_001"] = "v2"
+    assert prefetcher.take("app_001", "面接日程調整") is None
+    assert prefetcher.stats()["stale"] == 1 and prefetcher.stats()["wasted"] == 1
+
+    asyncio.run(prefetcher.run_once())
+    assert harness.generated == ["app_001", "app_001"]
+    assert prefetcher.take("app_001", "面接日程調整").state == "v2"
+
+
+def test_edited_prompt_discards_the_draft():
+    harness = Harness([PrefetchJob.create("app_001", day(0), "high")])
+    harness.results["app_001"] = {"subject": "件名", "body": "本文", "metadata": {"prompt_fingerprint": "old"}}
+    prefetcher = harness.prefetcher
+    asyncio.run(prefetcher.run_once())
+    assert prefetcher.take("app_001", "面接日程調整", prompt_fingerprint="new") is None
+    assert prefetcher.stats()["drafts"] == 0
+
+
+def test_state_change_during_generation_is_wasted():
+    harness = Harness([PrefetchJob.create("app_001", day(0), "high")])
+    harness.on_generate = lambda job: harness.states.update({job.application_id: "v2"})
+    asyncio.run(harness.prefetcher.run_once())
+    stats = harness.prefetcher.stats()
+    assert stats["drafts"] == 0 and stats["wasted"] == 1
+
+
+def test_unusable_results_are_rejected():
+    harness = Harness([PrefetchJob.create("app_001", day(0), "high")])
+    harness.results["app_001"] = {"subject": "", "body": "", "metadata": {"parse_failed": True}}
+    asyncio.run(harness.prefetcher.run_once())
+    stats = harness.prefetcher.stats()
+    assert stats["drafts"] == 0 and stats["rejected"] == 1
+
+
+def test_invalidate_and_stop_cancel_pending_work():
+    async def scenario():
+        harness = Harness([PrefetchJob.create("app_001", day(0), "high")], interval=3600)
+        prefetcher = harness.prefetcher
+        prefetcher.start()
+        await asyncio.sleep(0.01)
+        task = prefetcher._task
+        prefetcher.stop()
+        await asyncio.sleep(0)
+        prefetcher.invalidate("app_001")
+        return harness, task
+
+    harness, task = asyncio.run(scenario())
+    assert task.cancelled()
+    assert harness.generated == ["app_001"]
+    stats = harness.prefetcher.stats()
+    assert stats["drafts"] == 0 and stats["wasted"] == 1 and stats["cycles"] == 1
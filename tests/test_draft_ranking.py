@@ -0,0 +1,89 @@
+"""DraftRanker のテスト（N件の候補を採点の高い順に並べること）"""
+
+from app.core.draft_ranking import DraftRanker
+from app.core.llm import EmailGenerationContext
+
+REFERENCE = """CS様
+
+いつもお世話になっております。
+さて、●●社の●●職の面接日程についてご連絡いたします。
+
+【候補日】
+・12月10日 14:00
+・12月11日 10:00
+
+よろしくお願いいたします。"""
+
+GOOD_BODY = """田中太郎様
+
+いつもお世話になっております。
+Acme株式会社のシニアエンジニア職の面接日程についてご連絡いたします。
+
+【候補日】
+・12月10日 14:00
+・12月11日 10:00
+
+よろしくお願いいたします。"""
+
+
+def make_context(reference_template=REFERENCE):
+    return EmailGenerationContext(
+        candidate_name="田中太郎", company="Acme株式会社", job_title="シニアエンジニア",
+        status="面接調整中", latest_summary="", enthusiasm_score=0.8, concern_score=0.3,
+        target_person="candidate", current_template="", reference_template=reference_template,
+    )
+
+
+def draft(body, subject="【ご連絡】面接日程のご案内", **metadata):
+    return {"subject": subject, "body": body, "metadata": dict(metadata)}
+
+
+def test_complete_draft_scores_full_marks():
+    result = DraftRanker().score(draft(GOOD_BODY), make_context())
+    assert result.score == 1.0
+    assert result.missing == [] and result.placeholders == []
+
+
+def test_n_best_ordering():
+    candidates = [
+        draft(GOOD_BODY.replace("田中太郎様", "●●様")),  # 差し込み記号が残っている
+        draft(GOOD_BODY.replace("Acme株式会社の", "")),  # 企業名がない
+        draft(GOOD_BODY),
+        draft("", subject=""),  # 件名・本文がない
+        draft(GOOD_BODY, parse_failed=True),  # 代替文になった
+    ]
+    ranker = DraftRanker()
+    ranked = ranker.rank(candidates, make_context())
+    assert [d["metadata"]["ranking"]["candidate"] for d in ranked] == [2, 1, 0, 4, 3]
+    scores = [d["metadata"]["ranking"]["score"] for d in ranked]
+    assert scores == sorted(scores, reverse=True)
+    assert ranked[1]["metadata"]["ranking"]["missing"] == ["企業名"]
+    assert ranked[2]["metadata"]["ranking"]["placeholders"] == ["●●"]
+    assert ranker.stats()["candidates"] == 5 and ranker.stats()["rejected_placeholders"] == 1
+
+
+def test_ties_keep_the_original_order():
+    candidates = [draft(GOOD_BODY), draft(GOOD_BODY), draft(GOOD_BODY)]
+    ranked = DraftRanker().rank(candidates, make_context())
+    assert [d["metadata"]["ranking"]["candidate"] for d in ranked] == [0, 1, 2]
+
+
+def test_length_is_judged_against_the_reference_template():
+    ranker = DraftRanker()
+    short = ranker.score(draft("田中太郎様 Acme株式会社 シニアエンジニア"), make_context())
+    padded = ranker.score(draft(GOOD_BODY + "\n" + "補足です。" * 200), make_context())
+    assert short.checks["length"] < 0.5
+    assert padded.checks["length"] < 1.0
+    # 参考テンプレートがない場合は構成を比べない
+    assert ranker.score(draft(GOOD_BODY), make_context(reference_template=None)).checks["structure"] == 1.0
+
+
+def test_custom_weights_change_the_order():
+    candidates = [
+        draft(GOOD_BODY.replace("【候補日】\n", "").replace("・", "")),  # 構成が崩れている
+        draft(GOOD_BODY.replace("Acme株式会社の", "")),  # 企業名がない
+    ]
+    by_structure = DraftRanker(weights={"structure": 1.0}).rank([dict(c) for c in candidates], make_context())
+    by_entities = DraftRanker(weights={"entities": 1.0}).rank([dict(c) for c in candidates], make_context())
+    assert by_structure[0]["metadata"]["ranking"]["candidate"] == 1
+    assert by_entities[0]["metadata"]["ranking"]["candidate"] == 0
@@ -0,0 +1,62 @@
+"""DraftStore のテスト（応募ごとの版番号と、状態・プロンプトでの照合）"""
+
+import sqlite3
+
+import pytest
+
+from app.core.draft_store import DraftStore, is_reusable
+from app.models.draft import GeneratedDraft
+
+METADATA = {"model": "qwen3:30b", "profile": "quality", "latency": 1.2, "prompt_tokens": 800, "completion_tokens": 200}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = DraftStore(str(tmp_path / "drafts.db"))
+    yield store
+    store.close()
+
+
+def test_versions_are_numbered_per_application(store):
+    assert store.save("app_001", "面談お礼", "件名1", "本文1", "s1", METADATA)["version"] == 1
+    assert store.save("app_001", "面談お礼", "件名2", "本文2", "s1", METADATA)["version"] == 2
+    assert store.save("app_002", None, "件名", "本文", "s1", METADATA)["version"] == 1
+    versions = store.versions("app_001")
+    assert [row["version"] for row in versions] == [2, 1]
+    assert versions[0]["subject"] == "件名2" and versions[0]["model"] == "qwen3:30b"
+
+
+def test_latest_requires_same_template_and_state(store):
+    store.save("app_001", "面談お礼", "件名1", "本文1", "s1", METADATA)
+    store.save("app_001", "面談お礼", "件名2", "本文2", "s1", METADATA)
+    store.save("app_001", None, "件名3", "本文3", "s1", METADATA)
+    assert store.latest("app_001", "面談お礼", "s1")["subject"] == "件名2"
+    assert store.latest("app_001", None, "s1")["subject"] == "件名3"
+    assert store.latest("app_001", "面談お礼", "s2") is None
+    assert store.stats()["hits"] == 2 and store.stats()["misses"] == 1
+
+
+def test_latest_matches_prompt_fingerprint(store):
+    store.save("app_001", "面談お礼", "編集前", "本文", "s1", METADATA, prompt_fingerprint="fp-old")
+    store.save("app_001", "面談お礼", "編集後", "本文", "s1", dict(METADATA, prompt_fingerprint="fp-new"))
+    assert store.latest("app_001", "面談お礼", "s1", "fp-old")["subject"] == "編集前"
+    assert store.latest("app_001", "面談お礼", "s1", "fp-new")["subject"] == "編集後"
+    assert store.latest("app_001", "面談お礼", "s1", "fp-other") is None
+
+
+def test_is_reusable():
+    assert is_reusable(dict(METADATA, metrics={"done_reason": "stop"}))
+    assert not is_reusable(dict(METADATA, error="timeout"))
+    assert not is_reusable(dict(METADATA, parse_failed=True))
+    assert not is_reusable(dict(METADATA, metrics={"done_reason": "length"}))
+
+
+def test_table_is_created_from_the_model_on_first_use(tmp_path):
+    db_path = tmp_path / "drafts.db"
+    store = DraftStore(str(db_path))
+    assert not db_path.exists()
+    store.save("app_001", None, "件名", "本文", "s1", METADATA)
+    assert db_path.exists()
+    columns = [row[1] for row in sqlite3.connect(db_path).execute("PRAGMA table_info(email_drafts)")]
+    assert columns == list(GeneratedDraft.__table__.columns.keys())
+    store.close()
@@ -0,0 +1,97 @@
+"""HistoryContextBuilder のテスト（bigramのBM25での選択、定型文の除去、トークン予算での打ち切り）"""
+
+from collections import Counter
+from dataclasses import dataclass
+
+from app.core.history_context import HistoryContextBuilder, _ngrams, legacy_history_context
+from app.core.llm_sizing import estimate_tokens
+
+GREETING = "いつもお世話になっております。"
+SIGNATURE = "キャリアアドバイザー 山田"
+
+
+@dataclass
+class Message:
+    id: str
+    subject: str
+    content: str
+    timestamp: str = "2024-12-01 10:00"
+    sender: str = "CA"
+    receiver: str = "候補者"
+    is_outbound: bool = True
+
+
+def make_messages():
+    bodies = [
+        ("m1", "面接日程のご案内", "一次面接の日程を12月10日14時で調整しました。面接会場は本社です。"),
+        ("m2", "書類のご提出", "職務経歴書のご提出をお願いします。"),
+        ("m3", "年収についてのご相談", "ご希望年収について企業と相談しました。"),
+        ("m4", "ご連絡", "来週の予定を教えてください。"),
+    ]
+    return [
+        Message(id, subject, f"{GREETING}\n{content}\n{SIGNATURE}", timestamp=f"2024-12-0{index + 1} 10:00")
+        for index, (id, subject, content) in enumerate(bodies)
+    ]
+
+
+def test_ngrams_ignore_whitespace():
+    assert _ngrams("面接 日程") == ["面接", "接日", "日程"]
+    assert _ngrams("面") == ["面"]
+    assert _ngrams("  ") == []
+
+
+def test_fit_finds_boilerplate_lines():
+    builder = HistoryContextBuilder(boilerplate_min_df=3).fit(make_messages())
+    content, stripped = builder.strip_boilerplate(make_messages()[0].content)
+    assert stripped == 2
+    assert GREETING not in content and SIGNATURE not in content
+    assert "一次面接" in content
+
+
+def test_bm25_prefers_messages_sharing_bigrams_with_the_query():
+    messages = make_messages()
+    builder = HistoryContextBuilder().fit(messages)
+    query = Counter(_ngrams("面接日程"))
+    scores = {m.id: builder._bm25(query, m.subject + "\n" + m.content) for m in messages}
+    assert max(scores, key=scores.get) == "m1"
+    assert scores["m4"] == 0.0
+
+
+def test_budget_keeps_the_most_relevant_message_in_time_order():
+    messages = make_messages()
+    builder = HistoryContextBuilder(recency_weight=0.0, min_chunk_tokens=10).fit(messages)
+    one_message = estimate_tokens(builder.build(messages[:1], "面接日程", budget_tokens=10_000).text)
+    selection = builder.build(messages, "年収 面接日程", budget_tokens=one_message * 2)
+    assert "m1" in selection.selected and "m3" in selection.selected
+    assert selection.selected == sorted(selection.selected)
+    assert selection.tokens <= one_message * 2
+
+    only_one = builder.build(messages, "面接日程", budget_tokens=one_message + 5)
+    assert only_one.selected == ["m1"]
+    assert only_one.stripped_lines == 2
+
+
+def test_long_message_is_truncated_to_the_remaining_budget():
+    long_body = "\n".join(f"面接日程の候補{i}: 12月{i}日" for i in range(1, 31))
+    messages = [Message("long", "面接日程", long_body)]
+    builder = HistoryContextBuilder(min_chunk_tokens=10).fit(messages)
+    selection = builder.build(messages, "面接日程", budget_tokens=120)
+    assert selection.truncated == ["long"]
+    assert "（以下略）" in selection.text
+    assert selection.tokens <= 120
+
+
+def test_remaining_budget_below_min_chunk_stops_selection():
+    messages = make_messages()
+    builder = HistoryContextBuilder(min_chunk_tokens=1000).fit(messages)
+    selection = builder.build(messages, "面接日程", budget_tokens=500)
+    assert selection.selected == [] and selection.text == ""
+
+
+def test_summary_is_prefixed_and_only_pending_messages_are_used():
+    messages = make_messages()
+    builder = HistoryContextBuilder(budget_tokens=10_000).fit(messages)
+    selection = builder.build(messages, "面接日程", summary="日程調整中。", pending_ids=["m4"])
+    assert selection.text.startswith("\n\n## これまでのやり取りの要約\n日程調整中。")
+    assert selection.selected == ["m4"]
+    assert selection.legacy_tokens == estimate_tokens(legacy_history_context(messages))
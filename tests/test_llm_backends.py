@@ -0,0 +1,136 @@
+"""BackendPool のテスト（生成プローブが成功するまで切り離したホストを戻さないこと、ホストごとのモデル）"""
+
+import asyncio
+import json
+
+import httpx
+
+from app.core.llm import QwenLLM
+from app.core.llm_backends import BackendPool, parse_host_models
+from app.core.llm_cache import LLMResponseCache
+
+GPU1 = "http://gpu1:11434"
+GPU2 = "http://gpu2:11434"
+
+
+class FakeOllama:
+    """/api/tags には応答し、generate_ok がFalseの間は生成に失敗するホスト"""
+
+    def __init__(self):
+        self.generate_ok = {GPU1: True, GPU2: True}
+        self.generated = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        host = f"{request.url.scheme}://{request.url.host}:{request.url.port}"
+        if request.url.path == "/api/tags":
+            return httpx.Response(200, json={"models": []})
+        model = json.loads(request.content)["model"]
+        self.generated.append((host, model))
+        if not self.generate_ok[host]:
+            return httpx.Response(500, json={"error": "CUDA error"})
+        return httpx.Response(200, json={"response": "OK", "done": True, "done_reason": "stop"})
+
+    def client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.MockTransport(self.handler))
+
+
+def eject(pool: BackendPool, base_url: str):
+    backend = next(b for b in pool.backends if b.base_url == base_url)
+    for _ in range(pool.failure_threshold):
+        backend.record_failure("generate: 500", pool.failure_threshold, pool.eject_seconds)
+    return backend
+
+
+def test_parse_host_models():
+    assert parse_host_models(f"{GPU1}=qwen3:30b|qwen3:8b, {GPU2}/=qwen3:8b") == {
+        GPU1: ["qwen3:30b", "qwen3:8b"], GPU2: ["qwen3:8b"],
+    }
+    assert parse_host_models("") == {}
+
+
+def test_answering_tags_does_not_bring_back_a_host_that_fails_generation():
+    ollama = FakeOllama()
+    ollama.generate_ok[GPU2] = False
+    pool = BackendPool([GPU1, GPU2], eject_seconds=0.0)
+    backend = eject(pool, GPU2)
+
+    async def scenario():
+        async with ollama.client() as client:
+            await pool.probe(client, "qwen3:8b")
+            still_ejected = not backend.healthy
+            ollama.generate_ok[GPU2] = True
+            await pool.probe(client, "qwen3:8b")
+            return still_ejected
+
+    assert asyncio.run(scenario())
+    assert backend.healthy and backend.consecutive_failures == 0
+    assert ollama.generated == [(GPU2, "qwen3:8b"), (GPU2, "qwen3:8b")]
+
+
+def test_ejected_host_is_not_probed_before_its_time():
+    ollama = FakeOllama()
+    pool = BackendPool([GPU1, GPU2], eject_seconds=3600)
+    backend = eject(pool, GPU2)
+
+    async def scenario():
+        async with ollama.client() as client:
+            await pool.probe(client, "qwen3:8b")
+
+    asyncio.run(scenario())
+    assert not backend.healthy and ollama.generated == []
+    assert pool.select() is pool.backends[0]
+
+
+def test_tags_success_keeps_the_failure_count():
+    ollama = FakeOllama()
+    pool = BackendPool([GPU1], failure_threshold=3)
+    backend = pool.backends[0]
+    backend.record_failure("generate: 500", 3, pool.eject_seconds)
+
+    async def scenario():
+        async with ollama.client() as client:
+            await pool.probe(client, "qwen3:8b")
+
+    asyncio.run(scenario())
+    assert backend.consecutive_failures == 1 and backend.healthy
+
+
+def test_requests_are_routed_to_hosts_serving_the_model():
+    pool = BackendPool([GPU1, GPU2], host_models={GPU1: ["qwen3:30b", "qwen3:8b"], GPU2: ["qwen3:8b"]})
+    assert [b.base_url for b in pool.serving("qwen3:30b")] == [GPU1]
+    assert pool.select(model="qwen3:30b").base_url == GPU1
+    assert pool.select(exclude=pool.backends[:1], model="qwen3:30b").base_url == GPU1
+    assert {b.base_url for b in pool.serving("qwen3:8b")} == {GPU1, GPU2}
+    # 指定に合うホストがなければ全台から選ぶ
+    assert len(pool.serving("llama3")) == 2
+
+
+def test_generation_probe_uses_the_hosts_own_model():
+    ollama = FakeOllama()
+    pool = BackendPool([GPU2], host_models={GPU2: ["qwen3:8b"]}, eject_seconds=0.0)
+    eject(pool, GPU2)
+
+    async def scenario():
+        async with ollama.client() as client:
+            await pool.probe(client, "qwen3:30b")
+
+    asyncio.run(scenario())
+    assert ollama.generated == [(GPU2, "qwen3:8b")]
+
+
+def test_warmup_loads_only_the_models_configured_for_each_host():
+    ollama = FakeOllama()
+    llm = QwenLLM(
+        base_urls=[GPU1, GPU2], cache=LLMResponseCache(db_path=None),
+        host_models={GPU1: ["qwen3:30b"], GPU2: ["qwen3:8b"]},
+    )
+
+    async def scenario():
+        llm._async_clients[asyncio.get_running_loop()] = ollama.client()
+        try:
+            return await llm.awarmup()
+        finally:
+            await llm.aclose()
+
+    assert asyncio.run(scenario())
+    assert sorted(ollama.generated) == [(GPU1, "qwen3:30b"), (GPU2, "qwen3:8b")]
@@ -0,0 +1,82 @@
+"""LLMResponseCache のテスト（メモリ・SQLiteの2段、期限切れ、打ち切られた応答を保存しないこと）"""
+
+import asyncio
+import time
+
+from app.core.llm import QwenLLM
+from app.core.llm_cache import LLMResponseCache, prompt_fingerprint
+
+
+def test_disk_tier_survives_a_new_instance(tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    cache = LLMResponseCache(db_path=db_path)
+    cache.set("k", {"response": "こんにちは"})
+    assert cache.get("k") == {"response": "こんにちは"}
+    assert cache.stats()["memory_hits"] == 1
+    cache.close()
+
+    reopened = LLMResponseCache(db_path=db_path)
+    assert reopened.get("k") == {"response": "こんにちは"}
+    assert reopened.get("k") == {"response": "こんにちは"}
+    stats = reopened.stats()
+    assert (stats["disk_hits"], stats["memory_hits"]) == (1, 1)
+    reopened.close()
+
+
+def test_memory_tier_is_lru_and_falls_back_to_disk(tmp_path):
+    cache = LLMResponseCache(db_path=str(tmp_path / "cache.db"), memory_entries=1)
+    cache.set("a", {"response": "A"})
+    cache.set("b", {"response": "B"})
+    assert cache.stats()["memory_entries"] == 1
+    assert cache.get("a") == {"response": "A"}
+    assert cache.stats()["disk_hits"] == 1
+    cache.close()
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = LLMResponseCache(db_path=str(tmp_path / "cache.db"), ttl_seconds=0.05)
+    cache.set("k", {"response": "古い"})
+    time.sleep(0.1)
+    assert cache.get("k") is None
+    stats = cache.stats()
+    assert stats["misses"] == 1
+    assert stats["memory_entries"] == 0 and stats["disk_entries"] == 0
+    cache.close()
+
+
+def test_fingerprint_depends_on_options_and_format():
+    base = prompt_fingerprint("qwen3:30b", "プロンプト", {"temperature": 0.6})
+    assert base == prompt_fingerprint("qwen3:30b", "プロンプト", {"temperature": 0.6})
+    assert base != prompt_fingerprint("qwen3:30b", "プロンプト", {"temperature": 0.7})
+    assert base != prompt_fingerprint("qwen3:30b", "プロンプト", {"temperature": 0.6}, response_format={"type": "object"})
+    assert base != prompt_fingerprint("qwen3:30b", "プロンプト", {"temperature": 0.6}, think=False)
+
+
+def test_truncated_responses_are_not_cached(mock_ollama_url):
+    async def scenario():
+        llm = QwenLLM(base_url=mock_ollama_url, cache=LLMResponseCache(db_path=None))
+        try:
+            truncated = await llm._agenerate("件名と本文を書いてください", max_tokens=2)
+            stores_after_truncated = llm.cache.stats()["stores"]
+            complete = await llm._agenerate("件名と本文を書いてください", max_tokens=2000)
+            again = await llm._agenerate("件名と本文を書いてください", max_tokens=2000)
+        finally:
+            await llm.aclose()
+        return truncated, stores_after_truncated, complete, again, llm.cache.stats()
+
+    truncated, stores_after_truncated, complete, again, stats = asyncio.run(scenario())
+    assert truncated["metrics"]["done_reason"] == "length"
+    assert stores_after_truncated == 0
+    assert complete["metrics"]["done_reason"] == "stop" and not complete["cached"]
+    assert again["cached"] and again["response"] == complete["response"]
+    assert stats["stores"] == 1
+
+
+def test_database_is_created_on_first_use(tmp_path):
+    db_path = tmp_path / "cache.db"
+    cache = LLMResponseCache(db_path=str(db_path))
+    assert not db_path.exists()
+    cache.set("k", {"response": "A"})
+    assert db_path.exists()
+    cache.close()
+    assert cache.get("other") is None and not cache.stats()["disk_entries"]
@@ -0,0 +1,150 @@
+"""LLMScheduler のテスト（重み付き公平キューイング・中断・キャンセル・優先度の引き上げ）"""
+
+import asyncio
+
+from app.core.llm_scheduler import BACKGROUND, INTERACTIVE, LLMScheduler
+
+
+def test_weighted_fair_order():
+    """同じクラス内では、重みに応じた仮想終了時刻の順に処理する"""
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, owner_weights={"a": 2.0, "b": 1.0})
+        started = []
+        release = asyncio.Event()
+
+        async def blocker():
+            await release.wait()
+
+        def job(name):
+            async def run():
+                started.append(name)
+            return run
+
+        tasks = [asyncio.create_task(scheduler.run(blocker, owner="x"))]
+        for name, owner in [("b1", "b"), ("b2", "b"), ("a1", "a"), ("a2", "a"), ("a3", "a"), ("a4", "a")]:
+            tasks.append(asyncio.create_task(scheduler.run(job(name), owner=owner)))
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(*tasks)
+        return started
+
+    # 終了時刻 a: 0.5, 1.0, 1.5, 2.0 / b: 1.0, 2.0（同じ時刻は先に投入した順）
+    assert asyncio.run(scenario()) == ["a1", "b1", "a2", "a3", "b2", "a4"]
+
+
+def test_interactive_preempts_latest_background_and_requeues_it():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=2, background_limit=2, preempt_depth=1)
+        calls = {"bg1": 0, "bg2": 0}
+        release = asyncio.Event()
+
+        def background(name):
+            async def run():
+                calls[name] += 1
+                await release.wait()
+                return name
+            return run
+
+        async def interactive():
+            return "interactive"
+
+        bg1 = asyncio.create_task(scheduler.run(background("bg1"), priority=BACKGROUND))
+        await asyncio.sleep(0)
+        bg2 = asyncio.create_task(scheduler.run(background("bg2"), priority=BACKGROUND))
+        await asyncio.sleep(0.01)
+        assert await scheduler.run(interactive) == "interactive"
+        assert not bg1.done() and not bg2.done()
+        release.set()
+        results = await asyncio.gather(bg1, bg2)
+        return results, calls, scheduler.stats()["classes"][BACKGROUND]
+
+    results, calls, stats = asyncio.run(scenario())
+    assert results == ["bg1", "bg2"]
+    # 後から始まった bg2 だけが中断され、最初からやり直す
+    assert calls == {"bg1": 1, "bg2": 2}
+    assert stats["preempted"] == 1
+    assert stats["completed"] == 2
+
+
+def test_cancelled_queued_job_never_runs():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1)
+        ran = []
+        release = asyncio.Event()
+
+        async def blocker():
+            await release.wait()
+
+        async def queued():
+            ran.append("queued")
+
+        first = asyncio.create_task(scheduler.run(blocker))
+        second = asyncio.create_task(scheduler.run(queued))
+        await asyncio.sleep(0)
+        second.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        await first
+        return ran, second.cancelled(), scheduler.stats()["classes"][INTERACTIVE]
+
+    ran, cancelled, stats = asyncio.run(scenario())
+    assert ran == []
+    assert cancelled
+    assert stats["cancelled"] == 1
+    assert stats["running"] == 0 and stats["queue_depth"] == 0
+
+
+def test_cancelling_a_running_job_frees_its_slot():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1)
+        started = asyncio.Event()
+        upstream_cancelled = []
+
+        async def long_running():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                upstream_cancelled.append(True)
+                raise
+
+        async def quick():
+            return "ok"
+
+        task = asyncio.create_task(scheduler.run(long_running))
+        await started.wait()
+        task.cancel()
+        result = await asyncio.wait_for(scheduler.run(quick), timeout=1)
+        return result, upstream_cancelled
+
+    assert asyncio.run(scenario()) == ("ok", [True])
+
+
+def test_promoted_background_job_is_not_preempted():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, background_limit=1, preempt_depth=1)
+        calls = []
+        release = asyncio.Event()
+
+        async def shared():
+            calls.append("shared")
+            await release.wait()
+            return "shared"
+
+        async def interactive():
+            return "interactive"
+
+        background = asyncio.create_task(scheduler.run(shared, priority=BACKGROUND, key="k"))
+        await asyncio.sleep(0)
+        assert scheduler.promote("k")
+        waiting = asyncio.create_task(scheduler.run(interactive))
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+        release.set()
+        return await background, await waiting, calls, scheduler.stats()["classes"]
+
+    shared, interactive, calls, stats = asyncio.run(scenario())
+    assert (shared, interactive) == ("shared", "interactive")
+    assert calls == ["shared"]
+    assert stats[BACKGROUND]["promoted"] == 1
+    assert stats[BACKGROUND]["preempted"] == 0
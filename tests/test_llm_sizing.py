@@ -0,0 +1,110 @@
+"""GenerationSizer のテスト（プロファイル・プロンプト長ごとの num_predict / num_ctx、実績からの学習）"""
+
+import math
+
+from app.core.llm import EmailGenerationContext, QwenLLM
+from app.core.llm_cache import LLMResponseCache
+from app.core.llm_profiles import DEFAULT_PROFILES, FAST, QUALITY
+from app.core.llm_sizing import (
+    FORMAT_OVERHEAD_TOKENS, FREEFORM_EMAIL_TOKENS, THINKING_TOKENS, GenerationSizer, estimate_tokens
+)
+
+TEMPLATE = "田中様\nいつもお世話になっております。面接日程についてご案内いたします。" * 10
+
+
+def make_context(template_name=None, reference_template=None, target_person="candidate"):
+    return EmailGenerationContext(
+        candidate_name="田中太郎", company="Acme株式会社", job_title="シニアエンジニア",
+        status="面接調整中", latest_summary="", enthusiasm_score=0.8, concern_score=0.3,
+        target_person=target_person, current_template="",
+        reference_template=reference_template, template_name=template_name,
+    )
+
+
+def make_llm(sizer):
+    return QwenLLM(base_url="http://127.0.0.1:9", cache=LLMResponseCache(db_path=None), sizer=sizer)
+
+
+def test_estimate_tokens_counts_japanese_denser_than_ascii():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("a" * 40) == 10
+    assert estimate_tokens("あ" * 13) == 10
+
+
+def test_email_prior_follows_the_reference_template():
+    sizer = GenerationSizer(headroom=1.0)
+    with_template = sizer.plan("email", "p", reference_template=TEMPLATE, target_person="candidate")
+    freeform = sizer.plan("email", "p", target_person="candidate")
+    assert with_template.num_predict == math.ceil(estimate_tokens(TEMPLATE) * 1.1 + FORMAT_OVERHEAD_TOKENS)
+    assert freeform.num_predict == FREEFORM_EMAIL_TOKENS + FORMAT_OVERHEAD_TOKENS
+    assert with_template.source == freeform.source == "prior"
+
+
+def test_template_source_is_read_on_every_plan():
+    templates = {"面接日程調整": TEMPLATE}
+    sizer = GenerationSizer(template_source=lambda: templates, headroom=1.0)
+    before = sizer.plan("email", "p", template_name="面接日程調整").num_predict
+    templates = {"面接日程調整": TEMPLATE * 2}
+    after = sizer.plan("email", "p", template_name="面接日程調整").num_predict
+    assert after > before
+    assert GenerationSizer().plan("email", "p", template_name="面接日程調整").num_predict == math.ceil(
+        (FREEFORM_EMAIL_TOKENS + FORMAT_OVERHEAD_TOKENS) * 1.3
+    )
+
+
+def test_profiles_set_thinking_budget_and_cap():
+    sizer = GenerationSizer()
+    llm = make_llm(sizer)
+    context = make_context(reference_template=TEMPLATE)
+    fast = DEFAULT_PROFILES[FAST]
+    quality = DEFAULT_PROFILES[QUALITY]
+
+    fast_plan = llm._plan_sizing("email", "p", fast, fast.limit_tokens("email", 3000), context)
+    quality_plan = llm._plan_sizing("email", "p", quality, quality.limit_tokens("email", 3000), context)
+    assert fast_plan.key == ("email", "", "candidate", False)
+    assert quality_plan.key == ("email", "", "candidate", True)
+    # qualityは思考分（見積もりの余裕込み）だけ多く確保する
+    assert abs(quality_plan.num_predict - fast_plan.num_predict - THINKING_TOKENS * sizer.headroom) <= 1
+
+    # fastプロファイルのタスク別上限（email: 600）で切り詰める
+    long_context = make_context(reference_template=TEMPLATE * 10)
+    assert llm._plan_sizing("email", "p", fast, fast.limit_tokens("email", 3000), long_context).num_predict == 600
+    assert llm._plan_sizing("analysis", "p", fast, fast.limit_tokens("analysis", 300)).num_predict <= 120
+
+
+def test_num_ctx_grows_with_prompt_length():
+    sizer = GenerationSizer(ctx_buckets=(4096, 8192, 16384))
+    assert sizer.plan("analysis", "あ" * 1000).num_ctx == 4096
+    assert sizer.plan("analysis", "あ" * 6000).num_ctx == 8192
+    assert sizer.plan("analysis", "あ" * 15000).num_ctx == 16384
+    assert sizer.plan("analysis", "あ" * 50000).num_ctx == 16384
+
+
+def test_loaded_context_is_not_shrunk_for_the_same_model():
+    sizer = GenerationSizer(ctx_buckets=(4096, 8192))
+    assert sizer.warmup_context("qwen3:8b") == 4096
+    assert sizer.plan("analysis", "あ" * 6000, model="qwen3:8b").num_ctx == 8192
+    assert sizer.plan("analysis", "短い", model="qwen3:8b").num_ctx == 8192
+    assert sizer.plan("analysis", "短い", model="qwen3:30b").num_ctx == 4096
+
+
+def test_learned_estimate_replaces_prior_after_min_samples():
+    sizer = GenerationSizer(min_samples=3)
+    plan = sizer.plan("email", "p", template_name="面接日程調整", target_person="CS")
+    for _ in range(3):
+        sizer.observe(plan, {"eval_count": 200, "done_reason": "stop"})
+    learned = sizer.plan("email", "p", template_name="面接日程調整", target_person="CS")
+    assert learned.source == "learned"
+    assert learned.num_predict < plan.num_predict
+    # 宛先が違えば別の見積もり
+    assert sizer.plan("email", "p", template_name="面接日程調整", target_person="RA").source == "prior"
+
+
+def test_truncated_and_oversized_generations_are_counted():
+    sizer = GenerationSizer()
+    plan = sizer.plan("analysis", "p")
+    sizer.observe(plan, {"eval_count": plan.num_predict, "done_reason": "length"})
+    sizer.observe(plan, {"eval_count": 10, "done_reason": "stop"})
+    sizer.observe(plan, {})
+    stats = sizer.stats()["tasks"]["analysis"]
+    assert (stats["generations"], stats["truncated"], stats["oversized"]) == (2, 1, 1)
@@ -0,0 +1,93 @@
+"""SingleFlight のテスト（同じキーの相乗りと、待ち手のキャンセル）"""
+
+import asyncio
+
+from app.core.singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_execution():
+    async def scenario():
+        flight = SingleFlight()
+        calls = []
+        joined = []
+
+        async def factory():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(
+            flight.do("k", factory),
+            flight.do("k", factory, on_join=lambda: joined.append(1)),
+            flight.do("k", factory, on_join=lambda: joined.append(1)),
+        )
+        return results, calls, joined, flight.stats()
+
+    results, calls, joined, stats = asyncio.run(scenario())
+    assert results == ["result"] * 3
+    assert calls == [1]
+    assert joined == [1, 1]
+    assert stats["executions"] == 1 and stats["coalesced"] == 2 and stats["in_flight"] == 0
+
+
+def test_one_cancelled_waiter_does_not_cancel_the_others():
+    async def scenario():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def factory():
+            await release.wait()
+            return "result"
+
+        first = asyncio.create_task(flight.do("k", factory))
+        second = asyncio.create_task(flight.do("k", factory))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return await second, first.cancelled(), flight.stats()
+
+    result, cancelled, stats = asyncio.run(scenario())
+    assert result == "result"
+    assert cancelled
+    assert stats["upstream_cancelled"] == 0
+
+
+def test_upstream_is_cancelled_when_every_waiter_leaves():
+    async def scenario():
+        flight = SingleFlight()
+        upstream = []
+
+        async def factory():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                upstream.append("cancelled")
+                raise
+
+        waiters = [asyncio.create_task(flight.do("k", factory)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0)
+        return upstream, flight.stats()
+
+    upstream, stats = asyncio.run(scenario())
+    assert upstream == ["cancelled"]
+    assert stats["upstream_cancelled"] == 1
+    assert stats["in_flight"] == 0
+
+
+def test_finished_key_runs_again():
+    async def scenario():
+        flight = SingleFlight()
+        calls = []
+
+        async def factory():
+            calls.append(1)
+            return len(calls)
+
+        return await flight.do("k", factory), await flight.do("k", factory)
+
+    assert asyncio.run(scenario()) == (1, 2)
@@ -0,0 +1,44 @@
+"""StatusMatcher のテスト（従来の部分一致ループと同じテンプレート一覧を返すこと）"""
+
+import random
+
+import pytest
+
+from app.core.status_matcher import ABBREVIATION, EXACT, KEYWORD, NONE, STATUS, StatusMatcher
+from app.core.template_engine import STATUS_KEYWORDS, TemplateEngine
+from scripts.bench_status_matcher import build_statuses, legacy_applicable_templates
+
+
+@pytest.fixture(scope="module")
+def status_mapping():
+    return dict(TemplateEngine().status_mapping)
+
+
+@pytest.mark.parametrize("cache_size", [0, 4096])
+def test_matches_legacy_loop(status_mapping, cache_size):
+    matcher = StatusMatcher(status_mapping, STATUS_KEYWORDS, cache_size=cache_size)
+    inputs = build_statuses(3000, list(status_mapping), random.Random(7))
+    for status in inputs:
+        assert matcher.match(status).templates == legacy_applicable_templates(status, status_mapping), status
+
+
+def test_match_kinds():
+    matcher = StatusMatcher({"面接日程調整中": ["日程調整"], "内定": ["内定お祝い"]}, {"辞退": ["辞退確認"]})
+    assert (matcher.match("内定").kind, matcher.match("内定").templates) == (EXACT, ["内定お祝い"])
+    assert matcher.match("一次面接日程調整中").kind == STATUS
+    assert (matcher.match("面接").kind, matcher.match("面接").matched) == (ABBREVIATION, "面接日程調整中")
+    assert (matcher.match("選考辞退の連絡").kind, matcher.match("選考辞退の連絡").templates) == (KEYWORD, ["辞退確認"])
+    assert matcher.match("無関係").kind == NONE and matcher.match("無関係").templates == []
+
+
+def test_longest_status_wins_over_table_order():
+    matcher = StatusMatcher({"面接": ["短い"], "最終面接": ["長い"]}, {})
+    assert matcher.match("最終面接待ち").templates == ["長い"]
+    assert matcher.match("最終面接待ち").candidates == ["最終面接", "面接"]
+
+
+def test_cache_is_bounded(status_mapping):
+    matcher = StatusMatcher(status_mapping, STATUS_KEYWORDS, cache_size=2)
+    for status in ["あ", "い", "う"]:
+        matcher.match(status)
+    assert matcher.stats()["cached"] == 2
@@ -0,0 +1,61 @@
+"""EmailStreamParser のテスト（トークンの区切り方によらず同じ件名・本文になること）"""
+
+import pytest
+
+from app.core.stream_parser import EmailStreamParser
+
+CHUNK_SIZES = [1, 2, 3, 7, 100]
+
+
+def parse(text: str, size: int):
+    """textをsize文字ずつ流し、受け取ったイベントから件名・本文を組み立てる"""
+    parser = EmailStreamParser()
+    subject, body = "", ""
+    events = []
+    for start in range(0, len(text), size):
+        events.extend(parser.feed(text[start:start + size]))
+    events.extend(parser.close())
+    for event, data in events:
+        if event == "subject_reset":
+            subject = ""
+        elif event == "subject":
+            subject += data
+        else:
+            body += data
+    return subject, body.strip()
+
+
+@pytest.mark.parametrize("size", CHUNK_SIZES)
+def test_strips_think_and_splits_sections(size):
+    text = "<think>\n件名: 思考中の件名\n</think>\n件名: 面接日程のご案内\n本文: 田中様\nお世話になっております。"
+    assert parse(text, size) == ("面接日程のご案内", "田中様\nお世話になっております。")
+
+
+@pytest.mark.parametrize("size", CHUNK_SIZES)
+def test_unclosed_think_recovers_sections(size):
+    text = "<think>\n考えています\n件名：書類選考通過のお知らせ\n本文：佐藤様\n選考を通過されました。"
+    assert parse(text, size) == ("書類選考通過のお知らせ", "佐藤様\n選考を通過されました。")
+
+
+@pytest.mark.parametrize("size", CHUNK_SIZES)
+def test_unclosed_think_without_markers_is_kept_as_body(size):
+    assert parse("<think>マーカーのない応答", size) == ("", "マーカーのない応答")
+
+
+@pytest.mark.parametrize("size", CHUNK_SIZES)
+def test_unclosed_think_after_answer_is_dropped(size):
+    text = "件名: ご連絡\n本文: 本文です\n<think>途中で終わった思考"
+    assert parse(text, size) == ("ご連絡", "本文です")
+
+
+@pytest.mark.parametrize("size", CHUNK_SIZES)
+def test_repeated_subject_replaces_the_first(size):
+    text = "件名：テスト\n本文：あ\nい\n件名: 二つ目"
+    assert parse(text, size) == ("二つ目", "あ\nい")
+
+
+@pytest.mark.parametrize("size", CHUNK_SIZES)
+def test_text_without_markers_is_body(size):
+    assert parse("お世話になっております。\nよろしくお願いいたします。", size) == (
+        "", "お世話になっております。\nよろしくお願いいたします。"
+    )
@@ -0,0 +1,123 @@
+"""構造化出力のテスト（スキーマでの検証、崩れたJSONでの再指示とフォールバック）"""
+
+import asyncio
+
+import pytest
+
+from app.core.llm import EmailGenerationContext, QwenLLM
+from app.core.llm_cache import LLMResponseCache
+from app.core.structured_output import (
+    STRUCTURED_RETRY_NOTE, EmailAnalysis, EmailDraft, NextActionSuggestion, load_json_object
+)
+
+
+def make_context() -> EmailGenerationContext:
+    return EmailGenerationContext(
+        candidate_name="田中太郎", company="Acme株式会社", job_title="シニアエンジニア",
+        status="面接調整中", latest_summary="日程を調整中", enthusiasm_score=0.8, concern_score=0.3,
+        target_person="candidate", current_template="",
+    )
+
+
+def test_load_json_object_skips_think_block_and_surrounding_text():
+    text = '<think>{"subject": "思考中"}</think>\n回答です: {"subject": "件名", "body": "本文"} 以上'
+    assert load_json_object(text) == {"subject": "件名", "body": "本文"}
+    assert load_json_object('{"subject": "件名", "bo') is None
+    assert load_json_object('["件名"]') is None
+
+
+def test_email_draft_requires_non_empty_fields():
+    assert EmailDraft.parse('{"subject": " 件名 ", "body": "本文"}') == EmailDraft(subject="件名", body="本文")
+    assert EmailDraft.parse('{"subject": "件名", "body": "  "}') is None
+    assert EmailDraft.parse('{"subject": "件名"}') is None
+
+
+@pytest.mark.parametrize("scores, valid", [
+    ((0.8, 0.3), True),
+    ((1, 0), True),
+    ((1.2, 0.3), False),
+    ((True, 0.3), False),
+    (('"0.8"', 0.3), False),
+])
+def test_email_analysis_scores_must_be_numbers_in_unit_range(scores, valid):
+    text = '{"enthusiasm_score": %s, "concern_score": %s, "analysis_reason": "理由"}' % scores
+    assert (EmailAnalysis.parse(text) is not None) == valid
+
+
+def test_next_action_priority_must_be_in_enum():
+    schema = NextActionSuggestion.json_schema()
+    assert schema["properties"]["priority"]["enum"] == ["高", "中", "低"]
+    assert NextActionSuggestion.parse('{"action": "確認", "reason": "未完了", "priority": "中"}').priority == "中"
+    assert NextActionSuggestion.parse('{"action": "確認", "reason": "未完了", "priority": "至急"}') is None
+
+
+@pytest.mark.parametrize("result_type", [EmailDraft, EmailAnalysis, NextActionSuggestion])
+def test_schemas_require_every_property(result_type):
+    schema = result_type.json_schema()
+    assert set(schema["required"]) == set(schema["properties"])
+
+
+def test_structured_email_is_parsed_from_the_mock(mock_ollama_url):
+    async def scenario():
+        llm = QwenLLM(base_url=mock_ollama_url, cache=LLMResponseCache(db_path=None), structured_output=True)
+        try:
+            return await llm.agenerate_email_content(make_context())
+        finally:
+            await llm.aclose()
+
+    result = asyncio.run(scenario())
+    assert result["subject"] == "【ご連絡】面接日程のご案内"
+    assert result["metadata"]["parse_attempts"] == 1
+    assert not result["metadata"]["parse_failed"]
+
+
+def test_malformed_json_is_retried_once_with_the_note():
+    llm = QwenLLM(base_url="http://127.0.0.1:9", cache=LLMResponseCache(db_path=None), structured_output=True)
+    responses = ['{"subject": "件名", "bo', '{"subject": "件名", "body": "本文"}']
+    prompts = []
+
+    async def fake_agenerate(prompt, temperature, max_tokens, **kwargs):
+        prompts.append(prompt)
+        return {"response": responses[len(prompts) - 1], "latency": 0.5, "fingerprint": f"fp{len(prompts)}"}
+
+    llm._agenerate = fake_agenerate
+    parsed, generation, attempts = asyncio.run(
+        llm._agenerate_structured("プロンプト", EmailDraft, "email", temperature=0.6, max_tokens=100)
+    )
+    assert parsed == EmailDraft(subject="件名", body="本文")
+    assert attempts == 2
+    assert prompts == ["プロンプト", "プロンプト" + STRUCTURED_RETRY_NOTE]
+    assert generation["fingerprint"] == "fp1" and generation["latency"] == 1.0
+    assert llm._parse_stats["email"]["structured"] == {"calls": 1, "retries": 1, "failures": 0}
+
+
+def test_generation_errors_are_not_retried():
+    llm = QwenLLM(base_url="http://127.0.0.1:9", cache=LLMResponseCache(db_path=None), structured_output=True)
+    calls = []
+
+    async def fake_agenerate(prompt, temperature, max_tokens, **kwargs):
+        calls.append(prompt)
+        return {"response": "", "latency": 0.1, "fingerprint": "fp", "error": "接続できません"}
+
+    llm._agenerate = fake_agenerate
+    parsed, _, attempts = asyncio.run(
+        llm._agenerate_structured("プロンプト", EmailDraft, "email", temperature=0.6, max_tokens=100)
+    )
+    assert parsed is None and attempts == 1 and len(calls) == 1
+
+
+def test_persistently_malformed_json_falls_back(malformed_ollama_url):
+    async def scenario():
+        llm = QwenLLM(base_url=malformed_ollama_url, cache=LLMResponseCache(db_path=None), structured_output=True)
+        try:
+            return llm, await llm.agenerate_email_content(make_context())
+        finally:
+            await llm.aclose()
+
+    llm, result = asyncio.run(scenario())
+    context = make_context()
+    assert result["subject"] == llm._fallback_subject(context)
+    assert result["body"] == llm._fallback_body(context)
+    assert result["metadata"]["parse_attempts"] == 2
+    assert result["metadata"]["parse_failed"]
+    assert llm._parse_stats["email"]["structured"]["failures"] == 1
@@ -0,0 +1,42 @@
+"""BatchRelevanceScorer のテスト（応募ごとのスカラー計算と完全に一致すること）"""
+
+import random
+
+import pytest
+
+from app.core.template_engine import TemplateEngine
+from scripts.bench_template_batch import build_contexts, scalar_score
+
+
+@pytest.fixture(scope="module")
+def engine():
+    return TemplateEngine()
+
+
+@pytest.fixture(scope="module")
+def contexts(engine):
+    return build_contexts(engine, 300, random.Random(3))
+
+
+def test_score_matrix_matches_scalar_scores(engine, contexts):
+    engine.recommend_templates_batch(contexts[:1])  # 計算器を作っておく
+    scorer = engine._batch_scorer
+    matrix = scorer.score_matrix(
+        [context.enthusiasm_score for context in contexts],
+        [context.concern_score for context in contexts],
+        scorer.status_ids([context.current_status for context in contexts]),
+        scorer.recent_flags([context.message_history for context in contexts]),
+    )
+    for row, context in enumerate(contexts):
+        for column, name in enumerate(scorer.names):
+            assert matrix[row, column] == scalar_score(engine, name, context)
+
+
+@pytest.mark.parametrize("top_k", [1, 3, 5])
+def test_batch_recommendations_match_loop(engine, contexts, top_k):
+    batch = engine.recommend_templates_batch(contexts, top_k)
+    for context, recommendations in zip(contexts, batch):
+        expected = engine.recommend_templates(context)[:top_k]
+        assert [(r.template_name, r.relevance_score) for r in recommendations] == [
+            (r.template_name, r.relevance_score) for r in expected
+        ]
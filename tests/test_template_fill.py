@@ -0,0 +1,41 @@
+"""テンプレートの差し込み（fill_template）のテスト"""
+
+import json
+import shutil
+
+from app.core.template_engine import StatusContext, TemplateEngine
+from app.core.template_fill import JOB_ID
+
+CONTEXT = StatusContext(
+    current_status="書類選考中",
+    candidate_name="田中太郎",
+    company="Acme株式会社",
+    job_title="シニアエンジニア",
+    enthusiasm_score=0.5,
+    concern_score=0.5,
+    latest_summary="",
+)
+
+
+def make_engine(tmp_path, templates):
+    template_path = tmp_path / "templates.json"
+    template_path.write_text(json.dumps(templates, ensure_ascii=False), encoding="utf-8")
+    status_path = tmp_path / "status.json"
+    shutil.copy("status_classification.json", status_path)
+    return TemplateEngine(str(template_path), str(status_path)), template_path
+
+
+def test_fills_candidate_and_company(tmp_path):
+    engine, _ = make_engine(tmp_path, {"ご案内": "●●様\n■■の件でご連絡します。"})
+    filled = engine.fill_template("ご案内", CONTEXT, {JOB_ID: "J-1"})
+    assert "田中太郎様" in filled.body
+    assert engine.fill_template("存在しない", CONTEXT) is None
+
+
+def test_snapshot_keeps_the_version_it_was_taken_from(tmp_path):
+    engine, template_path = make_engine(tmp_path, {"ご案内": "●●様\n旧版の本文"})
+    snapshot = engine.snapshot
+    template_path.write_text(json.dumps({"別テンプレート": "新版"}, ensure_ascii=False), encoding="utf-8")
+    assert engine.reload(force=True)
+    assert engine.fill_template("ご案内", CONTEXT) is None
+    assert "旧版の本文" in engine.fill_template("ご案内", CONTEXT, snapshot=snapshot).body